@@ -0,0 +1,70 @@
+import os
+import uuid
+import shutil
+from datetime import datetime
+from fastapi import APIRouter, Depends, File, Form, Header, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+from starlette.background import BackgroundTask
+from typing import Optional
+
+from config.settings import ADMIN_API_TOKEN, SNAPSHOT_DIR
+from services.snapshot import SnapshotService
+from services.storage import BlobStore, StorageGarbageCollector
+from services.vector_store import VectorStoreService
+
+def require_admin_token(x_admin_token: Optional[str] = Header(None)):
+    """Reject admin requests without the configured X-Admin-Token."""
+    if ADMIN_API_TOKEN and x_admin_token != ADMIN_API_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin_token)])
+vector_store_service = VectorStoreService()
+snapshot_service = SnapshotService(vector_store_service.indexes)
+storage_gc = StorageGarbageCollector(vector_store_service.indexes, BlobStore())
+
+@router.post("/snapshot/export")
+async def export_snapshot(float16: bool = False):
+    """Export a snapshot of the knowledge base and return it as a Parquet file."""
+    # A unique file per export, deleted once it has been sent
+    path = SNAPSHOT_DIR / f"export-{uuid.uuid4()}.parquet"
+    try:
+        stats = await run_in_threadpool(
+            snapshot_service.export_snapshot, path, "float16" if float16 else "float32"
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return FileResponse(
+        path,
+        media_type="application/vnd.apache.parquet",
+        filename=f"snapshot-{datetime.now().strftime('%Y%m%d%H%M%S')}.parquet",
+        headers={
+            "X-Snapshot-Chunks": str(stats["chunks"]),
+            "X-Snapshot-Documents": str(stats["documents"])
+        },
+        background=BackgroundTask(os.unlink, path)
+    )
+
+@router.post("/snapshot/import")
+async def import_snapshot(
+    file: UploadFile = File(...),
+    merge: bool = Form(False)
+):
+    """Bulk-load an uploaded snapshot into this instance without re-embedding."""
+    path = SNAPSHOT_DIR / f"import-{uuid.uuid4()}.parquet"
+    try:
+        with open(path, "wb") as f:
+            shutil.copyfileobj(file.file, f)
+        return await run_in_threadpool(snapshot_service.import_snapshot, path, merge)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error importing snapshot: {str(e)}")
+    finally:
+        path.unlink(missing_ok=True)
+
+@router.post("/storage/gc")
+async def collect_storage_garbage(dry_run: bool = False):
+    """Remove uploaded files and chunks no document references, and report the space reclaimed."""
+    return await run_in_threadpool(storage_gc.collect, dry_run)
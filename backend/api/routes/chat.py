@@ -1,14 +1,49 @@
-from fastapi import APIRouter, HTTPException
-from models.schemas import ChatMessage, ChatResponse
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import iterate_in_threadpool, run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from models.schemas import ChatBatchRequest, ChatBatchResponse, ChatBatchResult, ChatMessage, ChatResponse
 from services.chat import ChatService
+from services.deadline import Deadline, DeadlineExceededError, RequestCancelledError
+from services.llm_control import LLMOverloadedError
+from config.settings import BATCH_MAX_QUERIES, CHAT_REQUEST_TIMEOUT
+import asyncio
+import orjson
 import traceback
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 chat_service = ChatService()
 
+# Seconds between checks for a disconnected client
+DISCONNECT_POLL_INTERVAL = 0.25
+
+async def run_until_disconnected(request: Request, deadline: Deadline, func, *args):
+    """Run a blocking service call in the threadpool, cancelling its deadline if the client disconnects."""
+    task = asyncio.ensure_future(run_in_threadpool(func, *args))
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+        if done:
+            return task.result()
+        if not deadline.cancelled and await request.is_disconnected():
+            print("Client disconnected; cancelling request")
+            deadline.cancel()
+
+async def cancel_on_disconnect(request: Request, deadline: Deadline):
+    """Cancel a deadline once the client disconnects; runs until the deadline is cancelled."""
+    while not deadline.cancelled:
+        if await request.is_disconnected():
+            print("Client disconnected; cancelling request")
+            deadline.cancel()
+            return
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
 @router.post("", response_model=ChatResponse)
-async def chat(message: ChatMessage):
-    """Process a chat message and return a response."""
+async def chat(message: ChatMessage, request: Request):
+    """Process a chat message and return a response.
+
+    The request is bounded by CHAT_REQUEST_TIMEOUT, and its retrieval and
+    generation stop as soon as the client disconnects.
+    """
     try:
         # Validate input
         if not message.message.strip():
@@ -17,8 +52,9 @@ async def chat(message: ChatMessage):
                 detail="Message content cannot be empty"
             )
 
-        # Get response from chat service
-        response = chat_service.get_response(message.message)
+        # Get response from chat service; it blocks on retrieval and the LLM, so keep it off the event loop
+        deadline = Deadline(CHAT_REQUEST_TIMEOUT)
+        response = await run_until_disconnected(request, deadline, chat_service.get_response, message.message, deadline)
         
         # Validate response
         if not response or "response" not in response:
@@ -35,6 +71,18 @@ async def chat(message: ChatMessage):
     except HTTPException as he:
         # Re-raise HTTP exceptions
         raise he
+    except LLMOverloadedError as e:
+        # Backpressure: tell the client when to retry instead of queueing without bound
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except DeadlineExceededError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except RequestCancelledError as e:
+        # Nobody is listening; 499 is the conventional "client closed request" status
+        raise HTTPException(status_code=499, detail=str(e))
     except Exception as e:
         print(f"Error in chat endpoint: {str(e)}")
         print("Traceback:")
@@ -44,4 +92,57 @@ async def chat(message: ChatMessage):
         raise HTTPException(
             status_code=500,
             detail=f"An error occurred while processing your request: {str(e)}"
-        ) 
\ No newline at end of file
+        )
+
+@router.post("/batch", response_model=ChatBatchResponse)
+async def chat_batch(batch: ChatBatchRequest, request: Request):
+    """Answer many messages with one batched retrieval pass.
+
+    Returns all results in request order, or with stream=true, one NDJSON
+    line per result as soon as it is ready (each line carries its index).
+    Each message is bounded by CHAT_REQUEST_TIMEOUT once it starts, and the
+    remaining work stops as soon as the client disconnects.
+    """
+    if not batch.messages:
+        raise HTTPException(status_code=400, detail="No messages given")
+    if len(batch.messages) > BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUERIES} messages per batch")
+    if any(not message.strip() for message in batch.messages):
+        raise HTTPException(status_code=400, detail="Message content cannot be empty")
+
+    def to_result(index, result) -> ChatBatchResult:
+        return ChatBatchResult(
+            index=index,
+            response=result.get("response"),
+            sources=result.get("sources", []),
+            error=result.get("error"),
+            retry_after=result.get("retry_after")
+        )
+
+    # Each message gets CHAT_REQUEST_TIMEOUT once it starts; this deadline cancels them all
+    deadline = Deadline()
+
+    if batch.stream:
+        # Remaining work is cancelled when the client disconnects or the response stops being consumed
+        async def lines():
+            watcher = asyncio.ensure_future(cancel_on_disconnect(request, deadline))
+            try:
+                async for index, result in iterate_in_threadpool(chat_service.get_responses(batch.messages, deadline=deadline)):
+                    yield orjson.dumps(jsonable_encoder(to_result(index, result))) + b"\n"
+            finally:
+                deadline.cancel()
+                watcher.cancel()
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    def collect():
+        results = [None] * len(batch.messages)
+        for index, result in chat_service.get_responses(batch.messages, deadline=deadline):
+            results[index] = to_result(index, result)
+        return results
+
+    return ChatBatchResponse(results=await run_until_disconnected(request, deadline, collect))
+
+@router.get("/metrics")
+async def chat_metrics():
+    """Return LLM queue depth, coalesced requests and embedding scheduler counters."""
+    return chat_service.metrics()
@@ -1,58 +1,72 @@
 import uuid
-import shutil
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, Header, HTTPException, Response
+from fastapi.encoders import jsonable_encoder
 from typing import List, Optional
 from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
+import orjson
+
+from config.database import get_kb_version
 
 from models.schemas import DocumentInfo, URLSubmission, DocumentResponse
 from services.document import DocumentService
+from services.storage import BlobStore, track_ingestion
 from services.vector_store import VectorStoreService
-from config.settings import UPLOAD_DIR
 
 router = APIRouter(prefix="/documents", tags=["documents"])
 vector_store_service = VectorStoreService()
+blob_store = BlobStore()
 @router.post("/upload/file", response_model=DocumentInfo)
 async def upload_file(
+    response: Response,
     file: UploadFile = File(...),
     title: Optional[str] = Form(None)
 ):
-    """Upload and process a document file."""
-    doc_id = str(uuid.uuid4())
+    """Upload and process a document file.
+    
+    Files are stored once per content hash. Uploading a file that is already
+    in the knowledge base returns the existing document (with an
+    X-Duplicate-Of header) instead of parsing and embedding it again.
+    """
+    # Save file to disk, hashing it on the way
+    content_hash, blob_path, created = blob_store.save(file.file, file.filename)
+    source_type = DocumentService._infer_source_type(file.filename)
     
-    # Create directory for document
-    doc_dir = UPLOAD_DIR / doc_id
-    doc_dir.mkdir(exist_ok=True)
+    existing = DocumentService.find_document_by_content(content_hash, source_type)
+    if existing and vector_store_service.has_document(existing.id):
+        print(f"Duplicate upload of {file.filename}; reusing document {existing.id}")
+        response.headers["X-Duplicate-Of"] = existing.id
+        return existing
     
+    doc_id = str(uuid.uuid4())
     try:
-        # Save file to disk
-        file_path = doc_dir / file.filename
-        with open(file_path, "wb") as f:
-            shutil.copyfileobj(file.file, f)
-        
         # Create metadata - only use custom title if provided
         metadata = DocumentInfo(
             id=doc_id,
             title=title,  
-            source_type=DocumentService._infer_source_type(file.filename),
+            source_type=source_type,
             source_path=file.filename,  
-            created_at=datetime.now().isoformat()
+            created_at=datetime.now().isoformat(),
+            content_hash=content_hash
         )
         
-        # Process document with metadata
-        loader = DocumentService.get_loader_for_file(str(file_path), metadata)
-        documents = loader.load()
-        
-        # Add to vector store
-        vector_store_service.add_documents(documents)
-        
-        # Store metadata in DB after successful vector store addition
-        DocumentService.store_document_metadata(metadata)
+        with track_ingestion(doc_id):
+            # Process document with metadata
+            loader = DocumentService.get_loader_for_file(str(blob_path), metadata)
+            documents = loader.load()
+            
+            # Add to vector store
+            vector_store_service.add_documents(documents)
+            
+            # Store metadata in DB after successful vector store addition
+            DocumentService.store_document_metadata(metadata, storage_path=blob_store.relative_path(blob_path))
         
         return metadata
         
     except Exception as e:
-        # Clean up on failure
-        shutil.rmtree(doc_dir)
+        # Clean up on failure; a blob that existed before belongs to another document
+        if created:
+            blob_path.unlink(missing_ok=True)
         raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
 
 @router.post("/upload/url", response_model=DocumentInfo)
@@ -74,14 +88,15 @@ async def upload_url(submission: URLSubmission):
         )
         
         try:
-            # Process URL with metadata
-            documents = DocumentService.process_url(submission.url, metadata)
-            
-            # Add to vector store
-            vector_store_service.add_documents(documents)
-            
-            # Store metadata in DB after successful vector store addition
-            DocumentService.store_document_metadata(metadata)
+            with track_ingestion(doc_id):
+                # Process URL with metadata
+                documents = DocumentService.process_url(submission.url, metadata)
+                
+                # Add to vector store
+                vector_store_service.add_documents(documents)
+                
+                # Store metadata in DB after successful vector store addition
+                DocumentService.store_document_metadata(metadata)
             
             return metadata
             
@@ -91,10 +106,47 @@ async def upload_url(submission: URLSubmission):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing URL: {str(e)}")
 
+# Serialized document listing for the knowledge-base version it was built at
+_listing_cache = {}
+
+def _not_modified(version: str, updated_at: float, if_none_match: Optional[str], if_modified_since: Optional[str]) -> bool:
+    """Evaluate conditional request headers; If-None-Match takes precedence."""
+    if if_none_match is not None:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return f'"{version}"' in tags or "*" in tags
+    if if_modified_since is not None:
+        try:
+            # HTTP dates have one-second resolution
+            return int(updated_at) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
 @router.get("", response_model=List[DocumentInfo])
-async def list_documents():
-    """List all documents in the knowledge base."""
-    return DocumentService.get_document_metadata()
+async def list_documents(
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None)
+):
+    """List all documents in the knowledge base.
+    
+    The listing carries an ETag and Last-Modified derived from the
+    knowledge-base version, so polling clients get 304 Not Modified until a
+    document is added or deleted. The serialized listing is cached per version.
+    """
+    version, updated_at = get_kb_version()
+    headers = {
+        "ETag": f'W/"{version}"',
+        "Last-Modified": formatdate(updated_at, usegmt=True),
+        "Cache-Control": "no-cache"
+    }
+    
+    if _not_modified(version, updated_at, if_none_match, if_modified_since):
+        return Response(status_code=304, headers=headers)
+    
+    if _listing_cache.get("version") != version:
+        documents = DocumentService.get_document_metadata()
+        _listing_cache.update(version=version, body=orjson.dumps(jsonable_encoder(documents)))
+    return Response(content=_listing_cache["body"], media_type="application/json", headers=headers)
 
 @router.delete("/{doc_id}", response_model=DocumentResponse)
 async def delete_document(doc_id: str):
@@ -105,4 +157,4 @@ async def delete_document(doc_id: str):
             message=f"Document {doc_id} deleted"
         )
     else:
-        raise HTTPException(status_code=404, detail="Document not found") 
\ No newline at end of file
+        raise HTTPException(status_code=404, detail="Document not found") 
@@ -0,0 +1,62 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+import orjson
+
+from config.settings import BATCH_MAX_QUERIES, VECTOR_SEARCH_TOP_K
+from models.schemas import RetrieveBatchRequest, RetrieveBatchResponse, RetrieveBatchResult, RetrievedChunk
+from services.vector_store import VectorStoreService
+
+router = APIRouter(prefix="/retrieve", tags=["retrieve"])
+vector_store_service = VectorStoreService()
+
+# Queries embedded and searched per step when streaming
+STREAM_STEP = 64
+
+@router.post("/batch", response_model=RetrieveBatchResponse)
+async def retrieve_batch(request: RetrieveBatchRequest):
+    """Retrieve chunks for many queries without calling the LLM.
+
+    Returns all results in request order, or with stream=true, NDJSON lines
+    in request order, searched STREAM_STEP queries at a time.
+    """
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="No queries given")
+    if len(request.queries) > BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUERIES} queries per batch")
+    k = request.k or VECTOR_SEARCH_TOP_K
+
+    def search(start: int, queries):
+        all_docs_and_scores = vector_store_service.similarity_search_with_score_batch(queries, k, request.where)
+        return [
+            RetrieveBatchResult(
+                index=start + i,
+                chunks=[
+                    RetrievedChunk(text=doc.page_content, metadata=doc.metadata, score=score)
+                    for doc, score in docs_and_scores
+                ]
+            )
+            for i, docs_and_scores in enumerate(all_docs_and_scores)
+        ]
+
+    if request.stream:
+        # Search the first step before streaming, so a bad filter is still a 400
+        try:
+            first = await run_in_threadpool(search, 0, request.queries[:STREAM_STEP])
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        def lines():
+            for result in first:
+                yield orjson.dumps(jsonable_encoder(result)) + b"\n"
+            for start in range(STREAM_STEP, len(request.queries), STREAM_STEP):
+                for result in search(start, request.queries[start:start + STREAM_STEP]):
+                    yield orjson.dumps(jsonable_encoder(result)) + b"\n"
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    try:
+        results = await run_in_threadpool(search, 0, request.queries)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return RetrieveBatchResponse(results=results)
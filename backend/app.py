@@ -2,9 +2,12 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
-from config.settings import CORS_ORIGINS
+from api.middleware import CompressionMiddleware
+from config.settings import CORS_ORIGINS, SERVER_ROLE
 from config.database import init_db
-from api.routes import chat, documents
+
+if SERVER_ROLE not in ("all", "writer", "query"):
+    raise ValueError(f"Unknown SERVER_ROLE: {SERVER_ROLE}")
 
 # Initialize FastAPI app
 app = FastAPI(title="RAG Chatbot API")
@@ -18,13 +21,29 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress JSON responses (chat sources, listings) above COMPRESSION_MIN_SIZE
+app.add_middleware(CompressionMiddleware)
+
 # Initialize database
 init_db()
 
-# Include routers
-app.include_router(chat.router)
-app.include_router(documents.router)
+# Include routers for this process's role. Route modules create their services
+# on import, so only import what the role serves.
+if SERVER_ROLE in ("all", "query"):
+    from api.routes import chat, retrieve
+    app.include_router(chat.router)
+    app.include_router(retrieve.router)
+
+if SERVER_ROLE in ("all", "writer"):
+    from api.routes import admin, documents
+    app.include_router(documents.router)
+    app.include_router(admin.router)
+
+@app.get("/health")
+async def health():
+    """Liveness check reporting this process's role."""
+    return {"status": "ok", "role": SERVER_ROLE}
 
 # For running the app
 if __name__ == "__main__":
-    uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True)
+    uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=SERVER_ROLE == "all")
@@ -0,0 +1,78 @@
+"""
+Compare per-query retrieval (what N calls to /chat do) with batch retrieval.
+
+Builds a temporary index of synthetic chunks embedded with the configured
+model, then retrieves the same queries one at a time and through
+VectorStoreService.similarity_search_with_score_batch, checking that both
+return the same chunks and reporting queries per second.
+
+Run from the backend directory:
+    python -m benchmarks.batch_retrieval_bench --chunks 5000 --queries 1000
+"""
+
+import argparse
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from services.vector_index import ChromaVectorIndex, MmapVectorIndex
+from services.vector_store import VectorStoreService
+
+WORDS = "router switch vlan bgp ospf latency packet firewall subnet gateway interface outage dns mtu".split()
+
+
+def make_text(words: int, rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument("--backend", choices=["mmap", "chroma"], default="chroma")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    workdir = Path(tempfile.mkdtemp(prefix="batch_retrieval_bench_"))
+    try:
+        service = VectorStoreService()
+        if args.backend == "mmap":
+            service.index = MmapVectorIndex(workdir / "mmap")
+        else:
+            import chromadb
+            service.index = ChromaVectorIndex(chromadb.PersistentClient(path=str(workdir / "chroma")), "bench")
+
+        texts = [make_text(150, rng) for _ in range(args.chunks)]
+        service.index.add(
+            ids=[f"chunk{i}" for i in range(args.chunks)],
+            embeddings=service.embedding_model.embed_documents(texts),
+            texts=texts,
+            metadatas=[{"doc_id": f"doc{i // 20}", "split_id": f"chunk{i}"} for i in range(args.chunks)]
+        )
+        queries = [make_text(10, rng) for _ in range(args.queries)]
+
+        started = time.perf_counter()
+        single = [service.similarity_search_with_score(query, k=args.k) for query in queries]
+        single_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        batched = service.similarity_search_with_score_batch(queries, k=args.k)
+        batch_seconds = time.perf_counter() - started
+
+        mismatches = sum(
+            [doc.metadata["split_id"] for doc, _ in a] != [doc.metadata["split_id"] for doc, _ in b]
+            for a, b in zip(single, batched)
+        )
+        print(f"{'mode':<10} {'seconds':>8} {'queries/s':>10}")
+        print(f"{'per-query':<10} {single_seconds:>8.2f} {args.queries / single_seconds:>10.0f}")
+        print(f"{'batch':<10} {batch_seconds:>8.2f} {args.queries / batch_seconds:>10.0f}")
+        print(f"Speedup: {single_seconds / batch_seconds:.1f}x; result mismatches: {mismatches}/{args.queries}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Compare the token-aware chunker with the previous character splitter.
+
+Builds a synthetic knowledge base of Markdown runbooks (headings and
+paragraphs), multi-page "PDF" documents and a CSV inventory. Each carries
+facts a question can target. For each splitter it reports:
+- chunk count and token sizes (chunks over the embedding model's 256-token
+  window are silently truncated when embedded)
+- split throughput
+- retrieval quality: hit@k, the share of questions whose answer appears in
+  one of the top-k chunks, using the configured embedding model
+
+Run from the backend directory:
+    python -m benchmarks.chunking_bench --docs 40 --rows 2000 --workers 4
+"""
+
+import argparse
+import random
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+from langchain.docstore.document import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_huggingface import HuggingFaceEmbeddings
+
+from config.settings import EMBEDDING_MODEL_NAME
+from services.chunking import TokenChunker, count_tokens
+
+MODEL_WINDOW = 254  # 256 word pieces minus [CLS] and [SEP]
+
+FILLER = (
+    "the change window is announced to the on-call team in advance and every step is "
+    "logged in the ticket so that the rollback can be executed quickly if monitoring "
+    "shows packet loss latency spikes or routing instability after the maintenance"
+).split()
+
+
+def filler(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(FILLER) for _ in range(words)).capitalize() + "."
+
+
+def make_corpus(docs: int, rows: int, rng: random.Random) -> Tuple[List[Document], List[Tuple[str, str]]]:
+    """Return loaded-style documents and (question, answer text) pairs."""
+    documents, questions = [], []
+    for d in range(docs):
+        doc_id = f"runbook-{d}"
+        sections = []
+        for s in range(rng.randint(3, 6)):
+            site = f"site{d}x{s}"
+            vlan = rng.randint(100, 4000)
+            fact = f"The backup link for {site} is carried on VLAN {vlan}."
+            paragraphs = [filler(rng, rng.randint(40, 120)) for _ in range(rng.randint(2, 5))]
+            paragraphs.insert(rng.randrange(len(paragraphs) + 1), fact)
+            sections.append(f"## Failover procedure for {site}\n\n" + "\n\n".join(paragraphs))
+            questions.append((f"Which VLAN carries the backup link for {site}?", f"VLAN {vlan}"))
+        documents.append(Document(
+            page_content=f"# Runbook {d}\n\n" + "\n\n".join(sections),
+            metadata={"doc_id": doc_id, "source_type": "text"}
+        ))
+
+        # The same facts style in a paginated document
+        for page in range(3):
+            router = f"core{d}r{page}"
+            asn = rng.randint(64512, 65534)
+            text = "\n".join(filler(rng, 30) for _ in range(rng.randint(8, 20)))
+            text += f"\nRouter {router} peers with upstream AS {asn}.\n"
+            text += "\n".join(filler(rng, 30) for _ in range(rng.randint(4, 10)))
+            documents.append(Document(
+                page_content=text,
+                metadata={"doc_id": f"design-{d}", "source_type": "pdf", "page": page}
+            ))
+            questions.append((f"Which upstream AS does router {router} peer with?", f"AS {asn}"))
+
+    for row in range(rows):
+        serial = f"SN{rng.randint(10**7, 10**8 - 1)}"
+        hostname = f"edge-{row}"
+        documents.append(Document(
+            page_content=(
+                f"hostname: {hostname}\nmodel: EX{rng.choice([2300, 3400, 4400])}\n"
+                f"serial: {serial}\nrack: R{rng.randint(1, 40)}\nnotes: {filler(rng, rng.randint(5, 25))}"
+            ),
+            metadata={"doc_id": "inventory", "source_type": "csv", "row": row}
+        ))
+        if row % 10 == 0:
+            questions.append((f"What is the serial number of switch {hostname}?", serial))
+    return documents, questions
+
+
+def chunk_stats(chunks: List[Document]) -> Dict[str, float]:
+    tokens = np.array([count_tokens(c.page_content) for c in chunks])
+    return {
+        "chunks": len(chunks),
+        "mean_tokens": tokens.mean(),
+        "max_tokens": tokens.max(),
+        "truncated": float((tokens > MODEL_WINDOW).mean())
+    }
+
+
+def hit_at_k(chunks: List[Document], questions: List[Tuple[str, str]], model, k: int) -> float:
+    texts = [c.page_content for c in chunks]
+    chunk_vectors = np.asarray(model.embed_documents(texts), dtype=np.float32)
+    query_vectors = np.asarray(model.embed_documents([q for q, _ in questions]), dtype=np.float32)
+    chunk_vectors /= np.linalg.norm(chunk_vectors, axis=1, keepdims=True)
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+
+    hits = 0
+    for (_, answer), scores in zip(questions, query_vectors @ chunk_vectors.T):
+        top = np.argpartition(-scores, k)[:k]
+        hits += any(answer in texts[i] for i in top)
+    return hits / len(questions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=40, help="Runbooks (and paginated documents)")
+    parser.add_argument("--rows", type=int, default=2000, help="CSV inventory rows")
+    parser.add_argument("--workers", type=int, default=4, help="Processes for the parallel token chunker")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--skip-quality", action="store_true", help="Don't embed (no retrieval quality)")
+    args = parser.parse_args()
+
+    documents, questions = make_corpus(args.docs, args.rows, random.Random(0))
+    total_chars = sum(len(d.page_content) for d in documents)
+    print(f"Corpus: {len(documents)} loaded documents, {total_chars / 1e6:.1f}M chars, {len(questions)} questions\n")
+
+    character = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    splitters = {
+        "character": character.split_documents,
+        "token": TokenChunker(workers=1).split_documents,
+        f"token x{args.workers}": TokenChunker(workers=args.workers).split_documents,
+    }
+
+    model = None if args.skip_quality else HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+    # Start the worker processes (spawn + tokenizer load) before timing
+    splitters[f"token x{args.workers}"](documents)
+
+    print(f"{'splitter':<10} {'chunks':>7} {'mean_tok':>8} {'max_tok':>7} {'truncated':>9} {'MB/s':>6} {f'hit@{args.k}':>6}")
+    for name, split in splitters.items():
+        started = time.perf_counter()
+        chunks = split(documents)
+        seconds = time.perf_counter() - started
+        stats = chunk_stats(chunks)
+        quality = hit_at_k(chunks, questions, model, args.k) if model else float("nan")
+        print(
+            f"{name:<10} {stats['chunks']:>7} {stats['mean_tokens']:>8.0f} {stats['max_tokens']:>7} "
+            f"{stats['truncated']:>9.1%} {total_chars / seconds / 1e6:>6.2f} {quality:>6.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Measure near-duplicate aliasing and MMR diversification.
+
+Uses the synthetic knowledge base from benchmarks/chunking_bench.py and
+injects copies of its runbooks and design documents:
+- mirrors: the same text behind a "Mirrored from ..." banner on the first page
+- revisions: a revision banner and a few reworded sentences
+- templates: the same runbook for other sites and VLANs (new facts, which
+  must stay searchable)
+Every document is chunked like ingestion does (child chunks) and run
+through DuplicateStore one document at a time. The benchmark reports:
+- index size with and without aliasing, and the embedding calls saved
+- how many templated facts are still in the aliased index (all of them
+  unless --ignore-numbers turns off NEAR_DUPLICATE_MATCH_NUMBERS)
+- fingerprinting throughput
+- retrieval over both indexes, with and without MMR: hit@k, and dup@k, the
+  mean number of top-k results that repeat a higher-ranked result's text
+  (same canonical chunk)
+
+Run from the backend directory:
+    python -m benchmarks.dedup_bench --docs 20 --rows 300 --k 3
+"""
+
+import argparse
+import random
+import re
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+from langchain.docstore.document import Document
+from langchain_huggingface import HuggingFaceEmbeddings
+
+from benchmarks.chunking_bench import FILLER, make_corpus
+from config.database import init_db
+from config.settings import (
+    CHILD_CHUNK_OVERLAP_TOKENS,
+    CHILD_CHUNK_TOKENS,
+    EMBEDDING_MODEL_NAME,
+    NEAR_DUPLICATE_THRESHOLD,
+    RETRIEVAL_MMR_FETCH_FACTOR,
+    RETRIEVAL_MMR_LAMBDA
+)
+from services.chunking import TokenChunker
+from services.dedup import DuplicateStore, maximal_marginal_relevance
+
+
+def reword(text: str, rng: random.Random, rate: float) -> str:
+    """Replace a share of the filler words, leaving facts and headings alone."""
+    lines = []
+    for line in text.split("\n"):
+        if line.startswith("#") or re.search(r"\d", line):
+            lines.append(line)
+            continue
+        lines.append(" ".join(
+            rng.choice(FILLER) if word in FILLER and rng.random() < rate else word
+            for word in line.split(" ")
+        ))
+    return "\n".join(lines)
+
+
+def inject_duplicates(documents: List[Document], questions, args, rng: random.Random):
+    """Return the documents with injected copies, and questions for the new templated facts."""
+    by_doc: Dict[str, List[Document]] = {}
+    for doc in documents:
+        if doc.metadata["doc_id"] != "inventory":
+            by_doc.setdefault(doc.metadata["doc_id"], []).append(doc)
+
+    copies, new_questions, kinds = [], [], {"mirror": 0, "revision": 0, "template": 0}
+    for doc_id, pages in by_doc.items():
+        draw = rng.random()
+        if draw < args.mirrors:
+            kind = "mirror"
+        elif draw < args.mirrors + args.revisions:
+            kind = "revision"
+        elif draw < args.mirrors + args.revisions + args.templates and doc_id.startswith("runbook"):
+            kind = "template"
+        else:
+            continue
+        kinds[kind] += 1
+        for page in pages:
+            text = page.page_content
+            if kind == "mirror":
+                if page.metadata.get("page", 0) == 0:
+                    text = f"Mirrored from https://wiki.example.net/{doc_id}\n\n{text}"
+            elif kind == "revision":
+                text = reword(text.replace("# Runbook", "# Runbook (revision 2)"), rng, args.reword_rate)
+            else:
+                def new_site(match):
+                    vlan = rng.randint(100, 4000)
+                    new_questions.append((f"Which VLAN carries the backup link for {match.group(1)}t?", f"VLAN {vlan}"))
+                    return f"The backup link for {match.group(1)}t is carried on VLAN {vlan}."
+                text = re.sub(r"The backup link for (\S+?) is carried on VLAN \d+\.", new_site, text)
+                text = re.sub(r"(site\d+x\d+)(?!t)", r"\1t", text)
+            copies.append(Document(page_content=text, metadata={**page.metadata, "doc_id": f"{kind}-{doc_id}"}))
+    return documents + copies, questions + new_questions, kinds
+
+
+def search(chunk_vectors, query_vectors, k: int, mmr: bool) -> List[List[int]]:
+    results = []
+    for scores in query_vectors @ chunk_vectors.T:
+        fetch_k = k * RETRIEVAL_MMR_FETCH_FACTOR if mmr else k
+        top = np.argsort(-scores)[:fetch_k]
+        if mmr:
+            picked = maximal_marginal_relevance(scores[top], chunk_vectors[top], k, RETRIEVAL_MMR_LAMBDA)
+            top = top[picked]
+        results.append(top.tolist())
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=20, help="Runbooks (and paginated documents)")
+    parser.add_argument("--rows", type=int, default=300, help="CSV inventory rows")
+    parser.add_argument("--mirrors", type=float, default=0.3, help="Share of documents mirrored")
+    parser.add_argument("--revisions", type=float, default=0.3, help="Share of documents revised")
+    parser.add_argument("--templates", type=float, default=0.2, help="Share of runbooks re-templated")
+    parser.add_argument("--reword-rate", type=float, default=0.01, help="Share of words reworded in revisions")
+    parser.add_argument("--threshold", type=float, default=NEAR_DUPLICATE_THRESHOLD)
+    parser.add_argument("--ignore-numbers", action="store_true", help="Alias chunks whose numbers differ")
+    parser.add_argument("--k", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    documents, questions = make_corpus(args.docs, args.rows, rng)
+    base_questions = len(questions)
+    documents, questions, kinds = inject_duplicates(documents, questions, args, rng)
+    chunker = TokenChunker(chunk_tokens=CHILD_CHUNK_TOKENS, overlap_tokens=CHILD_CHUNK_OVERLAP_TOKENS, workers=1)
+
+    # Ingest one document at a time, as uploads would
+    by_doc: Dict[str, List[Document]] = {}
+    for doc in documents:
+        by_doc.setdefault(doc.metadata["doc_id"], []).append(doc)
+    db_path = Path(tempfile.mkdtemp()) / "dedup_bench.db"
+    init_db(db_path)
+    store = DuplicateStore(db_path, threshold=args.threshold, match_numbers=not args.ignore_numbers)
+    chunks, canonical_of = [], {}
+    fingerprint_seconds = 0.0
+    for doc_id, pages in by_doc.items():
+        splits = chunker.split_documents(pages)
+        for i, split in enumerate(splits):
+            split.metadata["split_id"] = f"{doc_id}_{i}"
+        started = time.perf_counter()
+        signatures = store.hasher.signatures([split.page_content for split in splits])
+        canonical_ids = store.find_canonicals(splits, signatures)
+        store.add(splits, signatures, canonical_ids)
+        fingerprint_seconds += time.perf_counter() - started
+        for split, canonical_id in zip(splits, canonical_ids):
+            canonical_of[split.metadata["split_id"]] = canonical_id or split.metadata["split_id"]
+        chunks.extend(splits)
+
+    canonical = [c for c in chunks if canonical_of[c.metadata["split_id"]] == c.metadata["split_id"]]
+    print(
+        f"Corpus: {len(by_doc)} documents ({kinds['mirror']} mirrors, {kinds['revision']} revisions, "
+        f"{kinds['template']} templated copies), {len(chunks)} chunks, {len(questions)} questions\n"
+    )
+
+    model = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+    started = time.perf_counter()
+    vectors = np.asarray(model.embed_documents([c.page_content for c in chunks]), dtype=np.float32)
+    embed_seconds = time.perf_counter() - started
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    query_vectors = np.asarray(model.embed_documents([q for q, _ in questions]), dtype=np.float32)
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+
+    dim = vectors.shape[1]
+    saved = len(chunks) - len(canonical)
+    print(f"{'index':<10} {'vectors':>8} {'MB':>7}")
+    print(f"{'all':<10} {len(chunks):>8} {len(chunks) * dim * 4 / 2**20:>7.2f}")
+    print(f"{'aliased':<10} {len(canonical):>8} {len(canonical) * dim * 4 / 2**20:>7.2f}")
+    print(
+        f"\nIndex size -{saved / len(chunks):.1%} ({saved} chunks stored as aliases); "
+        f"embedding time saved ~{embed_seconds * saved / len(chunks):.1f}s of {embed_seconds:.1f}s. "
+        f"Fingerprinting: {fingerprint_seconds / len(chunks) * 1e6:.0f} us/chunk"
+    )
+    templated = questions[base_questions:]
+    kept = sum(any(answer in c.page_content for c in canonical) for _, answer in templated)
+    print(f"Templated facts still indexed: {kept}/{len(templated)}\n")
+
+    keep = np.array([canonical_of[c.metadata["split_id"]] == c.metadata["split_id"] for c in chunks])
+    indexes = {"all": np.arange(len(chunks)), "aliased": np.flatnonzero(keep)}
+    print(f"{'index':<10} {'mmr':<4} {f'hit@{args.k}':>6} {f'dup@{args.k}':>6}")
+    for name, rows in indexes.items():
+        for mmr in (False, True):
+            hits, dups = 0, 0
+            for (_, answer), top in zip(questions, search(vectors[rows], query_vectors, args.k, mmr)):
+                found = [chunks[rows[i]] for i in top]
+                hits += any(answer in c.page_content for c in found)
+                seen = set()
+                for c in found:
+                    key = canonical_of[c.metadata["split_id"]]
+                    dups += key in seen
+                    seen.add(key)
+            print(f"{name:<10} {'on' if mmr else 'off':<4} {hits / len(questions):>6.1%} {dups / len(questions):>6.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Measure query-embedding latency for chat while a large ingestion runs.
+
+Compares calling the embedding model directly from concurrent threads (the
+previous behaviour) with routing the same calls through EmbeddingScheduler.
+Chat clients embed queries in a loop while one thread embeds a large batch of
+ingestion chunks; the benchmark reports query p50/p99 latency with and
+without ingestion, plus ingestion throughput.
+
+Run from the backend directory:
+    python -m benchmarks.embedding_scheduler_bench --chunks 5000 --clients 8
+"""
+
+import argparse
+import random
+import threading
+import time
+from typing import Dict, List
+
+import numpy as np
+from langchain_huggingface import HuggingFaceEmbeddings
+
+from config.settings import EMBEDDING_MODEL_NAME
+from services.embedding_scheduler import EmbeddingScheduler
+
+WORDS = "router switch vlan bgp ospf latency packet firewall subnet gateway interface outage".split()
+
+
+def make_text(words: int, rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def run_scenario(
+    embeddings, chunks: List[str], clients: int, think: float, duration: float, ingest: bool
+) -> Dict[str, float]:
+    latencies: List[float] = []
+    latency_lock = threading.Lock()
+    stop = threading.Event()
+    ingest_result = {}
+
+    def chat_client(seed: int):
+        rng = random.Random(seed)
+        while not stop.is_set():
+            query = make_text(12, rng)
+            started = time.perf_counter()
+            embeddings.embed_query(query)
+            with latency_lock:
+                latencies.append(time.perf_counter() - started)
+            time.sleep(rng.expovariate(1 / think))
+
+    def ingestion():
+        started = time.perf_counter()
+        embeddings.embed_documents(chunks)
+        ingest_result["seconds"] = time.perf_counter() - started
+
+    threads = [threading.Thread(target=chat_client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+
+    if ingest:
+        ingest_thread = threading.Thread(target=ingestion)
+        ingest_thread.start()
+        ingest_thread.join()
+    else:
+        time.sleep(duration)
+
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    result = {
+        "queries": len(latencies),
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p99_ms": float(np.percentile(latencies, 99) * 1000),
+    }
+    if ingest:
+        result["ingest_per_s"] = len(chunks) / ingest_result["seconds"]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=5000, help="Ingestion chunks embedded during the run")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent chat clients")
+    parser.add_argument("--think-ms", type=float, default=200, help="Mean pause between a client's queries")
+    parser.add_argument("--idle-seconds", type=float, default=10, help="Length of the no-ingestion baseline")
+    args = parser.parse_args()
+
+    model = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+    rng = random.Random(0)
+    chunks = [make_text(180, rng) for _ in range(args.chunks)]
+    model.embed_documents(chunks[:32])  # Warm up
+
+    print(f"{'mode':<10} {'ingestion':<9} {'queries':>8} {'p50_ms':>8} {'p99_ms':>8} {'ingest/s':>9}")
+    for mode in ["direct", "scheduled"]:
+        embeddings = model if mode == "direct" else EmbeddingScheduler(model)
+        for ingest in [False, True]:
+            stats = run_scenario(embeddings, chunks, args.clients, args.think_ms / 1000, args.idle_seconds, ingest)
+            throughput = f"{stats['ingest_per_s']:>9.0f}" if ingest else f"{'-':>9}"
+            print(
+                f"{mode:<10} {'yes' if ingest else 'no':<9} {stats['queries']:>8} "
+                f"{stats['p50_ms']:>8.1f} {stats['p99_ms']:>8.1f} {throughput}"
+            )
+
+
+if __name__ == "__main__":
+    main()
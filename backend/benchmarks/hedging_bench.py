@@ -0,0 +1,85 @@
+"""
+Measure hedged LLM calls against a stub model with a slow tail.
+
+The stub streams tokens after a time-to-first-token that is usually short
+but occasionally very long (a stuck backend). The benchmark issues the same
+workload through LLMCaller with hedging off and on, and reports latency
+percentiles and how many extra calls the hedges cost.
+
+Run from the backend directory:
+    python -m benchmarks.hedging_bench --calls 400 --slow-fraction 0.05
+"""
+
+import argparse
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+
+import numpy as np
+
+from services.llm_control import LLMCaller
+
+
+class StubLLM:
+    """Minimal stand-in for a LangChain LLM's stream() with a heavy latency tail."""
+
+    def __init__(self, fast_ttft: float, slow_ttft: float, slow_fraction: float, tokens: int, token_interval: float):
+        self.fast_ttft = fast_ttft
+        self.slow_ttft = slow_ttft
+        self.slow_fraction = slow_fraction
+        self.tokens = tokens
+        self.token_interval = token_interval
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._rng = random.Random(0)
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        with self._lock:
+            self.calls += 1
+            slow = self._rng.random() < self.slow_fraction
+            jitter = self._rng.uniform(0.8, 1.2)
+        time.sleep((self.slow_ttft if slow else self.fast_ttft) * jitter)
+        for i in range(self.tokens):
+            yield f"token{i} "
+            time.sleep(self.token_interval)
+
+
+def run(llm: StubLLM, caller: LLMCaller, calls: int, concurrency: int):
+    def one(_):
+        started = time.perf_counter()
+        caller.generate(llm, "prompt")
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return np.array(list(executor.map(one, range(calls))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--fast-ttft", type=float, default=0.2)
+    parser.add_argument("--slow-ttft", type=float, default=3.0)
+    parser.add_argument("--slow-fraction", type=float, default=0.05)
+    parser.add_argument("--budget", type=float, default=0.1, help="Largest fraction of calls that may be hedged")
+    args = parser.parse_args()
+
+    print(f"{'hedging':<8} {'p50_s':>7} {'p95_s':>7} {'p99_s':>7} {'max_s':>7} {'llm_calls':>9} {'extra':>7}")
+    for hedge in [False, True]:
+        llm = StubLLM(args.fast_ttft, args.slow_ttft, args.slow_fraction, tokens=20, token_interval=0.005)
+        caller = LLMCaller(hedge_enabled=hedge, hedge_percentile=95, hedge_min_delay=0.05, hedge_budget=args.budget)
+        # Warm up the time-to-first-token samples the hedge delay is derived from
+        run(llm, caller, 50, args.concurrency)
+        llm.calls = 0
+        latencies = run(llm, caller, args.calls, args.concurrency)
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        print(
+            f"{'on' if hedge else 'off':<8} {p50:>7.2f} {p95:>7.2f} {p99:>7.2f} {latencies.max():>7.2f} "
+            f"{llm.calls:>9} {(llm.calls - args.calls) / args.calls:>7.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Measure bytes transferred and latency for repeated GET /documents polls.
+
+Polls a running API the way the frontend does, three ways:
+- plain: no compression, no conditional request (every poll gets the full listing)
+- compressed: Accept-Encoding gzip/br, no conditional request
+- conditional: compressed, plus If-None-Match with the last ETag (304 until the
+  knowledge base changes)
+
+and reports bytes on the wire per poll (body as transferred, plus headers)
+and request latency. With --seed N it first uploads N small text files so
+the listing has a realistic size, and deletes them again afterwards.
+
+Run from the backend directory against a running server:
+    python -m benchmarks.http_caching_bench --url http://localhost:8000 --polls 200 --seed 300
+"""
+
+import argparse
+import io
+import time
+
+import numpy as np
+import requests
+
+MODES = {
+    "plain": {"Accept-Encoding": "identity"},
+    "compressed": {"Accept-Encoding": "gzip, br"},
+    "conditional": {"Accept-Encoding": "gzip, br"},
+}
+
+
+def seed_documents(url: str, count: int):
+    doc_ids = []
+    for i in range(count):
+        text = f"Runbook {i}: restart the resolver on site {i % 17} and verify upstream reachability.\n"
+        response = requests.post(
+            f"{url}/documents/upload/file",
+            files={"file": (f"bench-runbook-{i}.txt", io.BytesIO(text.encode()))},
+            data={"title": f"Benchmark runbook {i} for the HTTP caching benchmark"}
+        )
+        response.raise_for_status()
+        doc_ids.append(response.json()["id"])
+    return doc_ids
+
+
+def poll(url: str, mode: str, polls: int):
+    session = requests.Session()
+    headers = dict(MODES[mode])
+    wire_bytes, latencies, not_modified = [], [], 0
+    for _ in range(polls):
+        started = time.perf_counter()
+        response = session.get(f"{url}/documents", headers=headers, stream=True)
+        body = response.raw.read(decode_content=False)
+        latencies.append(time.perf_counter() - started)
+
+        header_bytes = sum(len(k) + len(v) + 4 for k, v in response.headers.items())
+        wire_bytes.append(len(body) + header_bytes)
+        not_modified += response.status_code == 304
+        if mode == "conditional" and "ETag" in response.headers:
+            headers["If-None-Match"] = response.headers["ETag"]
+    return np.array(wire_bytes), np.array(latencies) * 1000, not_modified
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--polls", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0, help="Upload this many small documents first")
+    args = parser.parse_args()
+
+    doc_ids = seed_documents(args.url, args.seed) if args.seed else []
+    try:
+        listing = requests.get(f"{args.url}/documents").json()
+        print(f"Listing: {len(listing)} documents\n")
+        print(f"{'mode':<12} {'bytes/poll':>10} {'304s':>6} {'p50_ms':>7} {'p95_ms':>7} {'total_kb':>9}")
+        for mode in MODES:
+            wire_bytes, latencies, not_modified = poll(args.url, mode, args.polls)
+            p50, p95 = np.percentile(latencies, [50, 95])
+            print(
+                f"{mode:<12} {wire_bytes.mean():>10.0f} {not_modified:>6} {p50:>7.2f} {p95:>7.2f} "
+                f"{wire_bytes.sum() / 1024:>9.1f}"
+            )
+    finally:
+        for doc_id in doc_ids:
+            requests.delete(f"{args.url}/documents/{doc_id}")
+
+
+if __name__ == "__main__":
+    main()
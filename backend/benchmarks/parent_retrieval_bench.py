@@ -0,0 +1,127 @@
+"""
+Compare small-to-big (parent document) retrieval with single-size chunks.
+
+Uses the synthetic knowledge base from benchmarks/chunking_bench.py and
+indexes it two ways:
+- chunks: CHUNK_TOKENS-token chunks, the top VECTOR_SEARCH_TOP_K go into the prompt
+- small-to-big: CHILD_CHUNK_TOKENS-token children are embedded, the top
+  CHILD_SEARCH_TOP_K children are mapped to at most VECTOR_SEARCH_TOP_K
+  deduplicated PARENT_CHUNK_TOKENS-token parent sections
+
+and reports the vector index size (vectors plus stored chunk text), the
+parent docstore size, prompt context tokens per question (embedding-model
+tokens, a proxy for LLM tokens) and answer hit rate: the share of questions
+whose answer text appears in the prompt context.
+
+Run from the backend directory:
+    python -m benchmarks.parent_retrieval_bench --docs 40 --rows 2000
+"""
+
+import argparse
+import random
+from typing import Dict, List, Tuple
+
+import numpy as np
+from langchain.docstore.document import Document
+from langchain_huggingface import HuggingFaceEmbeddings
+
+from benchmarks.chunking_bench import make_corpus
+from config.settings import (
+    CHILD_CHUNK_OVERLAP_TOKENS,
+    CHILD_CHUNK_TOKENS,
+    CHILD_SEARCH_TOP_K,
+    CHUNK_OVERLAP_TOKENS,
+    CHUNK_TOKENS,
+    EMBEDDING_MODEL_NAME,
+    PARENT_CHUNK_TOKENS,
+    PARENT_CONTEXT_MAX_TOKENS,
+    VECTOR_SEARCH_TOP_K
+)
+from services.chunking import TokenChunker
+
+
+def embed(model, texts: List[str]) -> np.ndarray:
+    vectors = np.asarray(model.embed_documents(texts), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def top_k(query_vectors: np.ndarray, vectors: np.ndarray, k: int) -> np.ndarray:
+    scores = query_vectors @ vectors.T
+    top = np.argpartition(-scores, k, axis=1)[:, :k]
+    order = np.take_along_axis(scores, top, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(top, order, axis=1)
+
+
+def expand(children: List[Document], parents: Dict[str, Document], hits: np.ndarray) -> List[Document]:
+    """Same mapping as VectorStoreService.expand_to_parents."""
+    expanded, seen, total_tokens = [], set(), 0
+    for i in hits:
+        parent_id = children[i].metadata["parent_id"]
+        if parent_id in seen:
+            continue
+        seen.add(parent_id)
+        tokens = parents[parent_id].metadata["token_count"]
+        if expanded and total_tokens + tokens > PARENT_CONTEXT_MAX_TOKENS:
+            continue
+        expanded.append(parents[parent_id])
+        total_tokens += tokens
+        if len(expanded) >= VECTOR_SEARCH_TOP_K:
+            break
+    return expanded
+
+
+def report(name: str, vectors: int, dim: int, index_text: int, docstore: int,
+           contexts: List[List[Document]], questions: List[Tuple[str, str]]):
+    tokens = np.array([sum(d.metadata["token_count"] for d in context) for context in contexts])
+    hits = np.mean([any(answer in d.page_content for d in context) for context, (_, answer) in zip(contexts, questions)])
+    index_mb = (vectors * dim * 4 + index_text) / 2**20
+    print(
+        f"{name:<13} {vectors:>8} {index_mb:>9.1f} {docstore / 2**20:>9.1f} "
+        f"{tokens.mean():>10.0f} {np.percentile(tokens, 95):>8.0f} {hits:>7.1%}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=40, help="Runbooks (and paginated documents)")
+    parser.add_argument("--rows", type=int, default=2000, help="CSV inventory rows")
+    args = parser.parse_args()
+
+    documents, questions = make_corpus(args.docs, args.rows, random.Random(0))
+    print(f"Corpus: {len(documents)} loaded documents, {len(questions)} questions\n")
+    model = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+    query_vectors = embed(model, [q for q, _ in questions])
+
+    # Current setup: one chunk size for matching and for the prompt
+    chunks = TokenChunker(CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, workers=1).split_documents(documents)
+    chunk_vectors = embed(model, [c.page_content for c in chunks])
+    contexts = [[chunks[i] for i in hits] for hits in top_k(query_vectors, chunk_vectors, VECTOR_SEARCH_TOP_K)]
+
+    # Small-to-big, built the way VectorStoreService.add_documents does
+    parents = TokenChunker(PARENT_CHUNK_TOKENS, 0, workers=1).split_documents(documents)
+    for i, parent in enumerate(parents):
+        parent.metadata["split_id"] = f"p{i}"
+    children = TokenChunker(CHILD_CHUNK_TOKENS, CHILD_CHUNK_OVERLAP_TOKENS, workers=1).split_documents([
+        Document(page_content=p.page_content, metadata={
+            **{key: value for key, value in p.metadata.items() if key not in ("split_id", "token_count")},
+            "parent_id": p.metadata["split_id"]
+        })
+        for p in parents
+    ])
+    child_vectors = embed(model, [c.page_content for c in children])
+    by_id = {p.metadata["split_id"]: p for p in parents}
+    parent_contexts = [
+        expand(children, by_id, hits) for hits in top_k(query_vectors, child_vectors, CHILD_SEARCH_TOP_K)
+    ]
+
+    dim = chunk_vectors.shape[1]
+    print(f"{'setup':<13} {'vectors':>8} {'index_mb':>9} {'store_mb':>9} {'ctx_tokens':>10} {'p95_tok':>8} {'hit':>7}")
+    report("chunks", len(chunks), dim, sum(len(c.page_content.encode()) for c in chunks), 0, contexts, questions)
+    report(
+        "small-to-big", len(children), dim, sum(len(c.page_content.encode()) for c in children),
+        sum(len(p.page_content.encode()) for p in parents), parent_contexts, questions
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Compare memory and startup time of `uvicorn --workers N` and prefork.py.
+
+Starts the API each way for every worker count, waits until /health answers
+and memory settles, then reports startup time, summed RSS and summed PSS
+(proportional set size, which splits shared copy-on-write pages between the
+processes that map them) over the whole process tree. Linux only.
+
+Run from the backend directory (SERVER_ROLE and friends are passed through):
+    SERVER_ROLE=query python -m benchmarks.prefork_bench --workers 1 8
+"""
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import requests
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def descendants(root: int) -> List[int]:
+    children: Dict[int, List[int]] = {}
+    for entry in Path("/proc").iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / "stat").read_text()
+        except OSError:
+            continue
+        ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        children.setdefault(ppid, []).append(int(entry.name))
+
+    pids, stack = [], [root]
+    while stack:
+        pid = stack.pop()
+        pids.append(pid)
+        stack.extend(children.get(pid, []))
+    return pids
+
+
+def memory_kb(pid: int) -> Dict[str, int]:
+    values = {"Rss": 0, "Pss": 0}
+    try:
+        for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines():
+            key = line.split(":")[0]
+            if key in values:
+                values[key] = int(line.split()[1])
+    except OSError:
+        pass
+    return values
+
+
+def tree_memory_mb(root: int) -> Dict[str, float]:
+    totals = {"Rss": 0, "Pss": 0}
+    for pid in descendants(root):
+        for key, value in memory_kb(pid).items():
+            totals[key] += value
+    return {key: value / 1024 for key, value in totals.items()}
+
+
+def run(mode: str, workers: int, port: int, timeout: float) -> Dict[str, float]:
+    if mode == "uvicorn":
+        command = [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--workers", str(workers)]
+    else:
+        command = [sys.executable, "prefork.py", "--port", str(port), "--workers", str(workers)]
+
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        command, cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True
+    )
+    try:
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"{mode} exited with status {process.returncode}")
+            if time.perf_counter() - started > timeout:
+                raise TimeoutError(f"{mode} did not become healthy within {timeout}s")
+            try:
+                if requests.get(f"http://127.0.0.1:{port}/health", timeout=1).ok:
+                    break
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        healthy_seconds = time.perf_counter() - started
+
+        # Wait for the remaining workers to finish loading and memory to settle
+        previous = 0.0
+        while time.perf_counter() - started < timeout:
+            time.sleep(1.0)
+            current = tree_memory_mb(process.pid)["Rss"]
+            if previous and abs(current - previous) / previous < 0.01:
+                break
+            previous = current
+        memory = tree_memory_mb(process.pid)
+        return {"healthy_s": healthy_seconds, "settled_s": time.perf_counter() - started, **memory}
+    finally:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--modes", nargs="+", choices=["uvicorn", "prefork"], default=["uvicorn", "prefork"])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    print(f"{'mode':<8} {'workers':>7} {'healthy_s':>9} {'settled_s':>9} {'RSS_MB':>9} {'PSS_MB':>9}")
+    for workers in args.workers:
+        for mode in args.modes:
+            stats = run(mode, workers, args.port, args.timeout)
+            print(
+                f"{mode:<8} {workers:>7} {stats['healthy_s']:>9.1f} {stats['settled_s']:>9.1f} "
+                f"{stats['Rss']:>9.0f} {stats['Pss']:>9.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
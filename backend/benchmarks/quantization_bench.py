@@ -0,0 +1,75 @@
+"""
+Benchmark quantized first-pass search with exact rescoring.
+
+For each quantization mode of the memory-mapped index this reports the
+in-memory code size per million chunks, recall@k against brute-force search,
+the recall difference against the current Chroma setup, and p50 latency.
+
+Run from the backend directory:
+    python -m benchmarks.quantization_bench --size 100000 --rescore-factors 4 10
+"""
+
+import argparse
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.vector_index_bench import DIM, exact_neighbours, fill_index, make_corpus, make_queries, measure
+from services.quantization import get_quantizer
+from services.vector_index import ChromaVectorIndex, MmapVectorIndex
+
+MODES = ["none", "float16", "int8", "binary"]
+
+
+def bytes_per_million(mode: str, dim: int) -> int:
+    """Bytes kept hot for the first search pass per million chunks."""
+    quantizer = get_quantizer(mode, dim)
+    if quantizer is None:
+        return 4 * dim * 1_000_000
+    return quantizer.code_width * np.dtype(quantizer.code_dtype).itemsize * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--rescore-factors", type=int, nargs="+", default=[4, 10])
+    parser.add_argument("--skip-chroma", action="store_true")
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.size, DIM)
+    queries = make_queries(corpus, args.queries)
+    truth = exact_neighbours(corpus, queries, args.k)
+    workdir = Path(tempfile.mkdtemp(prefix="quantization_bench_"))
+
+    try:
+        baseline_recall = None
+        if not args.skip_chroma:
+            import chromadb
+            chroma = ChromaVectorIndex(chromadb.PersistentClient(path=str(workdir / "chroma")), "bench")
+            fill_index(chroma, corpus)
+            baseline_recall = measure(chroma, queries, truth, args.k)["recall"]
+            print(f"chroma (float32 HNSW): recall@{args.k} = {baseline_recall:.3f}\n")
+
+        print(f"{'mode':<8} {'rescore':>7} {'MB/1M chunks':>13} {'recall@' + str(args.k):>10} {'vs chroma':>10} {'p50_ms':>8}")
+        for mode in MODES:
+            index = MmapVectorIndex(workdir / mode, quantization=mode, ivf_min_vectors=args.size + 1)
+            fill_index(index, corpus)
+            factors = [1] if mode == "none" else args.rescore_factors
+            for factor in factors:
+                index.rescore_factor = factor
+                stats = measure(index, queries, truth, args.k)
+                delta = f"{stats['recall'] - baseline_recall:+.3f}" if baseline_recall is not None else "n/a"
+                print(
+                    f"{mode:<8} {factor:>7} {bytes_per_million(mode, DIM) / 2**20:>13.1f} "
+                    f"{stats['recall']:>10.3f} {delta:>10} {stats['p50_ms']:>8.2f}"
+                )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Measure recall and added latency of multi-query / HyDE retrieval.
+
+Uses the synthetic knowledge base from benchmarks/chunking_bench.py, plus
+multi-part questions that join two of its questions. Retrieval runs through
+QueryExpander for each mode ("off", "multi_query", "hyde") with an
+in-process stub LLM in place of the fast model. The stub answers after a
+log-normal delay around --llm-ms and writes what a capable model would:
+one rewrite per sub-question (multi_query), or a passage in the documents'
+own phrasing with guessed values (hyde). Its rewrites are idealised, so the
+recall gain is an upper bound. The latency numbers are what the mode adds
+for a model of that speed.
+
+For each mode it reports recall@k (the share of expected answers found in
+the top-k chunks) for single and multi-part questions, retrieval latency
+percentiles, the latency added over "off", and how often expansion fell back
+to the plain question because the stub missed the --budget-ms budget.
+
+Run from the backend directory:
+    python -m benchmarks.query_expansion_bench --docs 20 --rows 500 --llm-ms 300 --budget-ms 800
+"""
+
+import argparse
+import random
+import re
+import time
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+from langchain.docstore.document import Document
+from langchain_core.language_models.llms import LLM
+from langchain_huggingface import HuggingFaceEmbeddings
+
+from benchmarks.chunking_bench import make_corpus
+from config.settings import EMBEDDING_MODEL_NAME
+from services.chunking import TokenChunker
+from services.llm_control import LLMCaller, LLMLimiter
+from services.query_expansion import EXPANSION_MODES, QueryExpander
+
+# The corpus' question templates, and how its documents state each answer
+HYPOTHETICAL_ANSWERS = [
+    (re.compile(r"Which VLAN carries the backup link for (\S+?)\?"), "The backup link for {} is carried on VLAN 100."),
+    (re.compile(r"Which upstream AS does router (\S+) peer with\?"), "Router {} peers with upstream AS 65000."),
+    (re.compile(r"What is the serial number of switch (\S+?)\?"), "hostname: {}\nserial: SN10000000"),
+]
+
+# Dropped from questions for the keyword-style rewrite
+QUESTION_WORDS = {"which", "what", "is", "the", "does", "do", "with", "of", "for", "and"}
+
+
+class StubRewriteLLM(LLM):
+    """Stands in for the fast model: a log-normal delay, then idealised rewrites."""
+
+    latency_ms: float = 300
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub-rewrite"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        time.sleep(self.latency_ms / 1000 * random.lognormvariate(0, 0.35))
+        question = prompt.split("Question:", 1)[1].split("Passage:", 1)[0].strip()
+        parts = [part.strip() + "?" for part in question.split("?") if part.strip()]
+        if "Passage:" in prompt:
+            passages = []
+            for part in parts:
+                for pattern, template in HYPOTHETICAL_ANSWERS:
+                    match = pattern.search(part)
+                    if match:
+                        passages.append(template.format(match.group(1)))
+            return " ".join(passages)
+        rewrites = []
+        for part in parts:
+            part = part.removeprefix("And ")
+            rewrites.append(part)
+            rewrites.append(" ".join(w for w in part.rstrip("?").split() if w.lower() not in QUESTION_WORDS))
+        return "\n".join(f"{i + 1}. {rewrite}" for i, rewrite in enumerate(rewrites))
+
+
+class InMemoryStore:
+    """The two VectorStoreService search methods QueryExpander uses, over numpy."""
+
+    def __init__(self, chunks: List[Document], model):
+        self.chunks = chunks
+        self.model = model
+        self.vectors = self._embed([c.page_content for c in chunks])
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.asarray(self.model.embed_documents(texts), dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    def similarity_search_with_score(self, query: str, k: int) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_queries([query], k)[0]
+
+    def similarity_search_with_score_queries(self, queries: List[str], k: int) -> List[List[Tuple[Document, float]]]:
+        results = []
+        for scores in self._embed(queries) @ self.vectors.T:
+            top = np.argsort(-scores)[:k]
+            results.append([(self.chunks[i], float(scores[i])) for i in top])
+        return results
+
+
+def make_questions(questions: List[Tuple[str, str]], multi: int, rng: random.Random):
+    """Single questions plus multi-part questions joining two of them."""
+    single = [(q, [a]) for q, a in questions]
+    combined = []
+    for _ in range(multi):
+        (q1, a1), (q2, a2) = rng.sample(questions, 2)
+        combined.append((f"{q1} And {q2[0].lower()}{q2[1:]}", [a1, a2]))
+    return single, combined
+
+
+def run_mode(expander: QueryExpander, questions, k: int):
+    found, latencies = [], []
+    for question, answers in questions:
+        started = time.perf_counter()
+        results = expander.search(question, k)
+        latencies.append(time.perf_counter() - started)
+        found.extend(any(answer in doc.page_content for doc, _ in results) for answer in answers)
+    return float(np.mean(found)), np.array(latencies) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=20, help="Runbooks (and paginated documents)")
+    parser.add_argument("--rows", type=int, default=500, help="CSV inventory rows")
+    parser.add_argument("--multi", type=int, default=100, help="Multi-part questions")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--llm-ms", type=float, default=300, help="Median stub LLM latency")
+    parser.add_argument("--budget-ms", type=float, default=800, help="Query expansion budget")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    documents, questions = make_corpus(args.docs, args.rows, rng)
+    single, multi = make_questions(questions, args.multi, rng)
+    chunks = TokenChunker(workers=1).split_documents(documents)
+    print(f"Corpus: {len(chunks)} chunks, {len(single)} single and {len(multi)} multi-part questions\n")
+
+    store = InMemoryStore(chunks, HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME))
+    llm = StubRewriteLLM(latency_ms=args.llm_ms)
+
+    print(
+        f"{'mode':<12} {f'single@{args.k}':>9} {f'multi@{args.k}':>9} {'p50_ms':>7} {'p95_ms':>7} "
+        f"{'added_ms':>8} {'fallbacks':>9}"
+    )
+    baseline = None
+    for mode in EXPANSION_MODES:
+        expander = QueryExpander(
+            store, llm, LLMCaller(hedge_enabled=False, limiter=LLMLimiter(requests_per_minute=0)),
+            mode=mode, budget_ms=args.budget_ms
+        )
+        single_recall, single_ms = run_mode(expander, single, args.k)
+        multi_recall, multi_ms = run_mode(expander, multi, args.k)
+        latencies = np.concatenate([single_ms, multi_ms])
+        p50, p95 = np.percentile(latencies, [50, 95])
+        baseline = p50 if baseline is None else baseline
+        stats = expander.stats()
+        fallbacks = stats["fallbacks"] / max(1, stats["fallbacks"] + stats["expanded"])
+        print(
+            f"{mode:<12} {single_recall:>9.1%} {multi_recall:>9.1%} {p50:>7.1f} {p95:>7.1f} "
+            f"{p50 - baseline:>8.1f} {fallbacks:>9.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
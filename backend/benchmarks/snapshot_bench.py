@@ -0,0 +1,114 @@
+"""
+Round-trip and throughput benchmark for knowledge-base snapshots.
+
+Builds a synthetic knowledge base in a temporary directory, exports it,
+imports it into a fresh instance, verifies that ids, texts, metadata,
+embeddings and document rows survive the round trip, and reports snapshot
+size plus export/import throughput.
+
+Run from the backend directory:
+    python -m benchmarks.snapshot_bench --chunks 100000 --backend mmap
+"""
+
+import argparse
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.vector_index_bench import DIM, make_corpus
+from config.database import get_db, init_db
+from services.snapshot import SnapshotService
+from services.vector_index import ChromaVectorIndex, MmapVectorIndex
+
+CHUNKS_PER_DOCUMENT = 50
+
+
+def open_index(backend: str, path: Path):
+    if backend == "mmap":
+        return MmapVectorIndex(path / "mmap")
+    import chromadb
+    return ChromaVectorIndex(chromadb.PersistentClient(path=str(path / "chroma")), "documents")
+
+
+def build_knowledge_base(index, db_path: Path, corpus: np.ndarray):
+    init_db(db_path)
+    doc_count = (len(corpus) + CHUNKS_PER_DOCUMENT - 1) // CHUNKS_PER_DOCUMENT
+    with get_db(db_path) as conn:
+        conn.executemany(
+            "INSERT INTO documents (id, title, source_type, source_path, created_at) VALUES (?, ?, ?, ?, ?)",
+            [(f"doc{d}", f"Document {d}", "text", f"doc{d}.txt", "2024-01-01T00:00:00") for d in range(doc_count)]
+        )
+        conn.commit()
+
+    for start in range(0, len(corpus), 5000):
+        end = min(start + 5000, len(corpus))
+        index.add(
+            ids=[f"doc{i // CHUNKS_PER_DOCUMENT}_{i}" for i in range(start, end)],
+            embeddings=corpus[start:end],
+            texts=[f"chunk {i} " + "lorem ipsum dolor sit amet " * 30 for i in range(start, end)],
+            metadatas=[
+                {"doc_id": f"doc{i // CHUNKS_PER_DOCUMENT}", "split_id": f"doc{i // CHUNKS_PER_DOCUMENT}_{i}", "title": "t"}
+                for i in range(start, end)
+            ]
+        )
+
+
+def verify_round_trip(source, target, source_db: Path, target_db: Path, tolerance: float):
+    expected = source.get(include_embeddings=True)
+    actual = target.get(ids=expected["ids"], include_embeddings=True)
+    actual_by_id = {
+        chunk_id: (text, metadata, embedding)
+        for chunk_id, text, metadata, embedding in zip(
+            actual["ids"], actual["documents"], actual["metadatas"], actual["embeddings"]
+        )
+    }
+    assert len(actual_by_id) == len(expected["ids"]), "chunk count mismatch"
+    for chunk_id, text, metadata, embedding in zip(
+        expected["ids"], expected["documents"], expected["metadatas"], expected["embeddings"]
+    ):
+        actual_text, actual_metadata, actual_embedding = actual_by_id[chunk_id]
+        assert actual_text == text, f"text mismatch for {chunk_id}"
+        assert actual_metadata == metadata, f"metadata mismatch for {chunk_id}"
+        assert np.allclose(actual_embedding, embedding, atol=tolerance), f"embedding mismatch for {chunk_id}"
+
+    with get_db(source_db) as source_conn, get_db(target_db) as target_conn:
+        query = "SELECT * FROM documents ORDER BY id"
+        assert source_conn.execute(query).fetchall() == target_conn.execute(query).fetchall(), "document rows mismatch"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--backend", choices=["mmap", "chroma"], default="mmap")
+    parser.add_argument("--float16", action="store_true", help="Store embeddings as float16 in the snapshot")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="snapshot_bench_"))
+    try:
+        source_dir, target_dir = workdir / "source", workdir / "target"
+        source_dir.mkdir()
+        target_dir.mkdir()
+        source = open_index(args.backend, source_dir)
+        build_knowledge_base(source, source_dir / "kb.db", make_corpus(args.chunks, DIM))
+
+        snapshot_path = workdir / "snapshot.parquet"
+        exported = SnapshotService({"documents": source}, source_dir / "kb.db").export_snapshot(
+            snapshot_path, "float16" if args.float16 else "float32"
+        )
+        target = open_index(args.backend, target_dir)
+        imported = SnapshotService({"documents": target}, target_dir / "kb.db").import_snapshot(snapshot_path)
+
+        verify_round_trip(source, target, source_dir / "kb.db", target_dir / "kb.db", 1e-3 if args.float16 else 1e-6)
+        print("✓ Round trip verified")
+        print(f"Snapshot: {exported['bytes'] / 2**20:.1f} MB for {exported['chunks']} chunks "
+              f"({exported['bytes'] / exported['chunks']:.0f} bytes/chunk)")
+        print(f"Export:   {exported['seconds']:.1f}s ({exported['chunks'] / exported['seconds']:.0f} chunks/s)")
+        print(f"Import:   {imported['seconds']:.1f}s ({imported['chunks'] / imported['seconds']:.0f} chunks/s)")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Benchmark the vector index backends on synthetic embeddings.
+
+Compares Chroma against the memory-mapped index in exact (flat) and IVF mode,
+reporting recall@k against brute-force search and p50/p99 query latency.
+
+Run from the backend directory:
+    python -m benchmarks.vector_index_bench --sizes 10000 100000 1000000
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+from services.vector_index import ChromaVectorIndex, MmapVectorIndex, VectorIndex
+
+DIM = 384
+
+
+def make_corpus(size: int, dim: int, seed: int = 0) -> np.ndarray:
+    """Generate clustered unit vectors, roughly shaped like sentence embeddings."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, size // 100), dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), size)] + 0.5 * rng.normal(size=(size, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_queries(corpus: np.ndarray, count: int, seed: int = 1) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    queries = corpus[rng.integers(0, len(corpus), count)] + 0.3 * rng.normal(size=(count, corpus.shape[1])).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def exact_neighbours(corpus: np.ndarray, queries: np.ndarray, k: int) -> List[set]:
+    truth = []
+    for query in queries:
+        scores = corpus @ query
+        truth.append(set(np.argpartition(-scores, k)[:k].tolist()))
+    return truth
+
+
+def fill_index(index: VectorIndex, corpus: np.ndarray, batch_size: int = 5000):
+    for start in range(0, len(corpus), batch_size):
+        end = min(start + batch_size, len(corpus))
+        index.add(
+            ids=[str(i) for i in range(start, end)],
+            embeddings=corpus[start:end],
+            texts=[""] * (end - start),
+            metadatas=[{"doc_id": f"doc{i // 50}", "row": i} for i in range(start, end)]
+        )
+
+
+def measure(index: VectorIndex, queries: np.ndarray, truth: List[set], k: int) -> Dict[str, float]:
+    latencies = []
+    hits = 0
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        results = index.search([query], k)[0]
+        latencies.append((time.perf_counter() - started) * 1000)
+        hits += len({doc.metadata["row"] for doc, _ in results} & expected)
+    return {
+        "recall": hits / (k * len(queries)),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16"])
+    parser.add_argument("--skip-chroma", action="store_true", help="Only benchmark the mmap engine")
+    args = parser.parse_args()
+
+    print(f"{'size':>9} {'engine':<12} {'build_s':>8} {'recall@' + str(args.k):>10} {'p50_ms':>8} {'p99_ms':>8}")
+    for size in args.sizes:
+        corpus = make_corpus(size, DIM)
+        queries = make_queries(corpus, args.queries)
+        truth = exact_neighbours(corpus, queries, args.k)
+        workdir = Path(tempfile.mkdtemp(prefix="vector_index_bench_"))
+
+        engines = {
+            "mmap-flat": lambda: MmapVectorIndex(workdir / "flat", dtype=args.dtype, ivf_min_vectors=size + 1),
+            "mmap-ivf": lambda: MmapVectorIndex(workdir / "ivf", dtype=args.dtype, ivf_min_vectors=size + 1, nprobe=args.nprobe),
+        }
+        if not args.skip_chroma:
+            import chromadb
+            engines["chroma"] = lambda: ChromaVectorIndex(
+                chromadb.PersistentClient(path=str(workdir / "chroma")), "bench"
+            )
+
+        try:
+            for name, factory in engines.items():
+                started = time.perf_counter()
+                index = factory()
+                fill_index(index, corpus)
+                if name == "mmap-ivf":
+                    # Train once on the full corpus instead of at every growth step
+                    index.build_ivf()
+                build_seconds = time.perf_counter() - started
+
+                stats = measure(index, queries, truth, args.k)
+                print(
+                    f"{size:>9} {name:<12} {build_seconds:>8.1f} {stats['recall']:>10.3f} "
+                    f"{stats['p50_ms']:>8.2f} {stats['p99_ms']:>8.2f}"
+                )
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
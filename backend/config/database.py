@@ -1,10 +1,14 @@
 import sqlite3
+import time
+import uuid
 from contextlib import contextmanager
+from pathlib import Path
+from typing import Tuple
 from .settings import DB_PATH
 
-def init_db():
+def init_db(db_path: Path = DB_PATH):
     """Initialize the SQLite database with required tables."""
-    with get_db() as conn:
+    with get_db(db_path) as conn:
         cursor = conn.cursor()
         cursor.execute('''
         CREATE TABLE IF NOT EXISTS documents (
@@ -15,17 +19,109 @@ def init_db():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
         ''')
+        
+        # Columns added after the first release
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(documents)")}
+        for column, column_type in [("content_hash", "TEXT"), ("storage_path", "TEXT")]:
+            if column not in columns:
+                cursor.execute(f"ALTER TABLE documents ADD COLUMN {column} {column_type}")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_documents_content_hash ON documents (content_hash)")
+        
+        # Parent sections for small-to-big retrieval (see services/parent_store.py)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS parent_chunks (
+            id TEXT PRIMARY KEY,
+            doc_id TEXT NOT NULL,
+            text TEXT NOT NULL,
+            metadata TEXT NOT NULL,
+            token_count INTEGER
+        )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_parent_chunks_doc_id ON parent_chunks (doc_id)")
+
+        # MinHash signatures of indexed chunks and the near-duplicates aliased to them,
+        # with their LSH band buckets (see services/dedup.py)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chunk_signatures (
+            split_id TEXT PRIMARY KEY,
+            doc_id TEXT NOT NULL,
+            signature BLOB NOT NULL,
+            numbers_hash INTEGER NOT NULL,
+            canonical_id TEXT,
+            text TEXT,
+            metadata TEXT
+        )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_chunk_signatures_doc_id ON chunk_signatures (doc_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_chunk_signatures_canonical_id ON chunk_signatures (canonical_id)")
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chunk_signature_bands (
+            bucket INTEGER NOT NULL,
+            split_id TEXT NOT NULL,
+            PRIMARY KEY (bucket, split_id)
+        )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_chunk_signature_bands_split_id ON chunk_signature_bands (split_id)")
+
+        # Answers per normalized question, valid for one knowledge-base version,
+        # and the last version pre-warmed (see services/answer_cache.py)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS answer_cache (
+            question TEXT PRIMARY KEY,
+            kb_version TEXT NOT NULL,
+            response TEXT NOT NULL,
+            source TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_answer_cache_kb_version ON answer_cache (kb_version)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_answer_cache_created_at ON answer_cache (created_at)")
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS answer_prewarm_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            kb_version TEXT NOT NULL,
+            claimed_at REAL NOT NULL
+        )
+        ''')
+        cursor.execute("INSERT OR IGNORE INTO answer_prewarm_state (id, kb_version, claimed_at) VALUES (1, '', 0)")
+
+        # Knowledge-base version, bumped whenever documents are added or removed;
+        # the random epoch keeps versions of a recreated database from colliding
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS kb_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            epoch TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        ''')
+        cursor.execute(
+            "INSERT OR IGNORE INTO kb_state (id, epoch, version, updated_at) VALUES (1, ?, 0, ?)",
+            (uuid.uuid4().hex[:8], time.time())
+        )
         conn.commit()
 
 @contextmanager
-def get_db():
+def get_db(db_path: Path = DB_PATH):
     """Context manager for database connections."""
-    conn = sqlite3.connect(str(DB_PATH))
+    conn = sqlite3.connect(str(db_path))
     try:
         yield conn
     finally:
         conn.close()
 
+def bump_kb_version(cursor):
+    """Increment the knowledge-base version inside the caller's transaction."""
+    cursor.execute("UPDATE kb_state SET version = version + 1, updated_at = ? WHERE id = 1", (time.time(),))
+
+def get_kb_version(db_path: Path = DB_PATH) -> Tuple[str, float]:
+    """Return the knowledge-base version tag and its last-modified Unix time."""
+    with get_db(db_path) as conn:
+        epoch, version, updated_at = conn.execute(
+            "SELECT epoch, version, updated_at FROM kb_state WHERE id = 1"
+        ).fetchone()
+    return f"{epoch}-{version}", updated_at
+
 def dict_factory(cursor, row):
     """Convert database rows to dictionaries."""
     fields = [column[0] for column in cursor.description]
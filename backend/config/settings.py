@@ -10,14 +10,26 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 UPLOAD_DIR = BASE_DIR / "uploaded_files"
 VECTORDB_DIR = BASE_DIR / "vectordb"
 DB_PATH = BASE_DIR / "knowledge_base.db"
+SNAPSHOT_DIR = BASE_DIR / "snapshots"
 
 # Create necessary directories
 UPLOAD_DIR.mkdir(exist_ok=True)
 VECTORDB_DIR.mkdir(exist_ok=True)
+SNAPSHOT_DIR.mkdir(exist_ok=True)
 
 # API Configuration
 CORS_ORIGINS = ["*"]  # Update this in production
 
+# Deployment Configuration
+# "all" runs everything in one process; "writer" owns ingestion and the index;
+# "query" serves /chat read-only from the shared index (see run_cluster.sh)
+SERVER_ROLE = os.getenv("SERVER_ROLE", "all")
+CHROMA_SERVER_HOST = os.getenv("CHROMA_SERVER_HOST")  # Use a Chroma server instead of the embedded client
+CHROMA_SERVER_PORT = int(os.getenv("CHROMA_SERVER_PORT", "8001"))
+INDEX_REFRESH_INTERVAL = float(os.getenv("INDEX_REFRESH_INTERVAL", "2"))  # Seconds between read-only index checks
+PREFORK_WORKERS = int(os.getenv("PREFORK_WORKERS", "4"))  # Workers forked by prefork.py
+TORCH_THREADS_PER_WORKER = int(os.getenv("TORCH_THREADS_PER_WORKER", "0"))  # 0 = cpu_count // workers
+
 # Model Configuration
 EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
 LLM_MODEL_NAME = "gemini-1.5-flash-latest"
@@ -25,12 +37,196 @@ LLM_TEMPERATURE = 0.7
 LLM_TOP_P = 0.9
 LLM_MAX_OUTPUT_TOKENS = 2048
 
+# Embedding Scheduler Configuration
+# Queries and ingestion share one model; queries are batched and served between ingestion slices
+EMBED_QUERY_MAX_BATCH = int(os.getenv("EMBED_QUERY_MAX_BATCH", "32"))
+EMBED_QUERY_MAX_WAIT_MS = float(os.getenv("EMBED_QUERY_MAX_WAIT_MS", "2"))  # Wait for concurrent queries to batch
+EMBED_INGEST_BATCH_SIZE = int(os.getenv("EMBED_INGEST_BATCH_SIZE", "32"))  # Most texts per ingestion model call
+EMBED_INGEST_MIN_BATCH = int(os.getenv("EMBED_INGEST_MIN_BATCH", "4"))  # Smaller batches waste model throughput
+EMBED_INGEST_SLICE_MS = float(os.getenv("EMBED_INGEST_SLICE_MS", "50"))  # Bounds query wait behind ingestion
+# There are no per-lane thread budgets: torch's thread pool is process-wide, so both lanes
+# use all EMBED_THREADS and are isolated by priority only (ingestion runs in slices and yields
+# to queued queries). Separate budgets would need the ingestion lane in its own process.
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", "0"))  # 0 = torch's current setting (TORCH_THREADS_PER_WORKER when pre-forked)
+
+# LLM Call Control
+# Identical in-flight prompts are coalesced; calls beyond these limits queue, then get HTTP 429
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "0"))  # 0 = no rate limit
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))  # Seconds a request may wait for a slot
+
+# Deadlines and Hedging
+CHAT_REQUEST_TIMEOUT = float(os.getenv("CHAT_REQUEST_TIMEOUT", "60"))  # Whole /chat request budget, in seconds
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))  # Per LLM API call
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))  # Hedge after this time-to-first-token percentile
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))  # Seconds
+LLM_HEDGE_BUDGET = float(os.getenv("LLM_HEDGE_BUDGET", "0.05"))  # Largest fraction of calls that may be hedged
+
+# Model Routing
+# Answers without relevant documents and short questions over small contexts go to the
+# fast model, the rest to the strong one; a call that times out or fails falls back to the other.
+# Both default to LLM_MODEL_NAME, which disables routing.
+LLM_FAST_MODEL_NAME = os.getenv("LLM_FAST_MODEL_NAME", LLM_MODEL_NAME)
+LLM_STRONG_MODEL_NAME = os.getenv("LLM_STRONG_MODEL_NAME", LLM_MODEL_NAME)
+ROUTE_STRONG_MIN_QUERY_WORDS = int(os.getenv("ROUTE_STRONG_MIN_QUERY_WORDS", "30"))
+ROUTE_STRONG_MIN_CONTEXT_CHARS = int(os.getenv("ROUTE_STRONG_MIN_CONTEXT_CHARS", "2500"))
+LLM_FAST_FALLBACK_AFTER = float(os.getenv("LLM_FAST_FALLBACK_AFTER", "8"))  # Seconds before trying the strong model
+LLM_STRONG_FALLBACK_AFTER = float(os.getenv("LLM_STRONG_FALLBACK_AFTER", "20"))  # Seconds before trying the fast model
+
+# LLM Provider
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "google")  # "google", or "stub" for utils/stub_llm_server.py
+LLM_STUB_URL = os.getenv("LLM_STUB_URL", "http://localhost:8090")
+
+# Batch API Configuration
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "1000"))  # Per /chat/batch or /retrieve/batch request
+CHAT_BATCH_MAX_PARALLEL = int(os.getenv("CHAT_BATCH_MAX_PARALLEL", "4"))  # LLM calls in flight per batch
+RETRIEVE_MAX_K = int(os.getenv("RETRIEVE_MAX_K", "100"))  # Largest k per /retrieve/batch query
+
+# HTTP Response Compression
+# Complete (non-streamed) text and JSON responses above the threshold are gzip- or
+# brotli-compressed; brotli is used when the optional `brotli` package is installed
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))  # Bytes
+GZIP_COMPRESS_LEVEL = 6
+BROTLI_QUALITY = 5
+COMPRESSION_THREAD_MIN_SIZE = 256 * 1024  # Larger bodies are compressed off the event loop
+
+# Small-to-Big Retrieval (optional)
+# Small child chunks are embedded for precise matching; prompts get their larger parent
+# sections, stored once in SQLite (see services/parent_store.py)
+PARENT_RETRIEVAL_ENABLED = os.getenv("PARENT_RETRIEVAL_ENABLED", "false").lower() == "true"
+PARENT_CHUNK_TOKENS = int(os.getenv("PARENT_CHUNK_TOKENS", "768"))
+CHILD_CHUNK_TOKENS = int(os.getenv("CHILD_CHUNK_TOKENS", "128"))
+CHILD_CHUNK_OVERLAP_TOKENS = int(os.getenv("CHILD_CHUNK_OVERLAP_TOKENS", "16"))
+CHILD_SEARCH_TOP_K = int(os.getenv("CHILD_SEARCH_TOP_K", "12"))  # Children searched per question
+PARENT_CONTEXT_MAX_TOKENS = int(os.getenv("PARENT_CONTEXT_MAX_TOKENS", "2048"))  # At most VECTOR_SEARCH_TOP_K parents
+
+# Query Expansion (optional)
+# "multi_query": the fast model rewrites the question QUERY_EXPANSION_COUNT ways; "hyde": it
+# writes a short hypothetical answer. Rewrites are searched next to the original question and
+# fused by reciprocal rank. If they aren't ready within the budget, the question is searched alone.
+QUERY_EXPANSION_MODE = os.getenv("QUERY_EXPANSION_MODE", "off")  # "off", "multi_query" or "hyde"
+QUERY_EXPANSION_COUNT = int(os.getenv("QUERY_EXPANSION_COUNT", "3"))
+QUERY_EXPANSION_BUDGET_MS = float(os.getenv("QUERY_EXPANSION_BUDGET_MS", "800"))
+QUERY_EXPANSION_MAX_TOKENS = int(os.getenv("QUERY_EXPANSION_MAX_TOKENS", "128"))
+QUERY_EXPANSION_RRF_K = int(os.getenv("QUERY_EXPANSION_RRF_K", "60"))  # Reciprocal rank fusion damping
+
+# Question Index (optional)
+# At ingestion, an LLM writes likely questions for each chunk in background batches; their
+# embeddings go into the "questions" collection, point back to the chunk's split_id, and are
+# searched alongside the chunks (see services/question_index.py)
+QUESTION_INDEX_ENABLED = os.getenv("QUESTION_INDEX_ENABLED", "false").lower() == "true"
+QUESTION_GEN_PROVIDER = os.getenv("QUESTION_GEN_PROVIDER", LLM_PROVIDER)  # "stub" to test without the API
+QUESTION_GEN_MODEL_NAME = os.getenv("QUESTION_GEN_MODEL_NAME", LLM_FAST_MODEL_NAME)
+QUESTION_GEN_PER_CHUNK = int(os.getenv("QUESTION_GEN_PER_CHUNK", "3"))
+QUESTION_GEN_BATCH_CHUNKS = int(os.getenv("QUESTION_GEN_BATCH_CHUNKS", "8"))  # Chunks per LLM call
+QUESTION_GEN_MAX_TOKENS = int(os.getenv("QUESTION_GEN_MAX_TOKENS", "1024"))
+
+# Near-Duplicate Chunks (optional)
+# At ingestion, a chunk whose word-shingle MinHash matches an indexed chunk at or above the
+# threshold (estimated Jaccard similarity) is stored as an alias of it instead of being
+# embedded again (see services/dedup.py). With MATCH_NUMBERS, chunks are only aliased when
+# they contain the same numbers, so templated pages with other VLANs, addresses or versions
+# stay searchable. Searches filtered by doc_id also return the document's aliases, scored with
+# their canonical chunk's embedding. Changing the MinHash parameters invalidates stored
+# signatures; new chunks then only match chunks added after the change.
+NEAR_DUPLICATE_ENABLED = os.getenv("NEAR_DUPLICATE_ENABLED", "false").lower() == "true"
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.9"))
+NEAR_DUPLICATE_MATCH_NUMBERS = os.getenv("NEAR_DUPLICATE_MATCH_NUMBERS", "true").lower() == "true"
+NEAR_DUPLICATE_SHINGLE_WORDS = 3
+NEAR_DUPLICATE_NUM_PERM = 128  # MinHash permutations
+NEAR_DUPLICATE_BANDS = 16  # LSH bands of NUM_PERM / BANDS rows each
+
+# Result Diversification (optional)
+# Searches fetch MMR_FETCH_FACTOR times more candidates and pick k by maximal marginal
+# relevance, so near-identical chunks don't fill the top k; 1.0 = pure relevance
+RETRIEVAL_MMR_ENABLED = os.getenv("RETRIEVAL_MMR_ENABLED", "false").lower() == "true"
+RETRIEVAL_MMR_LAMBDA = float(os.getenv("RETRIEVAL_MMR_LAMBDA", "0.7"))
+RETRIEVAL_MMR_FETCH_FACTOR = int(os.getenv("RETRIEVAL_MMR_FETCH_FACTOR", "3"))
+
+# Query Log (optional)
+# Each chat question is appended, with its retrieval and LLM latency, the documents it hit and
+# its answer-cache outcome, as one NDJSON line to an hourly file under QUERY_LOG_DIR. A
+# background thread writes; when it falls behind, entries are dropped rather than delaying
+# requests. Files older than the retention are deleted (see services/query_log.py).
+# The log holds user questions verbatim.
+QUERY_LOG_ENABLED = os.getenv("QUERY_LOG_ENABLED", "false").lower() == "true"
+QUERY_LOG_DIR = Path(os.getenv("QUERY_LOG_DIR", str(BASE_DIR / "query_logs")))
+QUERY_LOG_RETENTION_DAYS = float(os.getenv("QUERY_LOG_RETENTION_DAYS", "30"))
+QUERY_LOG_MAX_QUEUE = 10000  # Entries waiting for the writer before new ones are dropped
+QUERY_LOG_WRITE_BATCH = 500  # Most entries per write
+
+# Answer Cache (optional)
+# Answers are cached in SQLite per normalized question and knowledge-base version, so every
+# worker and role shares them and any document change invalidates them (see services/answer_cache.py)
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "false").lower() == "true"
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "10000"))
+
+# Answer Pre-warming (optional; needs the query log and the answer cache)
+# After each knowledge-base change (once it has been quiet for PREWARM_DELAY_SECONDS), one
+# chat process clusters the logged questions of the last PREWARM_WINDOW_DAYS by embedding and
+# answers the most frequent phrasings of the top clusters into the answer cache
+ANSWER_PREWARM_ENABLED = os.getenv("ANSWER_PREWARM_ENABLED", "false").lower() == "true"
+ANSWER_PREWARM_TOP_CLUSTERS = int(os.getenv("ANSWER_PREWARM_TOP_CLUSTERS", "20"))
+ANSWER_PREWARM_PHRASINGS = int(os.getenv("ANSWER_PREWARM_PHRASINGS", "2"))  # Per cluster
+ANSWER_PREWARM_MIN_COUNT = int(os.getenv("ANSWER_PREWARM_MIN_COUNT", "3"))  # Smaller clusters are not warmed
+ANSWER_PREWARM_WINDOW_DAYS = float(os.getenv("ANSWER_PREWARM_WINDOW_DAYS", "7"))
+ANSWER_PREWARM_DELAY_SECONDS = float(os.getenv("ANSWER_PREWARM_DELAY_SECONDS", "30"))
+ANSWER_PREWARM_POLL_SECONDS = 10
+QUERY_CLUSTER_SIMILARITY = float(os.getenv("QUERY_CLUSTER_SIMILARITY", "0.85"))  # Cosine similarity to a cluster's leader
+QUERY_CLUSTER_MAX_QUESTIONS = 20000  # Distinct questions clustered, most frequent first
+
+# Upload Storage
+# Uploaded files are stored once per content hash under BLOB_DIR (see services/storage.py)
+BLOB_DIR = UPLOAD_DIR / "blobs"
+UPLOAD_READ_CHUNK_SIZE = 1024 * 1024  # Bytes read (and hashed) at a time while streaming an upload
+STORAGE_GC_GRACE_SECONDS = int(os.getenv("STORAGE_GC_GRACE_SECONDS", "3600"))  # Never collect newer files
+STORAGE_GC_SCAN_BATCH_SIZE = 5000  # Chunks read per index call while looking for orphans
+
 # Document Processing Configuration
-CHUNK_SIZE = 1000
-CHUNK_OVERLAP = 200
+# Chunks are sized in tokens of the embedding model's tokenizer (see services/chunking.py);
+# all-MiniLM-L6-v2 truncates its input at 256 word pieces including [CLS] and [SEP]
+CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER", EMBEDDING_MODEL_NAME)  # Hugging Face name or local path
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "240"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+CHUNK_WORKERS = int(os.getenv("CHUNK_WORKERS", "0"))  # Splitter processes for large documents; 0 = min(4, CPUs)
+CHUNK_PARALLEL_MIN_CHARS = 200_000  # Smaller inputs are split in-process
+CHUNK_PARALLEL_SEGMENT_CHARS = 50_000  # Long texts are cut at paragraph breaks into segments this size
 
 # API Keys
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN")  # Required as X-Admin-Token on /admin routes when set
 
 # Vector Store Configuration
-VECTOR_SEARCH_TOP_K = 3 
\ No newline at end of file
+VECTOR_SEARCH_TOP_K = 3
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")  # "chroma" or "mmap"
+
+# Chroma HNSW Configuration
+# Construction parameters (M, construction_ef) only take effect when a collection
+# is created; use `python -m utils.rebuild_index` to apply new values to existing data.
+CHROMA_HNSW_DEFAULTS = {
+    "hnsw:space": "cosine",
+    "hnsw:M": int(os.getenv("CHROMA_HNSW_M", "16")),
+    "hnsw:construction_ef": int(os.getenv("CHROMA_HNSW_CONSTRUCTION_EF", "100")),
+    "hnsw:search_ef": int(os.getenv("CHROMA_HNSW_SEARCH_EF", "10")),
+    "hnsw:batch_size": int(os.getenv("CHROMA_HNSW_BATCH_SIZE", "100")),
+    "hnsw:sync_threshold": int(os.getenv("CHROMA_HNSW_SYNC_THRESHOLD", "1000")),
+}
+CHROMA_HNSW_COLLECTION_OVERRIDES = {
+    # Per-collection overrides, e.g. "documents": {"hnsw:search_ef": 64}
+}
+
+# Memory-mapped Index Configuration (used when VECTOR_BACKEND = "mmap")
+MMAP_INDEX_DIR = VECTORDB_DIR / "mmap"
+MMAP_INDEX_DTYPE = os.getenv("MMAP_INDEX_DTYPE", "float32")  # "float32" or "float16"
+MMAP_IVF_MIN_VECTORS = int(os.getenv("MMAP_IVF_MIN_VECTORS", "50000"))  # Switch from exact to IVF search
+MMAP_IVF_NLIST = int(os.getenv("MMAP_IVF_NLIST", "0"))  # 0 = derive from corpus size
+MMAP_IVF_NPROBE = int(os.getenv("MMAP_IVF_NPROBE", "16"))
+MMAP_INDEX_QUANTIZATION = os.getenv("MMAP_INDEX_QUANTIZATION", "none")  # "none", "float16", "int8" or "binary"
+MMAP_RESCORE_FACTOR = int(os.getenv("MMAP_RESCORE_FACTOR", "4"))  # Shortlist size = k * factor before exact rescoring
+
+# Snapshot Configuration
+SNAPSHOT_BATCH_SIZE = 5000  # Chunks per Parquet row group
+SNAPSHOT_COMPRESSION = "zstd"
@@ -1,7 +1,9 @@
 from typing import List, Optional, Dict, Any
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
 
+from config.settings import RETRIEVE_MAX_K
+
 class ChatMessage(BaseModel):
     """Schema for chat messages."""
     message: str
@@ -19,6 +21,7 @@ class DocumentInfo(BaseModel):
     source_type: str
     source_path: str
     created_at: str
+    content_hash: Optional[str] = None  # SHA-256 of uploaded file content
 
 class URLSubmission(BaseModel):
     """Schema for URL submissions."""
@@ -28,4 +31,43 @@ class URLSubmission(BaseModel):
 class DocumentResponse(BaseModel):
     """Schema for document operation responses."""
     status: str
-    message: str 
\ No newline at end of file
+    message: str 
+
+class ChatBatchRequest(BaseModel):
+    """Schema for batch chat requests."""
+    messages: List[str]
+    stream: bool = False  # Stream NDJSON results in completion order
+
+class ChatBatchResult(BaseModel):
+    """Schema for one answer in a batch chat response."""
+    index: int
+    response: Optional[str] = None
+    sources: List[Dict[str, Any]] = []
+    error: Optional[str] = None
+    retry_after: Optional[int] = None  # Seconds, when the LLM was overloaded
+
+class ChatBatchResponse(BaseModel):
+    """Schema for batch chat responses, in request order."""
+    results: List[ChatBatchResult]
+
+class RetrieveBatchRequest(BaseModel):
+    """Schema for batch retrieval requests."""
+    queries: List[str]
+    k: Optional[int] = Field(None, ge=1, le=RETRIEVE_MAX_K)
+    where: Optional[Dict[str, Any]] = None
+    stream: bool = False
+
+class RetrievedChunk(BaseModel):
+    """Schema for a retrieved chunk."""
+    text: str
+    metadata: Dict[str, Any]
+    score: float
+
+class RetrieveBatchResult(BaseModel):
+    """Schema for the chunks retrieved for one query."""
+    index: int
+    chunks: List[RetrievedChunk]
+
+class RetrieveBatchResponse(BaseModel):
+    """Schema for batch retrieval responses, in request order."""
+    results: List[RetrieveBatchResult]
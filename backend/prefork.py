@@ -0,0 +1,123 @@
+"""
+Pre-fork server: load models and index state once, then fork workers.
+
+The master process imports the app (which loads the embedding model, the
+vector index and the LLM client), freezes the heap and forks the workers.
+Workers share the model weights and memory-mapped index pages copy-on-write
+instead of each loading their own copy, as `uvicorn --workers N` does.
+
+Fork safety:
+- No inference runs in the master, so torch/OpenMP thread pools are first
+  created in the workers, each capped at TORCH_THREADS_PER_WORKER threads.
+- SQLite connections, Chroma clients and gRPC LLM clients are recreated in
+  each worker by os.register_at_fork hooks in the services.
+- The master forks before serving, so no request threads hold locks.
+
+Run from the backend directory:
+    SERVER_ROLE=query python prefork.py --workers 8 --port 8002
+"""
+
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+# Must be set before grpc/tokenizers are imported
+os.environ.setdefault("GRPC_ENABLE_FORK_SUPPORT", "1")
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+import uvicorn
+
+from config.settings import PREFORK_WORKERS, TORCH_THREADS_PER_WORKER
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(application, sock: socket.socket, torch_threads: int):
+    """Serve requests on the shared listening socket until signalled."""
+    # Only configure torch if the app loaded it; importing it here would un-share memory
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.set_num_threads(torch_threads)
+
+    config = uvicorn.Config(application, log_level="info")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def spawn_worker(application, sock: socket.socket, torch_threads: int) -> int:
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        try:
+            run_worker(application, sock, torch_threads)
+        finally:
+            os._exit(0)
+    return pid
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=PREFORK_WORKERS)
+    args = parser.parse_args()
+
+    torch_threads = TORCH_THREADS_PER_WORKER or max(1, (os.cpu_count() or 1) // args.workers)
+
+    started = time.perf_counter()
+    from app import app as application
+
+    # Move everything loaded so far out of the GC's reach so collections in
+    # the workers don't write to (and un-share) these pages
+    gc.collect()
+    gc.freeze()
+    print(f"Loaded app in {time.perf_counter() - started:.1f}s; forking {args.workers} workers "
+          f"with {torch_threads} torch threads each")
+
+    sock = bind_socket(args.host, args.port)
+    workers = {spawn_worker(application, sock, torch_threads) for _ in range(args.workers)}
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    # Reap workers and replace any that die unexpectedly
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        workers.discard(pid)
+        if not stopping:
+            print(f"Worker {pid} exited with status {status}; restarting")
+            workers.add(spawn_worker(application, sock, torch_threads))
+
+    sock.close()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
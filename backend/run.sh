@@ -12,5 +12,21 @@ pip install -r requirements.txt
 HOST=${HOST:-"0.0.0.0"}
 PORT=${PORT:-8000}
 
+# SERVER_ROLE=all (default) runs a single reloading dev server.
+# SERVER_ROLE=writer|query run without reload; WORKERS sets query worker count.
+# PREFORK=1 loads models once and forks query workers that share them (prefork.py).
+export SERVER_ROLE=${SERVER_ROLE:-"all"}
+WORKERS=${WORKERS:-1}
+PREFORK=${PREFORK:-0}
+
 # Run the server
-uvicorn app:app --host $HOST --port $PORT --reload 
\ No newline at end of file
+if [ "$SERVER_ROLE" = "all" ]; then
+    uvicorn app:app --host $HOST --port $PORT --reload
+elif [ "$SERVER_ROLE" = "writer" ]; then
+    # Exactly one writer owns ingestion and the index
+    uvicorn app:app --host $HOST --port $PORT --workers 1
+elif [ "$PREFORK" = "1" ]; then
+    python prefork.py --host $HOST --port $PORT --workers $WORKERS
+else
+    uvicorn app:app --host $HOST --port $PORT --workers $WORKERS
+fi
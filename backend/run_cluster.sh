@@ -0,0 +1,43 @@
+#!/bin/bash
+#
+# Run one writer and N read-only query workers on this machine.
+#
+#   writer  -> http://localhost:$WRITER_PORT   (/documents, /admin)
+#   queries -> http://localhost:$QUERY_PORT    (/chat, N uvicorn workers)
+#
+# VECTOR_BACKEND=mmap (default here): query workers map the writer's index
+# files read-only and reload within INDEX_REFRESH_INTERVAL seconds of a change.
+# VECTOR_BACKEND=chroma: a Chroma server is started on $CHROMA_SERVER_PORT and
+# every process connects to it as a client.
+
+if [ -d "venv" ]; then
+    source venv/bin/activate
+fi
+
+HOST=${HOST:-"127.0.0.1"}
+WRITER_PORT=${WRITER_PORT:-8000}
+QUERY_PORT=${QUERY_PORT:-8002}
+QUERY_WORKERS=${QUERY_WORKERS:-4}
+export VECTOR_BACKEND=${VECTOR_BACKEND:-"mmap"}
+
+PIDS=()
+trap 'kill ${PIDS[@]} 2>/dev/null' EXIT INT TERM
+
+if [ "$VECTOR_BACKEND" = "chroma" ]; then
+    export CHROMA_SERVER_HOST=${CHROMA_SERVER_HOST:-"127.0.0.1"}
+    export CHROMA_SERVER_PORT=${CHROMA_SERVER_PORT:-8001}
+    chroma run --path vectordb --host $CHROMA_SERVER_HOST --port $CHROMA_SERVER_PORT &
+    PIDS+=($!)
+    sleep 3
+fi
+
+SERVER_ROLE=writer uvicorn app:app --host $HOST --port $WRITER_PORT --workers 1 &
+PIDS+=($!)
+
+# Give the writer time to create the index before readers open it
+sleep 5
+
+SERVER_ROLE=query uvicorn app:app --host $HOST --port $QUERY_PORT --workers $QUERY_WORKERS &
+PIDS+=($!)
+
+wait
@@ -0,0 +1,275 @@
+import os
+import sqlite3
+import threading
+import time
+import traceback
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import orjson
+
+from config.database import get_db, get_kb_version
+from config.settings import (
+    ANSWER_CACHE_MAX_ENTRIES,
+    ANSWER_PREWARM_DELAY_SECONDS,
+    ANSWER_PREWARM_MIN_COUNT,
+    ANSWER_PREWARM_PHRASINGS,
+    ANSWER_PREWARM_POLL_SECONDS,
+    ANSWER_PREWARM_TOP_CLUSTERS,
+    ANSWER_PREWARM_WINDOW_DAYS,
+    DB_PATH,
+    QUERY_LOG_DIR
+)
+from services.llm_control import LLMOverloadedError
+from services.query_log import cluster_questions, normalize_question, read_query_log
+
+# Matches the tag returned by get_kb_version
+CURRENT_KB_VERSION = "SELECT epoch || '-' || version FROM kb_state WHERE id = 1"
+
+
+class AnswerCache:
+    """Chat answers keyed by normalized question and knowledge-base version.
+
+    Entries live in the SQLite database, so every pre-forked worker and
+    query replica shares them, and an answer is only served for the
+    knowledge-base version it was generated against: any document upload,
+    deletion or import makes earlier answers stale. Stale entries, and the
+    oldest beyond max_entries, are deleted on writes. Cache errors are
+    logged and treated as misses; they never fail a request.
+    """
+
+    def __init__(self, db_path: Path = DB_PATH, max_entries: int = ANSWER_CACHE_MAX_ENTRIES):
+        """Create an answer cache.
+
+        Args:
+            db_path: SQLite database holding the answer_cache table
+            max_entries: Most cached answers
+        """
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0}
+
+    def get(self, question: str, kb_version: str) -> Optional[Dict[str, Any]]:
+        """Return the cached response for a question at this version, or None."""
+        try:
+            with get_db(self.db_path) as conn:
+                row = conn.execute(
+                    "SELECT response FROM answer_cache WHERE question = ? AND kb_version = ?",
+                    (normalize_question(question), kb_version)
+                ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error reading answer cache: {str(e)}")
+            row = None
+        with self._lock:
+            self._stats["hits" if row else "misses"] += 1
+        return orjson.loads(row[0]) if row else None
+
+    def contains(self, question: str, kb_version: str) -> bool:
+        """Check for a cached answer without counting a hit or miss."""
+        with get_db(self.db_path) as conn:
+            return conn.execute(
+                "SELECT 1 FROM answer_cache WHERE question = ? AND kb_version = ?",
+                (normalize_question(question), kb_version)
+            ).fetchone() is not None
+
+    def put(self, question: str, kb_version: str, response: Dict[str, Any], source: str = "live"):
+        """Cache a response.
+
+        Args:
+            question: The question as asked
+            kb_version: Knowledge-base version the answer was generated against
+            response: Response dict ("response" and "sources")
+            source: "live" for answers to users, "prewarm" for pre-warmed ones
+        """
+        try:
+            with get_db(self.db_path) as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO answer_cache (question, kb_version, response, source, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (normalize_question(question), kb_version, orjson.dumps(response).decode(), source, time.time())
+                )
+                # Compare with the stored version, not the caller's: a request that
+                # started before a change must not delete the newer answers
+                conn.execute(f"DELETE FROM answer_cache WHERE kb_version NOT IN ({CURRENT_KB_VERSION})")
+                conn.execute(
+                    "DELETE FROM answer_cache WHERE question IN "
+                    "(SELECT question FROM answer_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"Error writing answer cache: {str(e)}")
+            return
+        with self._lock:
+            self._stats["stores"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return this process's hit/miss counters and the answers cached for the current version."""
+        with get_db(self.db_path) as conn:
+            entries = dict(conn.execute(
+                f"SELECT source, COUNT(*) FROM answer_cache WHERE kb_version IN ({CURRENT_KB_VERSION}) GROUP BY source"
+            ).fetchall())
+        with self._lock:
+            return {**self._stats, "entries": sum(entries.values()), "prewarmed": entries.get("prewarm", 0)}
+
+
+class AnswerPrewarmer:
+    """Answer the most frequent questions after each knowledge-base change.
+
+    A background thread polls the knowledge-base version. Once a new
+    version has been unchanged for delay_seconds (so a bulk upload triggers
+    one run, and query replicas have refreshed their index), the first
+    process to claim the version in SQLite clusters the questions logged in
+    the last window_days (see services/query_log.py) and, for each of the
+    top_clusters clusters asked at least min_count times, answers its
+    `phrasings` most frequent phrasings into the answer cache. Answers are
+    generated one at a time through the chat service's LLM limiter; a run
+    stops when the LLM is overloaded or the knowledge base changes again.
+    """
+
+    def __init__(
+        self,
+        chat_service,
+        log_dir: Path = QUERY_LOG_DIR,
+        top_clusters: int = ANSWER_PREWARM_TOP_CLUSTERS,
+        phrasings: int = ANSWER_PREWARM_PHRASINGS,
+        min_count: int = ANSWER_PREWARM_MIN_COUNT,
+        window_days: float = ANSWER_PREWARM_WINDOW_DAYS,
+        delay_seconds: float = ANSWER_PREWARM_DELAY_SECONDS,
+        poll_seconds: float = ANSWER_PREWARM_POLL_SECONDS,
+        db_path: Path = DB_PATH
+    ):
+        """Create a pre-warmer.
+
+        Args:
+            chat_service: ChatService generating the answers (and holding the answer cache)
+            log_dir: Query log directory
+            top_clusters: Most clusters warmed per run
+            phrasings: Most frequent phrasings warmed per cluster
+            min_count: Clusters asked fewer times are not warmed
+            window_days: Age of the oldest logged question considered
+            delay_seconds: Quiet time after a change before warming
+            poll_seconds: Seconds between version checks
+            db_path: SQLite database holding kb_state and answer_prewarm_state
+        """
+        self.chat_service = chat_service
+        self.log_dir = log_dir
+        self.top_clusters = top_clusters
+        self.phrasings = phrasings
+        self.min_count = min_count
+        self.window_days = window_days
+        self.delay_seconds = delay_seconds
+        self.poll_seconds = poll_seconds
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._started = False
+        self._last_version: Optional[str] = None
+        self._stats: Dict[str, Any] = {"runs": 0, "answers": 0, "already_cached": 0, "failed": 0, "last_run": None}
+        os.register_at_fork(after_in_child=self._restart)
+
+    def start(self):
+        """Start polling for knowledge-base changes in a background thread; later calls do nothing."""
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._run, name="answer-prewarmer", daemon=True).start()
+
+    def _restart(self):
+        # The polling thread does not survive fork
+        self._lock = threading.Lock()
+        if self._started:
+            self._started = False
+            self.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_seconds)
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Error pre-warming answers: {str(e)}")
+                print(traceback.format_exc())
+
+    def check(self) -> bool:
+        """Pre-warm if the version changed, has been quiet long enough and this process claims it.
+
+        Returns:
+            True if a run was made
+        """
+        kb_version, updated_at = get_kb_version(self.db_path)
+        if kb_version == self._last_version or time.time() - updated_at < self.delay_seconds:
+            return False
+        self._last_version = kb_version
+        if not self._claim(kb_version):
+            return False
+        self.prewarm(kb_version)
+        return True
+
+    def _claim(self, kb_version: str) -> bool:
+        """Record this version as pre-warmed; only one process succeeds per version."""
+        with get_db(self.db_path) as conn:
+            cursor = conn.execute(
+                "UPDATE answer_prewarm_state SET kb_version = ?, claimed_at = ? WHERE id = 1 AND kb_version != ?",
+                (kb_version, time.time(), kb_version)
+            )
+            conn.commit()
+            return cursor.rowcount == 1
+
+    def prewarm(self, kb_version: Optional[str] = None) -> Dict[str, Any]:
+        """Answer the top clusters' most frequent phrasings into the answer cache.
+
+        Args:
+            kb_version: Version to warm; defaults to the current one
+
+        Returns:
+            Dict with the version, clusters warmed and answers generated,
+            already cached or failed
+        """
+        kb_version = kb_version or get_kb_version(self.db_path)[0]
+        started = time.perf_counter()
+        entries = read_query_log(self.log_dir, since=time.time() - self.window_days * 86400)
+        clusters = [
+            cluster
+            for cluster in cluster_questions(entries, self.chat_service.vector_store_service.embedding_model)
+            if cluster["count"] >= self.min_count
+        ][:self.top_clusters]
+        questions = [question for cluster in clusters for question, _ in cluster["phrasings"][:self.phrasings]]
+
+        run = {"kb_version": kb_version, "clusters": len(clusters), "answers": 0, "already_cached": 0, "failed": 0}
+        for question in questions:
+            if get_kb_version(self.db_path)[0] != kb_version:
+                print("Knowledge base changed while pre-warming; stopping")
+                break
+            if self.chat_service.answer_cache.contains(question, kb_version):
+                run["already_cached"] += 1
+                continue
+            try:
+                cached = self.chat_service.prewarm_answer(question, kb_version)
+                run["answers" if cached else "failed"] += 1
+            except LLMOverloadedError:
+                print("LLM overloaded; stopping pre-warming")
+                break
+            except Exception as e:
+                print(f"Error pre-warming answer for {question!r}: {str(e)}")
+                run["failed"] += 1
+        run["seconds"] = round(time.perf_counter() - started, 3)
+
+        print(
+            f"Pre-warmed {run['answers']} answers for {run['clusters']} question clusters "
+            f"({run['already_cached']} already cached, {run['failed']} failed) in {run['seconds']:.1f}s"
+        )
+        with self._lock:
+            self._stats["runs"] += 1
+            for key in ("answers", "already_cached", "failed"):
+                self._stats[key] += run[key]
+            self._stats["last_run"] = run
+        return run
+
+    def stats(self) -> Dict[str, Any]:
+        """Return run counters and the last run of this process."""
+        with self._lock:
+            return dict(self._stats)
@@ -1,56 +1,49 @@
-from typing import Dict, Any, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+import os
+import threading
+import time
 import traceback
-from langchain_google_genai import GoogleGenerativeAI
 from langchain.prompts import PromptTemplate
-from langchain.chains import RetrievalQA, LLMChain
-from langchain.schema import BaseRetriever, Document
+from langchain.schema import Document
 
+from config.database import get_kb_version
 from config.settings import (
-    LLM_MODEL_NAME,
-    LLM_TEMPERATURE,
-    LLM_TOP_P,
+    ANSWER_CACHE_ENABLED,
+    ANSWER_PREWARM_ENABLED,
+    CHAT_REQUEST_TIMEOUT,
     LLM_MAX_OUTPUT_TOKENS,
     GOOGLE_API_KEY,
-    VECTOR_SEARCH_TOP_K
+    CHAT_BATCH_MAX_PARALLEL,
+    LLM_FAST_MODEL_NAME,
+    LLM_STRONG_MODEL_NAME,
+    ROUTE_STRONG_MIN_QUERY_WORDS,
+    ROUTE_STRONG_MIN_CONTEXT_CHARS,
+    LLM_FAST_FALLBACK_AFTER,
+    LLM_STRONG_FALLBACK_AFTER,
+    LLM_PROVIDER,
+    QUERY_EXPANSION_MODE,
+    QUERY_EXPANSION_MAX_TOKENS,
+    QUERY_LOG_ENABLED
 )
+from services.answer_cache import AnswerCache, AnswerPrewarmer
+from services.deadline import Deadline, DeadlineExceededError, RequestCancelledError
+from services.llm_control import LLMCaller, LLMLimiter, LLMOverloadedError, SingleFlight, create_llm_client
+from services.query_expansion import QueryExpander
+from services.query_log import QueryLog, normalize_question
 from services.vector_store import VectorStoreService
 from services.document import DocumentService
 
 # Define constants for readability
-SIMILARITY_THRESHOLD = 0.5
+SIMILARITY_THRESHOLD = 0.5  # Least cosine similarity (1 - distance) of a chunk used as context
 EMPTY_SOURCES = []
 
-class PreFilteredRetriever(BaseRetriever):
-    """A retriever that returns a predefined set of documents.
-    
-    This retriever implements the BaseRetriever interface required by LangChain
-    and simply returns documents that were filtered earlier in the process.
-    """
-    
-    filtered_docs: List[Document]
-        
-    def get_relevant_documents(self, query: str) -> List[Document]:
-        """Return the pre-filtered documents regardless of query.
-        
-        Args:
-            query: The query string (not used in this implementation)
-            
-        Returns:
-            The pre-filtered documents
-        """
-        return self.filtered_docs
-
-    async def aget_relevant_documents(self, query: str) -> List[Document]:
-        """Async version that returns the pre-filtered documents.
-        
-        Args:
-            query: The query string (not used in this implementation)
-            
-        Returns:
-            The pre-filtered documents
-        """
-        return self.get_relevant_documents(query)
+# Errors that must reach the API layer instead of triggering a fallback answer
+ABORT_ERRORS = (LLMOverloadedError, DeadlineExceededError, RequestCancelledError)
 
+# Model tiers for routing, and how long each may take before falling back to the other
+MODEL_TIERS = {"fast": LLM_FAST_MODEL_NAME, "strong": LLM_STRONG_MODEL_NAME}
+FALLBACK_AFTER = {"fast": LLM_FAST_FALLBACK_AFTER, "strong": LLM_STRONG_FALLBACK_AFTER}
 
 class ChatService:
     """Service for handling chat interactions using RAG or direct LLM responses."""
@@ -60,21 +53,61 @@ class ChatService:
         self._initialize_llm()
         self.vector_store_service = VectorStoreService()
         self._setup_prompt_templates()
+        
+        # Identical concurrent questions share one LLM call; all calls go through the limiter
+        self.single_flight = SingleFlight()
+        self.llm_limiter = LLMLimiter()
+        self.llm_caller = LLMCaller(limiter=self.llm_limiter)
+        self.routing_stats = {"fast": 0, "strong": 0, "fallbacks": 0}
+        self._lock = threading.Lock()  # Guards routing_stats
+        
+        # Optional multi-query / HyDE retrieval (see services/query_expansion.py)
+        self.query_expander = QueryExpander(
+            self.vector_store_service, self.expansion_llm, self.llm_caller
+        )
+        
+        # Answers shared by all processes per knowledge-base version, the query log, and
+        # pre-warming of frequent questions after corpus changes (see services/answer_cache.py).
+        # The pre-warmer starts with the first chat request, so it never runs in the
+        # pre-fork master, where no inference may happen
+        self.answer_cache = AnswerCache() if ANSWER_CACHE_ENABLED else None
+        self.query_log = QueryLog() if QUERY_LOG_ENABLED else None
+        self.prewarmer = None
+        if ANSWER_PREWARM_ENABLED and self.answer_cache and self.query_log:
+            self.prewarmer = AnswerPrewarmer(self)
+        
+        # gRPC channels are not fork-safe: pre-forked workers build their own client
+        os.register_at_fork(after_in_child=self._create_llm)
+    
+    def _create_llm(self):
+        """Create the LLM clients, one per distinct model tier."""
+        clients = {}
+        self.llms = {}
+        for tier, model_name in MODEL_TIERS.items():
+            if model_name not in clients:
+                clients[model_name] = self._build_llm_client(model_name)
+            self.llms[tier] = clients[model_name]
+        self.llm = self.llms["strong"]
+        
+        # Query rewrites are short, so they get their own fast-model client
+        self.expansion_llm = None
+        if QUERY_EXPANSION_MODE != "off":
+            self.expansion_llm = self._build_llm_client(MODEL_TIERS["fast"], QUERY_EXPANSION_MAX_TOKENS)
+        if getattr(self, "query_expander", None) is not None:
+            self.query_expander.llm = self.expansion_llm
+    
+    @staticmethod
+    def _build_llm_client(model_name: str, max_output_tokens: int = LLM_MAX_OUTPUT_TOKENS):
+        """Create a client for one model of the configured provider."""
+        return create_llm_client(model_name, max_output_tokens)
     
     def _initialize_llm(self):
         """Initialize and test the connection to the LLM."""
-        if not GOOGLE_API_KEY:
+        if LLM_PROVIDER == "google" and not GOOGLE_API_KEY:
             raise ValueError("GOOGLE_API_KEY is not set in environment variables")
             
         try:
-            self.llm = GoogleGenerativeAI(
-                model=LLM_MODEL_NAME,
-                google_api_key=GOOGLE_API_KEY,
-                temperature=LLM_TEMPERATURE,
-                top_p=LLM_TOP_P,
-                max_output_tokens=LLM_MAX_OUTPUT_TOKENS,
-                convert_system_message_to_human=True
-            )
+            self._create_llm()
             
             # Test the API connection
             self.llm.invoke("test")
@@ -114,11 +147,17 @@ class ChatService:
             input_variables=["question"]
         )
 
-    def get_response(self, message: str) -> Dict[str, Any]:
+    def get_response(self, message: str, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         """Get response for a chat message using RAG or direct LLM if no relevant docs found.
         
+        Answers cached for the current knowledge-base version are returned
+        without retrieval or LLM calls. Every question is written to the
+        query log with its timings and cache outcome.
+        
         Args:
             message: The user's chat message/question
+            deadline: Optional request deadline, checked between stages and
+                while the LLM streams; cancelling it stops the work
             
         Returns:
             Dict containing response text and source information
@@ -131,31 +170,277 @@ class ChatService:
             if not message.strip():
                 raise ValueError("Message cannot be empty")
 
-            # Check for documents in knowledge base
-            if not self._has_documents_in_knowledge_base():
-                return self._generate_direct_response(
-                    message, 
-                    prefix="I don't have any documents in my knowledge base yet, but here's what I know:\n\n"
-                )
+            deadline = deadline or Deadline()
+            self._start_prewarmer()
 
-            # Retrieve and filter relevant documents
-            relevant_docs = self._retrieve_relevant_documents(message)
-            
-            # Fall back to direct LLM if no relevant documents found
-            if not relevant_docs:
-                return self._generate_direct_response(
-                    message,
-                    prefix="I couldn't find sufficiently relevant information in my knowledge base, but here's what I know:\n\n"
-                )
+            kb_version = self._kb_version()
+            if kb_version is not None:
+                cached = self.answer_cache.get(message, kb_version)
+                if cached is not None:
+                    self._log_query(message, "hit", {})
+                    return cached
 
-            # Generate RAG response using relevant documents
-            return self._generate_rag_response(message, relevant_docs)
+            stages = {}
+            cache = "off" if kb_version is None else "miss"
+            try:
+                response = self._answer(message, deadline, stages)
+            except Exception as e:
+                self._log_query(message, cache, stages, type(e).__name__)
+                raise
+            if kb_version is not None and stages["cacheable"]:
+                self.answer_cache.put(message, kb_version, response)
+            self._log_query(message, cache, stages)
+            return response
 
+        except ABORT_ERRORS:
+            raise
         except Exception as e:
             print(f"Error in get_response: {str(e)}")
             print("Traceback:")
             print(traceback.format_exc())
             raise Exception(f"Error generating response: {str(e)}")
+
+    def prewarm_answer(self, message: str, kb_version: str) -> bool:
+        """Answer a question into the answer cache without logging it.
+        
+        Args:
+            message: The question
+            kb_version: Knowledge-base version read before answering
+            
+        Returns:
+            True if the answer was cached (degraded answers are not)
+        """
+        stages = {}
+        response = self._answer(message, Deadline(CHAT_REQUEST_TIMEOUT), stages)
+        if stages["cacheable"]:
+            self.answer_cache.put(message, kb_version, response, source="prewarm")
+        return stages["cacheable"]
+
+    def _answer(self, message: str, deadline: Deadline, stages: Dict[str, Any]) -> Dict[str, Any]:
+        """Retrieve and generate an answer, recording what happened in `stages`.
+        
+        Args:
+            message: The user's question
+            deadline: Request deadline
+            stages: Filled with "retrieval_seconds", "llm_seconds", "doc_ids"
+                (documents put in the prompt) and "cacheable" (False when
+                retrieval or the RAG answer failed and a fallback answer was
+                given), also when an exception is raised
+            
+        Returns:
+            Dict containing response text and source information
+        """
+        stages.update(retrieval_seconds=0.0, llm_seconds=0.0, doc_ids=[], cacheable=True)
+        relevant_docs = None
+        
+        # Check for documents in knowledge base, then retrieve and filter relevant documents
+        if self._has_documents_in_knowledge_base():
+            deadline.check()
+            relevant_docs = self._retrieve(message, deadline, stages)
+            deadline.check()
+        
+        started = time.perf_counter()
+        try:
+            response = self._respond(message, relevant_docs, deadline)
+        finally:
+            stages["llm_seconds"] = time.perf_counter() - started
+        if response.pop("degraded", False):
+            stages["cacheable"] = False
+        return response
+
+    def _retrieve(self, message: str, deadline: Deadline, stages: Dict[str, Any]) -> List[Document]:
+        """Retrieve relevant documents, answering without any (and uncacheable) if retrieval fails.
+        
+        Args:
+            message: The user's question
+            deadline: Request deadline
+            stages: Gets "retrieval_seconds" and "doc_ids", and "cacheable" = False on failure
+            
+        Returns:
+            List of relevant Document objects
+        """
+        started = time.perf_counter()
+        try:
+            relevant_docs = self._retrieve_relevant_documents(message, deadline)
+        except Exception as e:
+            print(f"Error retrieving documents: {str(e)}")
+            print(traceback.format_exc())
+            relevant_docs = []
+            stages["cacheable"] = False
+        stages["retrieval_seconds"] = time.perf_counter() - started
+        stages["doc_ids"] = self._doc_ids(relevant_docs)
+        return relevant_docs
+
+    def get_responses(
+        self,
+        messages: List[str],
+        max_parallel: int = CHAT_BATCH_MAX_PARALLEL,
+        deadline: Optional[Deadline] = None,
+        message_timeout: float = CHAT_REQUEST_TIMEOUT
+    ) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """Answer many messages, sharing one batched retrieval pass.
+        
+        Messages with a cached answer are answered from the cache. The other
+        queries are embedded in one model call and searched in one
+        multi-query index call; LLM calls then run with bounded parallelism
+        (and still go through the shared LLM limiter). Each message is
+        logged with the retrieval time of the whole batch. If the batched
+        search fails, the messages are answered without documents, as
+        single messages are. With query expansion enabled, each message is
+        instead searched with its rewrites in its own task, as /chat does.
+        
+        Args:
+            messages: The questions to answer
+            max_parallel: Most LLM calls in flight for this batch
+            deadline: Optional deadline for the whole batch; it is cancelled
+                if the caller stops consuming results early
+            message_timeout: Seconds each message may take once it starts
+            
+        Yields:
+            (index, result) pairs in completion order, where result is a
+            response dict or {"error": ...} for a failed message
+        """
+        self._start_prewarmer()
+        kb_version = self._kb_version()
+        cached = [None] * len(messages)
+        if kb_version is not None:
+            cached = [self.answer_cache.get(message, kb_version) for message in messages]
+        cache = "off" if kb_version is None else "miss"
+        misses = [i for i, response in enumerate(cached) if response is None]
+        
+        has_documents = bool(misses) and self._has_documents_in_knowledge_base()
+        # Rewrites take an LLM call per question, so expanded questions are searched one by one
+        expand = has_documents and self.query_expander.enabled
+        
+        started = time.perf_counter()
+        relevant = {i: None for i in misses}
+        retrieval_failed = False
+        if has_documents and not expand:
+            try:
+                all_docs_and_scores = self.vector_store_service.similarity_search_with_score_batch(
+                    [messages[i] for i in misses],
+                    k=self.vector_store_service.retrieval_k
+                )
+                for i, docs_and_scores in zip(misses, all_docs_and_scores):
+                    relevant[i] = self.vector_store_service.expand_to_parents(self._filter_relevant_documents(docs_and_scores))
+            except Exception as e:
+                print(f"Error retrieving documents for batch: {str(e)}")
+                print(traceback.format_exc())
+                relevant = {i: [] for i in misses}
+                retrieval_failed = True
+        retrieval_seconds = time.perf_counter() - started
+        
+        deadline = deadline or Deadline()
+        
+        def answer(i: int) -> Dict[str, Any]:
+            if cached[i] is not None:
+                self._log_query(messages[i], "hit", {})
+                return cached[i]
+            
+            stages = {
+                "retrieval_seconds": retrieval_seconds,
+                "doc_ids": self._doc_ids(relevant[i]),
+                "cacheable": not retrieval_failed
+            }
+            started = time.perf_counter()
+            try:
+                message_deadline = deadline.sub(message_timeout)
+                message_deadline.check()
+                relevant_docs = relevant[i]
+                if expand:
+                    relevant_docs = self._retrieve(messages[i], message_deadline, stages)
+                    message_deadline.check()
+                    started = time.perf_counter()
+                response = self._respond(messages[i], relevant_docs, message_deadline)
+            except Exception as e:
+                stages["llm_seconds"] = time.perf_counter() - started
+                self._log_query(messages[i], cache, stages, type(e).__name__)
+                if isinstance(e, LLMOverloadedError):
+                    return {"error": str(e), "retry_after": e.retry_after}
+                print(f"Error answering batch message {i}: {str(e)}")
+                return {"error": f"Error generating response: {str(e)}"}
+            stages["llm_seconds"] = time.perf_counter() - started
+            
+            if response.pop("degraded", False):
+                stages["cacheable"] = False
+            if kb_version is not None and stages["cacheable"]:
+                self.answer_cache.put(messages[i], kb_version, response)
+            self._log_query(messages[i], cache, stages)
+            return response
+        
+        executor = ThreadPoolExecutor(max_workers=max_parallel)
+        try:
+            futures = {executor.submit(answer, i): i for i in range(len(messages))}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            # Stops the running work and drops queued messages if the consumer went away early
+            deadline.cancel()
+            executor.shutdown(cancel_futures=True)
+
+    def _start_prewarmer(self):
+        """Start the pre-warmer's polling thread in this (serving) process, once."""
+        if self.prewarmer is not None:
+            self.prewarmer.start()
+
+    def _kb_version(self) -> Optional[str]:
+        """Return the knowledge-base version answers are cached under, or None without an answer cache."""
+        if self.answer_cache is None:
+            return None
+        return get_kb_version()[0]
+
+    @staticmethod
+    def _doc_ids(relevant_docs: Optional[List[Document]]) -> List[str]:
+        """Return the distinct doc_ids of the documents put in the prompt, in order."""
+        return list(dict.fromkeys(doc.metadata.get("doc_id", "") for doc in relevant_docs or []))
+
+    def _log_query(self, message: str, cache: str, stages: Dict[str, Any], status: str = "ok"):
+        """Append a question to the query log, if enabled."""
+        if self.query_log is None:
+            return
+        self.query_log.record(
+            message,
+            stages.get("retrieval_seconds", 0.0),
+            stages.get("llm_seconds", 0.0),
+            stages.get("doc_ids", []),
+            cache,
+            status
+        )
+
+    def _respond(
+        self,
+        message: str,
+        relevant_docs: Optional[List[Document]],
+        deadline: Optional[Deadline] = None
+    ) -> Dict[str, Any]:
+        """Generate the answer once retrieval is done.
+        
+        Args:
+            message: The user's question
+            relevant_docs: Documents that passed the relevance filter,
+                or None when the knowledge base is empty
+            deadline: Optional request deadline
+            
+        Returns:
+            Dict containing response text and source information
+        """
+        if relevant_docs is None:
+            return self._generate_direct_response(
+                message, 
+                prefix="I don't have any documents in my knowledge base yet, but here's what I know:\n\n",
+                deadline=deadline
+            )
+
+        # Fall back to direct LLM if no relevant documents found
+        if not relevant_docs:
+            return self._generate_direct_response(
+                message,
+                prefix="I couldn't find sufficiently relevant information in my knowledge base, but here's what I know:\n\n",
+                deadline=deadline
+            )
+
+        # Generate RAG response using relevant documents
+        return self._generate_rag_response(message, relevant_docs, deadline)
     
     def _has_documents_in_knowledge_base(self) -> bool:
         """Check if there are any documents in the knowledge base.
@@ -163,112 +448,241 @@ class ChatService:
         Returns:
             True if documents exist, False otherwise
         """
-        collection = self.vector_store_service.client.get_collection("documents")
-        doc_count = collection.count()
+        doc_count = self.vector_store_service.count()
         print(f"Document count in knowledge base: {doc_count}")
         return doc_count > 0
     
-    def _retrieve_relevant_documents(self, query: str) -> List[Document]:
+    def _retrieve_relevant_documents(self, query: str, deadline: Optional[Deadline] = None) -> List[Document]:
         """Retrieve documents relevant to the query from the vector store.
         
+        With query expansion enabled, rewrites of the query are searched too
+        (within the expansion latency budget) and the results fused.
+        
         Args:
             query: The user's question/message
+            deadline: Optional request deadline
             
         Returns:
-            List of relevant Document objects
-        """
-        try:
-            print(f"Searching for relevant documents for query: {query}")
-            docs_and_scores = self.vector_store_service.vector_store.similarity_search_with_score(
-                query,
-                k=VECTOR_SEARCH_TOP_K
-            )
+            List of relevant Document objects (parent sections of the
+            matching chunks when small-to-big retrieval is enabled)
             
-            # Log scores for debugging/tuning
-            if docs_and_scores:
-                scores = [score for _, score in docs_and_scores]
-                avg_score = sum(scores) / len(scores)
-                max_score = max(scores)
-                print(f"Document scores - Avg: {avg_score:.4f}, Max: {max_score:.4f}")
-                for i, (_, score) in enumerate(docs_and_scores):
-                    print(f"  Doc {i+1} score: {score:.4f}")
-            
-            # Filter documents based on similarity threshold
-            relevant_docs = [doc for doc, score in docs_and_scores if score >= SIMILARITY_THRESHOLD]
-            print(f"Found {len(relevant_docs)}/{len(docs_and_scores)} documents with score >= {SIMILARITY_THRESHOLD}")
+        Raises:
+            Exception: Search errors; the caller answers without documents
+        """
+        print(f"Searching for relevant documents for query: {query}")
+        docs_and_scores = self.query_expander.search(query, self.vector_store_service.retrieval_k, deadline)
+        return self.vector_store_service.expand_to_parents(self._filter_relevant_documents(docs_and_scores))
+    
+    def _filter_relevant_documents(self, docs_and_scores: List[Tuple[Document, float]]) -> List[Document]:
+        """Log search scores and keep the documents that pass the similarity threshold.
+        
+        Args:
+            docs_and_scores: (Document, cosine distance) pairs from the vector store
             
-            return relevant_docs
-
-        except Exception as e:
-            print(f"Error retrieving documents: {str(e)}")
-            print(traceback.format_exc())
-            return []
+        Returns:
+            List of relevant Document objects
+        """
+        # Index scores are cosine distances (lower is closer); the threshold applies to similarity
+        similarities = [1 - score for _, score in docs_and_scores]
+        
+        # Log scores for debugging/tuning
+        if similarities:
+            avg_similarity = sum(similarities) / len(similarities)
+            max_similarity = max(similarities)
+            print(f"Document similarities - Avg: {avg_similarity:.4f}, Max: {max_similarity:.4f}")
+            for i, similarity in enumerate(similarities):
+                print(f"  Doc {i+1} similarity: {similarity:.4f}")
+        
+        # Filter documents based on similarity threshold
+        relevant_docs = [
+            doc for (doc, _), similarity in zip(docs_and_scores, similarities) if similarity >= SIMILARITY_THRESHOLD
+        ]
+        print(f"Found {len(relevant_docs)}/{len(docs_and_scores)} documents with similarity >= {SIMILARITY_THRESHOLD}")
+        
+        return relevant_docs
     
-    def _generate_direct_response(self, question: str, prefix: str = "") -> Dict[str, Any]:
+    def _generate_direct_response(
+        self,
+        question: str,
+        prefix: str = "",
+        deadline: Optional[Deadline] = None
+    ) -> Dict[str, Any]:
         """Generate a response directly from the LLM (no RAG).
         
         Args:
             question: The user's question
             prefix: Optional prefix to add to the response
+            deadline: Optional request deadline
             
         Returns:
             Dict with response text and empty sources list
         """
         print("Generating direct LLM response (no RAG)")
-        direct_chain = LLMChain(llm=self.llm, prompt=self.direct_prompt_template)
-        result = direct_chain.invoke({"question": question})
+        prompt = self.direct_prompt_template.format(question=question)
+        tier = self._choose_model_tier(question, [])
+        text = self._invoke_llm(prompt, ("direct", self._normalize_query(question)), deadline, tier)
         
         return {
-            "response": prefix + result["text"],
+            "response": prefix + text,
             "sources": EMPTY_SOURCES
         }
     
-    def _generate_rag_response(self, question: str, relevant_docs: List[Document]) -> Dict[str, Any]:
+    def _generate_rag_response(
+        self,
+        question: str,
+        relevant_docs: List[Document],
+        deadline: Optional[Deadline] = None
+    ) -> Dict[str, Any]:
         """Generate a response using RAG with the given documents.
         
         Args:
             question: The user's question
             relevant_docs: List of relevant documents to use for generating the response
+            deadline: Optional request deadline
             
         Returns:
             Dict with response text and source information
         """
         print(f"Generating RAG response with {len(relevant_docs)} documents")
         
-        # Create retriever from filtered documents
-        retriever = PreFilteredRetriever(filtered_docs = relevant_docs)
-        
-        # Create and invoke QA chain
         try:
-            qa_chain = RetrievalQA.from_chain_type(
-                llm=self.llm,
-                chain_type="stuff",
-                retriever=retriever,
-                return_source_documents=True,
-                chain_type_kwargs={"prompt": self.prompt_template}
-            )
+            # "Stuff" the documents into the prompt, as RetrievalQA did
+            context = "\n\n".join(doc.page_content for doc in relevant_docs)
+            prompt = self.prompt_template.format(context=context, question=question)
             
-            print("Invoking QA chain")
-            result = qa_chain.invoke({"query": question})
-            print("QA chain invocation successful")
+            # Same question over the same chunks -> same answer
+            key = (
+                "rag",
+                self._normalize_query(question),
+                tuple(doc.metadata.get("split_id") or doc.page_content for doc in relevant_docs)
+            )
+            tier = self._choose_model_tier(question, relevant_docs)
+            text = self._invoke_llm(prompt, key, deadline, tier)
             
             # Format response with sources
-            sources = self._extract_sources_from_result(result)
+            sources = self._extract_sources_from_result({"source_documents": relevant_docs})
             
             return {
-                "response": result["result"],
+                "response": text,
                 "sources": sources
             }
             
+        except ABORT_ERRORS:
+            raise
         except Exception as e:
             print(f"Error in RAG response generation: {str(e)}")
             print(traceback.format_exc())
             
-            # Fall back to direct response on RAG failure
-            return self._generate_direct_response(
+            # Fall back to direct response on RAG failure; "degraded" keeps it out of the answer cache
+            response = self._generate_direct_response(
                 question, 
-                prefix="I encountered an error accessing my knowledge base, but here's what I know:\n\n"
+                prefix="I encountered an error accessing my knowledge base, but here's what I know:\n\n",
+                deadline=deadline
             )
+            response["degraded"] = True
+            return response
+    
+    def _choose_model_tier(self, question: str, relevant_docs: List[Document]) -> str:
+        """Pick the model tier from cheap request signals.
+        
+        Answers without knowledge-base context, and short questions over a
+        small context, go to the fast model; long questions or large
+        contexts go to the strong model.
+        
+        Args:
+            question: The user's question
+            relevant_docs: Documents that will be put in the prompt
+            
+        Returns:
+            "fast" or "strong"
+        """
+        if not relevant_docs:
+            return "fast"
+        if len(question.split()) >= ROUTE_STRONG_MIN_QUERY_WORDS:
+            return "strong"
+        if sum(len(doc.page_content) for doc in relevant_docs) >= ROUTE_STRONG_MIN_CONTEXT_CHARS:
+            return "strong"
+        return "fast"
+    
+    def _generate_with_fallback(self, prompt: str, tier: str, deadline: Deadline) -> str:
+        """Generate with the chosen tier's model, falling back to the other on timeout or error."""
+        other = "strong" if tier == "fast" else "fast"
+        if self.llms[tier] is self.llms[other]:
+            return self.llm_caller.generate(self.llms[tier], prompt, deadline)
+        
+        try:
+            return self.llm_caller.generate(self.llms[tier], prompt, deadline.sub(FALLBACK_AFTER[tier]))
+        except (LLMOverloadedError, RequestCancelledError):
+            raise
+        except Exception as e:
+            # Give up if the request itself is out of time; otherwise try the other model
+            deadline.check()
+            print(f"{MODEL_TIERS[tier]} failed ({type(e).__name__}: {e}); falling back to {MODEL_TIERS[other]}")
+            with self._lock:
+                self.routing_stats["fallbacks"] += 1
+            return self.llm_caller.generate(self.llms[other], prompt, deadline)
+    
+    def _invoke_llm(
+        self,
+        prompt: str,
+        key: Tuple,
+        deadline: Optional[Deadline] = None,
+        tier: str = "strong"
+    ) -> str:
+        """Call the LLM, coalescing with identical in-flight calls and respecting limits.
+        
+        Args:
+            prompt: The fully formatted prompt
+            key: Identity of the request; concurrent calls with the same key share one LLM call
+            deadline: Optional request deadline; the call stops when it is cancelled or expires
+            tier: Model tier to use first ("fast" or "strong")
+            
+        Returns:
+            The generated text
+            
+        Raises:
+            LLMOverloadedError: If the LLM call queue is full or the wait times out
+            RequestCancelledError, DeadlineExceededError: From the request deadline
+        """
+        deadline = deadline or Deadline()
+        
+        def call():
+            with self._lock:
+                self.routing_stats[tier] += 1
+            return self._generate_with_fallback(prompt, tier, deadline)
+        
+        while True:
+            try:
+                return self.single_flight.do(key, call, deadline)
+            except (DeadlineExceededError, RequestCancelledError):
+                # A coalesced call stopped for its leader's deadline; retry
+                # (as the new leader) if this request still has time
+                deadline.check()
+    
+    @staticmethod
+    def _normalize_query(query: str) -> str:
+        """Normalize a query for coalescing: case- and whitespace-insensitive."""
+        return normalize_question(query)
+    
+    def metrics(self) -> Dict[str, Any]:
+        """Return LLM queue, coalescing, retrieval, answer cache and embedding scheduler metrics."""
+        with self._lock:
+            routing = dict(self.routing_stats)
+        return {
+            "llm": self.llm_limiter.stats(),
+            "coalescing": self.single_flight.stats(),
+            "generation": self.llm_caller.stats(),
+            "routing": {**routing, "models": MODEL_TIERS},
+            "query_expansion": self.query_expander.stats(),
+            "question_index": self.vector_store_service.question_index_stats(),
+            "near_duplicates": self.vector_store_service.duplicate_stats(),
+            "query_log": self.query_log.stats() if self.query_log else {"enabled": False},
+            "answer_cache": {
+                **(self.answer_cache.stats() if self.answer_cache else {"enabled": False}),
+                "prewarm": self.prewarmer.stats() if self.prewarmer else {"enabled": False}
+            },
+            "embedding": self.vector_store_service.embedding_model.stats()
+        }
     
     def _extract_sources_from_result(self, result: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Extract and format source information from the QA result.
@@ -0,0 +1,318 @@
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain.docstore.document import Document
+
+from config.settings import (
+    CHUNK_OVERLAP_TOKENS,
+    CHUNK_PARALLEL_MIN_CHARS,
+    CHUNK_PARALLEL_SEGMENT_CHARS,
+    CHUNK_TOKENIZER,
+    CHUNK_TOKENS,
+    CHUNK_WORKERS
+)
+
+# Markdown-style heading lines; DocumentService.process_url renders HTML headings this way
+HEADING_PATTERN = re.compile(r"^(#{1,6})[ \t]+(.+)$", re.MULTILINE)
+# CSVLoader renders each row as "column: value" lines
+CSV_ROW_SEPARATOR = "\n\n"
+
+# A unit is one structural piece of a document: ("text", text, metadata) is split
+# recursively, ("rows", [row texts], metadata) is packed row by row
+Unit = Tuple[str, Any, Dict[str, Any]]
+
+_tokenizer = None
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_tokenizer():
+    """Return the embedding model's tokenizer (loaded once per process)."""
+    global _tokenizer
+    if _tokenizer is None:
+        from transformers import AutoTokenizer
+        # Use the Rust tokenizer directly: no truncation, no "sequence too long" warnings
+        _tokenizer = AutoTokenizer.from_pretrained(CHUNK_TOKENIZER).backend_tokenizer
+        _tokenizer.no_truncation()
+        _tokenizer.no_padding()
+    return _tokenizer
+
+
+def count_tokens(text: str) -> int:
+    """Number of embedding-model tokens in text, without special tokens."""
+    return len(get_tokenizer().encode(text, add_special_tokens=False).ids)
+
+
+def _break_priority(text: str, offsets: List[Tuple[int, int]], index: int) -> int:
+    """How good a chunk boundary is before token `index`: paragraph break (4),
+    line break (3), sentence end (2), other whitespace (1), or mid-word (0)."""
+    gap = text[offsets[index - 1][1]:offsets[index][0]]
+    if not gap:
+        return 0
+    if "\n\n" in gap:
+        return 4
+    if "\n" in gap:
+        return 3
+    if text[offsets[index - 1][1] - 1] in ".!?":
+        return 2
+    return 1
+
+
+def _split_text(text: str, chunk_tokens: int, overlap_tokens: int) -> List[Tuple[str, int]]:
+    """Split text into (chunk, token count) pieces of at most chunk_tokens tokens.
+
+    The text is tokenized once; each chunk ends at the best boundary (see
+    _break_priority) in the second half of its token window, and the next
+    chunk starts up to overlap_tokens earlier, at a word boundary.
+    """
+    offsets = get_tokenizer().encode(text, add_special_tokens=False).offsets
+    total = len(offsets)
+    if total <= chunk_tokens:
+        stripped = text.strip()
+        return [(stripped, total)] if stripped else []
+
+    chunks = []
+    start = 0
+    while start < total:
+        end = min(start + chunk_tokens, total)
+        if end < total:
+            best, best_priority = end, -1
+            for candidate in range(end, start + max(1, chunk_tokens // 2) - 1, -1):
+                priority = _break_priority(text, offsets, candidate)
+                if priority > best_priority:
+                    best, best_priority = candidate, priority
+                    if priority == 4:
+                        break
+            end = best
+        chunks.append((text[offsets[start][0]:offsets[end - 1][1]].strip(), end - start))
+        if end == total:
+            break
+
+        next_start = max(end - overlap_tokens, start + 1)
+        while next_start < end and _break_priority(text, offsets, next_start) == 0:
+            next_start += 1
+        start = next_start
+    return chunks
+
+
+def _split_units(units: List[Unit], chunk_tokens: int, overlap_tokens: int) -> List[Tuple[str, Dict[str, Any]]]:
+    """Split structural units into (text, metadata) chunks with token counts.
+
+    Runs in-process or in a splitter process.
+    """
+    chunks = []
+    for kind, payload, metadata in units:
+        if kind == "rows":
+            chunks.extend(_pack_rows(payload, metadata, chunk_tokens, overlap_tokens))
+            continue
+        for text, token_count in _split_text(payload, chunk_tokens, overlap_tokens):
+            chunks.append((text, {**metadata, "token_count": token_count}))
+    return chunks
+
+
+def _pack_rows(
+    rows: List[str],
+    metadata: Dict[str, Any],
+    chunk_tokens: int,
+    overlap_tokens: int
+) -> List[Tuple[str, Dict[str, Any]]]:
+    """Pack whole CSV rows into chunks; only a row larger than a chunk is split."""
+    chunks = []
+    separator_tokens = count_tokens(CSV_ROW_SEPARATOR)
+    row_token_counts = [len(e.ids) for e in get_tokenizer().encode_batch(rows, add_special_tokens=False)]
+    first_row = metadata.get("row", 0)
+    current: List[str] = []
+    current_tokens = 0
+    current_start = first_row
+
+    def flush():
+        text = CSV_ROW_SEPARATOR.join(current)
+        chunks.append((text, {
+            **metadata,
+            "row": current_start,
+            "row_count": len(current),
+            "token_count": current_tokens
+        }))
+
+    for offset, (row, row_tokens) in enumerate(zip(rows, row_token_counts)):
+        if row_tokens > chunk_tokens:
+            if current:
+                flush()
+                current, current_tokens = [], 0
+            for text, token_count in _split_text(row, chunk_tokens, overlap_tokens):
+                chunks.append((text, {
+                    **metadata,
+                    "row": first_row + offset,
+                    "row_count": 1,
+                    "token_count": token_count
+                }))
+            continue
+
+        added_tokens = row_tokens + (separator_tokens if current else 0)
+        if current and current_tokens + added_tokens > chunk_tokens:
+            flush()
+            current, current_tokens, added_tokens = [], 0, row_tokens
+        if not current:
+            current_start = first_row + offset
+        current.append(row)
+        current_tokens += added_tokens
+
+    if current:
+        flush()
+    return chunks
+
+
+def _reset_pool_after_fork():
+    # The parent's worker processes and their pipes belong to the parent
+    global _pool
+    _pool = None
+
+
+os.register_at_fork(after_in_child=_reset_pool_after_fork)
+
+
+class TokenChunker:
+    """Split loaded documents into chunks sized in embedding-model tokens.
+
+    Chunks never cross structural boundaries:
+    - PDF pages (PyPDFLoader yields one document per page)
+    - Markdown-style headings in text and URL content; each chunk records
+      its heading in metadata["section"]
+    - CSV rows: whole rows are packed into chunks (metadata "row" and
+      "row_count"); a row is only split if it is larger than a chunk
+
+    Every chunk records metadata["token_count"]. Large inputs are split in
+    parallel by spawned worker processes.
+    """
+
+    def __init__(
+        self,
+        chunk_tokens: int = CHUNK_TOKENS,
+        overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+        workers: int = CHUNK_WORKERS
+    ):
+        """Create a chunker.
+
+        Args:
+            chunk_tokens: Largest chunk size in tokens
+            overlap_tokens: Tokens shared by neighbouring chunks of the same unit
+            workers: Splitter processes for large inputs; 0 = up to 4, one per CPU
+        """
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.workers = workers or min(4, os.cpu_count() or 1)
+
+    def split_documents(self, documents: List[Document]) -> List[Document]:
+        """Split documents into chunks, preserving their metadata.
+
+        Args:
+            documents: Loaded documents (with metadata already attached)
+
+        Returns:
+            Chunk documents in source order
+        """
+        units = self._structure_units(documents)
+        total_chars = sum(
+            len(payload) if kind == "text" else sum(map(len, payload)) for kind, payload, _ in units
+        )
+
+        if self.workers > 1 and total_chars >= CHUNK_PARALLEL_MIN_CHARS:
+            chunks = self._split_parallel(units)
+        else:
+            chunks = _split_units(units, self.chunk_tokens, self.overlap_tokens)
+        return [Document(page_content=text, metadata=metadata) for text, metadata in chunks]
+
+    def _structure_units(self, documents: List[Document]) -> List[Unit]:
+        units: List[Unit] = []
+        rows: List[str] = []
+        rows_metadata: Optional[Dict[str, Any]] = None
+
+        for doc in documents:
+            metadata = dict(doc.metadata)
+            if metadata.get("source_type") == "csv":
+                # Consecutive rows of the same document (and parent section) are packed together
+                group = (metadata.get("doc_id"), metadata.get("parent_id"))
+                if rows_metadata is not None and (rows_metadata.get("doc_id"), rows_metadata.get("parent_id")) != group:
+                    units.append(("rows", rows, rows_metadata))
+                    rows, rows_metadata = [], None
+                if rows_metadata is None:
+                    rows_metadata = metadata
+                # A packed chunk (e.g. a parent section) is split back into its rows
+                rows.extend(doc.page_content.split(CSV_ROW_SEPARATOR))
+                continue
+
+            if rows_metadata is not None:
+                units.append(("rows", rows, rows_metadata))
+                rows, rows_metadata = [], None
+            for section, text in _split_sections(doc.page_content):
+                section_metadata = {**metadata, "section": section} if section else metadata
+                units.extend(("text", segment, section_metadata) for segment in _segments(text))
+
+        if rows_metadata is not None:
+            units.append(("rows", rows, rows_metadata))
+        return units
+
+    def _split_parallel(self, units: List[Unit]) -> List[Tuple[str, Dict[str, Any]]]:
+        global _pool
+        if _pool is None:
+            # Spawn, not fork: the parent holds torch threads and model state
+            _pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=get_tokenizer
+            )
+
+        # Hand out roughly equal amounts of text, a few batches per worker
+        target_chars = max(CHUNK_PARALLEL_SEGMENT_CHARS, CHUNK_PARALLEL_MIN_CHARS // (self.workers * 4))
+        batches: List[List[Unit]] = [[]]
+        batch_chars = 0
+        for unit in units:
+            if batch_chars >= target_chars:
+                batches.append([])
+                batch_chars = 0
+            batches[-1].append(unit)
+            batch_chars += len(unit[1]) if unit[0] == "text" else sum(map(len, unit[1]))
+
+        results = _pool.map(
+            _split_units,
+            batches,
+            [self.chunk_tokens] * len(batches),
+            [self.overlap_tokens] * len(batches)
+        )
+        return [chunk for batch in results for chunk in batch]
+
+
+def _split_sections(text: str) -> List[Tuple[Optional[str], str]]:
+    """Split text at Markdown-style heading lines into (heading, text) sections."""
+    matches = list(HEADING_PATTERN.finditer(text))
+    if not matches:
+        return [(None, text)]
+
+    sections = []
+    if text[:matches[0].start()].strip():
+        sections.append((None, text[:matches[0].start()]))
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        if text[match.start():end].strip():
+            sections.append((match.group(2).strip(), text[match.start():end]))
+    return sections
+
+
+def _segments(text: str) -> List[str]:
+    """Cut very long text at paragraph breaks so it can be split in parallel."""
+    if len(text) <= CHUNK_PARALLEL_SEGMENT_CHARS:
+        return [text]
+    segments = []
+    start = 0
+    while len(text) - start > CHUNK_PARALLEL_SEGMENT_CHARS:
+        cut = text.rfind("\n\n", start, start + CHUNK_PARALLEL_SEGMENT_CHARS)
+        if cut <= start:
+            cut = text.rfind("\n", start, start + CHUNK_PARALLEL_SEGMENT_CHARS)
+        if cut <= start:
+            cut = start + CHUNK_PARALLEL_SEGMENT_CHARS
+        segments.append(text[start:cut])
+        start = cut
+    segments.append(text[start:])
+    return segments
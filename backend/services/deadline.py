@@ -0,0 +1,67 @@
+import threading
+import time
+from typing import Optional
+
+
+class DeadlineExceededError(Exception):
+    """Raised when a request runs out of time; maps to HTTP 504."""
+
+
+class RequestCancelledError(Exception):
+    """Raised when a request is cancelled, e.g. because the client disconnected."""
+
+
+class Deadline:
+    """A per-request time budget that can also be cancelled from another thread.
+
+    Services call check() between stages (and between streamed LLM chunks) to
+    stop work nobody is waiting for any more.
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        """Create a deadline.
+
+        Args:
+            timeout: Seconds from now, or None for no time limit
+        """
+        self.expires_at = time.monotonic() + timeout if timeout is not None else None
+        self._cancelled = threading.Event()
+
+    def sub(self, timeout: float) -> "Deadline":
+        """Return a deadline for one step: at most timeout seconds, never
+        later than this one, and cancelled together with it."""
+        child = Deadline(timeout)
+        if self.expires_at is not None:
+            child.expires_at = min(child.expires_at, self.expires_at)
+        child._cancelled = self._cancelled
+        return child
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left (never negative), or None without a time limit."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def cancel(self):
+        """Cancel the request; the next check() raises RequestCancelledError."""
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def check(self):
+        """Raise if the request was cancelled or is out of time.
+
+        Raises:
+            RequestCancelledError: If cancel() was called
+            DeadlineExceededError: If the deadline has passed
+        """
+        if self.cancelled:
+            raise RequestCancelledError("Request was cancelled")
+        if self.expired:
+            raise DeadlineExceededError("Request deadline exceeded")
@@ -0,0 +1,447 @@
+import json
+import re
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from langchain.docstore.document import Document
+
+from config.database import get_db
+from config.settings import (
+    DB_PATH,
+    NEAR_DUPLICATE_BANDS,
+    NEAR_DUPLICATE_MATCH_NUMBERS,
+    NEAR_DUPLICATE_NUM_PERM,
+    NEAR_DUPLICATE_SHINGLE_WORDS,
+    NEAR_DUPLICATE_THRESHOLD
+)
+from services.vector_index import VectorIndex
+
+WORD = re.compile(r"\w+")
+# Words carrying values: VLANs, addresses, ports, versions, serial numbers
+NUMBER = re.compile(r"\w*\d[\w.:/-]*")
+
+
+class MinHasher:
+    """MinHash signatures of word shingles, and their LSH band buckets.
+
+    Two signatures agree in a position with probability equal to the
+    Jaccard similarity of the chunks' shingle sets. Chunks whose signatures
+    agree on a whole band of rows share that band's bucket, so candidates
+    for a near-duplicate are found by bucket lookup instead of comparing
+    against every chunk. The hash functions come from a fixed seed:
+    signatures stay comparable across processes and restarts.
+    """
+
+    def __init__(
+        self,
+        num_perm: int = NEAR_DUPLICATE_NUM_PERM,
+        shingle_words: int = NEAR_DUPLICATE_SHINGLE_WORDS,
+        bands: int = NEAR_DUPLICATE_BANDS,
+        seed: int = 1
+    ):
+        """Create a MinHasher.
+
+        Args:
+            num_perm: Signature length
+            shingle_words: Words per shingle
+            bands: LSH bands; num_perm must be a multiple of it
+            seed: Seed of the hash functions
+        """
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.num_perm = num_perm
+        self.shingle_words = shingle_words
+        self.bands = bands
+        rng = np.random.default_rng(seed)
+        # Multiply-add-shift hashing of 32-bit shingle hashes, one (a, b) pair per permutation
+        self._a = rng.integers(1, 2**64, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2**64, size=num_perm, dtype=np.uint64)
+        self._band_weights = rng.integers(1, 2**64, size=(bands, num_perm // bands), dtype=np.uint64) | np.uint64(1)
+
+    def shingles(self, text: str) -> np.ndarray:
+        """Return the 32-bit hashes of a text's word shingles."""
+        words = WORD.findall(text.lower())
+        n = self.shingle_words
+        grams = {" ".join(words[i:i + n]) for i in range(max(1, len(words) - n + 1))}
+        return np.fromiter((zlib.crc32(gram.encode()) for gram in grams), dtype=np.uint64, count=len(grams))
+
+    def signatures(self, texts: Sequence[str]) -> np.ndarray:
+        """Return one MinHash signature (uint32 row) per text."""
+        signatures = np.empty((len(texts), self.num_perm), dtype=np.uint32)
+        for i, text in enumerate(texts):
+            hashes = self.shingles(text)[:, None] * self._a + self._b
+            signatures[i] = (hashes >> np.uint64(32)).min(axis=0)
+        return signatures
+
+    def buckets(self, signatures: np.ndarray) -> np.ndarray:
+        """Return the LSH bucket of every band of each signature, as int64 (n, bands)."""
+        rows = signatures.astype(np.uint64).reshape(len(signatures), self.bands, -1)
+        return (rows * self._band_weights).sum(axis=2).view(np.int64)
+
+    @staticmethod
+    def numbers_hash(text: str) -> int:
+        """Return a hash of the set of number-bearing words in a text."""
+        return zlib.crc32(" ".join(sorted(set(NUMBER.findall(text.lower())))).encode())
+
+    @staticmethod
+    def similarity(a: np.ndarray, b: np.ndarray) -> float:
+        """Estimated Jaccard similarity of two signatures."""
+        return float(np.mean(a == b))
+
+
+class DuplicateStore:
+    """Near-duplicate chunk records for ingestion-time deduplication.
+
+    Every chunk added to the "documents" index gets a MinHash signature
+    and LSH buckets in the SQLite database. A new chunk similar to one of
+    them (and, with match_numbers, containing the same numbers) is stored
+    here as an alias of that canonical chunk (its own text and metadata, no
+    embedding) instead of being embedded and indexed.
+    Searches then find the canonical copy once. When the canonical chunk's
+    document is deleted, an alias from another document takes its place
+    in the index with the same embedding (see release).
+    """
+
+    def __init__(
+        self,
+        db_path: Path = DB_PATH,
+        hasher: Optional[MinHasher] = None,
+        threshold: float = NEAR_DUPLICATE_THRESHOLD,
+        match_numbers: bool = NEAR_DUPLICATE_MATCH_NUMBERS
+    ):
+        """Create a duplicate store.
+
+        Args:
+            db_path: SQLite database holding the chunk_signatures tables
+            hasher: MinHasher; defaults to the configured parameters
+            threshold: Smallest estimated Jaccard similarity of a near-duplicate
+            match_numbers: Only alias chunks containing the same numbers
+        """
+        self.db_path = db_path
+        self.hasher = hasher or MinHasher()
+        self.threshold = threshold
+        self.match_numbers = match_numbers
+
+    # ==========================================
+    # Ingestion
+    # ==========================================
+
+    def find_canonicals(self, chunks: List[Document], signatures: np.ndarray) -> List[Optional[str]]:
+        """Find the canonical chunk each new chunk duplicates, if any.
+
+        New chunks are compared with the stored canonical chunks and with
+        earlier new chunks of the same batch, so repeats within a document
+        are caught too.
+
+        Args:
+            chunks: New chunks with split_id metadata
+            signatures: Their MinHash signatures
+
+        Returns:
+            Per chunk, the split_id of its canonical chunk, or None if it is new
+        """
+        buckets = self.hasher.buckets(signatures)
+        numbers = [self.hasher.numbers_hash(chunk.page_content) for chunk in chunks]
+        stored = self._lookup_buckets(buckets.ravel().tolist())
+        stored_signatures = self._get_signatures({sid for ids in stored.values() for sid in ids}, canonical_only=True)
+
+        canonicals: List[Optional[str]] = []
+        batch_buckets: Dict[int, List[int]] = {}
+        for i, row in enumerate(buckets.tolist()):
+            best, best_similarity = None, self.threshold
+            candidates = {split_id for bucket in row for split_id in stored.get(bucket, ())}
+            for split_id in candidates & stored_signatures.keys():
+                signature, numbers_hash = stored_signatures[split_id]
+                if self.match_numbers and numbers_hash != numbers[i]:
+                    continue
+                similarity = self.hasher.similarity(signatures[i], signature)
+                if similarity >= best_similarity:
+                    best, best_similarity = split_id, similarity
+            for j in {j for bucket in row for j in batch_buckets.get(bucket, ())}:
+                if self.match_numbers and numbers[j] != numbers[i]:
+                    continue
+                similarity = self.hasher.similarity(signatures[i], signatures[j])
+                if similarity >= best_similarity:
+                    best, best_similarity = chunks[j].metadata["split_id"], similarity
+            if best is None:
+                for bucket in row:
+                    batch_buckets.setdefault(bucket, []).append(i)
+            canonicals.append(best)
+        return canonicals
+
+    def add(self, chunks: List[Document], signatures: np.ndarray, canonical_ids: List[Optional[str]]):
+        """Record indexed chunks (canonical_id None) and aliases of canonical chunks.
+
+        Args:
+            chunks: Chunk documents with split_id and doc_id metadata
+            signatures: Their MinHash signatures
+            canonical_ids: Per chunk, the canonical chunk it duplicates, or None
+        """
+        rows, bands = [], []
+        for chunk, signature, canonical_id, buckets in zip(
+            chunks, signatures, canonical_ids, self.hasher.buckets(signatures).tolist()
+        ):
+            split_id = chunk.metadata["split_id"]
+            row = (
+                split_id,
+                chunk.metadata["doc_id"],
+                signature.astype("<u4").tobytes(),
+                self.hasher.numbers_hash(chunk.page_content)
+            )
+            if canonical_id is None:
+                rows.append(row + (None, None, None))
+                bands.extend((bucket, split_id) for bucket in buckets)
+            else:
+                rows.append(row + (canonical_id, chunk.page_content, json.dumps(chunk.metadata)))
+        with get_db(self.db_path) as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO chunk_signatures "
+                "(split_id, doc_id, signature, numbers_hash, canonical_id, text, metadata) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            conn.executemany("INSERT OR IGNORE INTO chunk_signature_bands (bucket, split_id) VALUES (?, ?)", bands)
+            conn.commit()
+
+    # ==========================================
+    # Deletion
+    # ==========================================
+
+    def release(self, doc_ids: List[str], index: VectorIndex) -> Tuple[List[Document], int]:
+        """Delete the records of documents before their chunks leave the index.
+
+        An indexed chunk of these documents that other documents' chunks are
+        aliased to is replaced in the index by one of those aliases (under
+        its own id and metadata, with the canonical chunk's embedding); the
+        remaining aliases point to it. Call with the index write lock held,
+        then delete the documents' chunks from the index.
+
+        Args:
+            doc_ids: Documents being deleted
+            index: The "documents" index
+
+        Returns:
+            The promoted chunks, and the number of aliases deleted with the documents
+        """
+        deleted_docs = set(doc_ids)
+        canonical_ids = []
+        for start in range(0, len(doc_ids), 500):
+            canonical_ids += index.get(where={"doc_id": {"$in": doc_ids[start:start + 500]}})["ids"]
+
+        aliases: Dict[str, List[Tuple[str, Document]]] = {}
+        with get_db(self.db_path) as conn:
+            for start in range(0, len(canonical_ids), 900):
+                batch = canonical_ids[start:start + 900]
+                for split_id, doc_id, canonical_id, text, metadata in conn.execute(
+                    "SELECT split_id, doc_id, canonical_id, text, metadata FROM chunk_signatures "
+                    f"WHERE canonical_id IN ({','.join('?' * len(batch))}) ORDER BY split_id",
+                    batch
+                ):
+                    if doc_id not in deleted_docs:
+                        aliases.setdefault(canonical_id, []).append(
+                            (split_id, Document(page_content=text, metadata=json.loads(metadata)))
+                        )
+
+        promoted: List[Document] = []
+        if aliases:
+            embeddings = {}
+            old_ids = list(aliases)
+            for start in range(0, len(old_ids), 900):
+                fetched = index.get(ids=old_ids[start:start + 900], include_embeddings=True)
+                embeddings.update(zip(fetched["ids"], fetched["embeddings"]))
+            replacements = {
+                canonical_id: group[0] for canonical_id, group in aliases.items() if canonical_id in embeddings
+            }
+            if replacements:
+                promoted = [chunk for _, chunk in replacements.values()]
+                index.add(
+                    ids=[split_id for split_id, _ in replacements.values()],
+                    embeddings=[embeddings[canonical_id] for canonical_id in replacements],
+                    texts=[chunk.page_content for chunk in promoted],
+                    metadatas=[chunk.metadata for chunk in promoted]
+                )
+                self._promote(replacements)
+
+        aliases_deleted = 0
+        with get_db(self.db_path) as conn:
+            for start in range(0, len(doc_ids), 900):
+                batch = doc_ids[start:start + 900]
+                placeholders = ",".join("?" * len(batch))
+                conn.execute(
+                    "DELETE FROM chunk_signature_bands WHERE split_id IN "
+                    f"(SELECT split_id FROM chunk_signatures WHERE doc_id IN ({placeholders}))",
+                    batch
+                )
+                aliases_deleted += conn.execute(
+                    f"SELECT COUNT(*) FROM chunk_signatures WHERE doc_id IN ({placeholders}) "
+                    "AND canonical_id IS NOT NULL",
+                    batch
+                ).fetchone()[0]
+                conn.execute(f"DELETE FROM chunk_signatures WHERE doc_id IN ({placeholders})", batch)
+            conn.commit()
+        return promoted, aliases_deleted
+
+    def _promote(self, replacements: Dict[str, Tuple[str, Document]]):
+        """Turn aliases into canonical chunks and point their siblings to them."""
+        new_ids = [split_id for split_id, _ in replacements.values()]
+        signatures = self._get_signatures(set(new_ids))
+        buckets = self.hasher.buckets(np.stack([signatures[split_id][0] for split_id in new_ids]))
+        with get_db(self.db_path) as conn:
+            for (old_id, (new_id, _)), row in zip(replacements.items(), buckets.tolist()):
+                conn.execute(
+                    "UPDATE chunk_signatures SET canonical_id = NULL, text = NULL, metadata = NULL WHERE split_id = ?",
+                    (new_id,)
+                )
+                conn.execute("UPDATE chunk_signatures SET canonical_id = ? WHERE canonical_id = ?", (new_id, old_id))
+                conn.executemany(
+                    "INSERT OR IGNORE INTO chunk_signature_bands (bucket, split_id) VALUES (?, ?)",
+                    [(bucket, new_id) for bucket in row]
+                )
+            conn.commit()
+
+    # ==========================================
+    # Lookups
+    # ==========================================
+
+    def _lookup_buckets(self, buckets: List[int]) -> Dict[int, List[str]]:
+        found: Dict[int, List[str]] = {}
+        buckets = list(dict.fromkeys(buckets))
+        with get_db(self.db_path) as conn:
+            for start in range(0, len(buckets), 900):
+                batch = buckets[start:start + 900]
+                for bucket, split_id in conn.execute(
+                    f"SELECT bucket, split_id FROM chunk_signature_bands WHERE bucket IN ({','.join('?' * len(batch))})",
+                    batch
+                ):
+                    found.setdefault(bucket, []).append(split_id)
+        return found
+
+    def _get_signatures(self, split_ids: Set[str], canonical_only: bool = False) -> Dict[str, Tuple[np.ndarray, int]]:
+        split_ids = list(split_ids)
+        signatures = {}
+        query = "SELECT split_id, signature, numbers_hash FROM chunk_signatures WHERE split_id IN ({})"
+        if canonical_only:
+            query += " AND canonical_id IS NULL"
+        with get_db(self.db_path) as conn:
+            for start in range(0, len(split_ids), 900):
+                batch = split_ids[start:start + 900]
+                for split_id, signature, numbers_hash in conn.execute(query.format(",".join("?" * len(batch))), batch):
+                    signatures[split_id] = (np.frombuffer(signature, dtype="<u4"), numbers_hash)
+        return signatures
+
+    def has_document(self, doc_id: str) -> bool:
+        """Return whether any aliases are stored for a document."""
+        with get_db(self.db_path) as conn:
+            return conn.execute(
+                "SELECT 1 FROM chunk_signatures WHERE doc_id = ? AND canonical_id IS NOT NULL LIMIT 1", (doc_id,)
+            ).fetchone() is not None
+
+    def aliases(self, doc_ids: List[str]) -> List[Tuple[str, Document]]:
+        """Return (canonical split_id, alias chunk) for the aliases stored for the given documents."""
+        aliases = []
+        with get_db(self.db_path) as conn:
+            for start in range(0, len(doc_ids), 900):
+                batch = doc_ids[start:start + 900]
+                for canonical_id, text, metadata in conn.execute(
+                    "SELECT canonical_id, text, metadata FROM chunk_signatures "
+                    f"WHERE doc_id IN ({','.join('?' * len(batch))}) AND canonical_id IS NOT NULL",
+                    batch
+                ):
+                    aliases.append((canonical_id, Document(page_content=text, metadata=json.loads(metadata))))
+        return aliases
+
+    def count(self, doc_ids: List[str]) -> int:
+        """Number of chunk records (canonical and alias) stored for the given documents."""
+        total = 0
+        with get_db(self.db_path) as conn:
+            for start in range(0, len(doc_ids), 900):
+                batch = doc_ids[start:start + 900]
+                total += conn.execute(
+                    f"SELECT COUNT(*) FROM chunk_signatures WHERE doc_id IN ({','.join('?' * len(batch))})", batch
+                ).fetchone()[0]
+        return total
+
+    def doc_ids(self) -> Set[str]:
+        """Ids of all documents that have chunk records."""
+        with get_db(self.db_path) as conn:
+            return {doc_id for (doc_id,) in conn.execute("SELECT DISTINCT doc_id FROM chunk_signatures")}
+
+    def iter_rows(self, doc_ids: Set[str]) -> Iterator[Dict[str, Any]]:
+        """Yield stored records (split_id, doc_id, signature, numbers_hash, canonical_id,
+        text, metadata) of the given documents."""
+        with get_db(self.db_path) as conn:
+            cursor = conn.execute(
+                "SELECT split_id, doc_id, signature, numbers_hash, canonical_id, text, metadata FROM chunk_signatures"
+            )
+            for split_id, doc_id, signature, numbers_hash, canonical_id, text, metadata in cursor:
+                if doc_id in doc_ids:
+                    yield {
+                        "split_id": split_id,
+                        "doc_id": doc_id,
+                        "signature": signature,
+                        "numbers_hash": numbers_hash,
+                        "canonical_id": canonical_id,
+                        "text": text,
+                        "metadata": metadata
+                    }
+
+    def add_rows(self, rows: List[Dict[str, Any]]):
+        """Store records as produced by iter_rows (used by snapshot import)."""
+        canonical = [row for row in rows if row["canonical_id"] is None]
+        bands = []
+        if canonical:
+            signatures = np.stack([np.frombuffer(row["signature"], dtype="<u4") for row in canonical])
+            for row, buckets in zip(canonical, self.hasher.buckets(signatures).tolist()):
+                bands.extend((bucket, row["split_id"]) for bucket in buckets)
+        with get_db(self.db_path) as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO chunk_signatures "
+                "(split_id, doc_id, signature, numbers_hash, canonical_id, text, metadata) "
+                "VALUES (:split_id, :doc_id, :signature, :numbers_hash, :canonical_id, :text, :metadata)",
+                rows
+            )
+            conn.executemany("INSERT OR IGNORE INTO chunk_signature_bands (bucket, split_id) VALUES (?, ?)", bands)
+            conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """Return the number of canonical chunks and aliases recorded."""
+        with get_db(self.db_path) as conn:
+            canonical, aliases = conn.execute(
+                "SELECT COUNT(*) - COUNT(canonical_id), COUNT(canonical_id) FROM chunk_signatures"
+            ).fetchone()
+        return {"canonical_chunks": canonical, "aliases": aliases}
+
+
+def maximal_marginal_relevance(
+    query_similarities: np.ndarray,
+    embeddings: np.ndarray,
+    k: int,
+    lambda_mult: float
+) -> List[int]:
+    """Pick k candidates that are relevant to the query but not to each other.
+
+    Each step takes the candidate maximizing
+    lambda * sim(query, c) - (1 - lambda) * max sim(c, already picked).
+
+    Args:
+        query_similarities: Cosine similarity of each candidate to the query
+        embeddings: Candidate embeddings, L2-normalized
+        k: Number of candidates to pick
+        lambda_mult: Relevance weight; 1.0 ranks by relevance alone
+
+    Returns:
+        Indices of the picked candidates, in pick order
+    """
+    if not len(query_similarities):
+        return []
+    pairwise = embeddings @ embeddings.T
+    picked = [int(np.argmax(query_similarities))]
+    redundancy = pairwise[picked[0]].copy()
+    while len(picked) < min(k, len(query_similarities)):
+        scores = lambda_mult * query_similarities - (1 - lambda_mult) * redundancy
+        scores[picked] = -np.inf
+        best = int(np.argmax(scores))
+        picked.append(best)
+        redundancy = np.maximum(redundancy, pairwise[best])
+    return picked
@@ -1,3 +1,5 @@
+import re
+import shutil
 import uuid
 from pathlib import Path
 from typing import Optional, List
@@ -15,9 +17,10 @@ from langchain_community.document_loaders import (
 )
 from langchain.docstore.document import Document
 
-from config.database import get_db, get_dict_cursor
+from config.database import bump_kb_version, get_db, get_dict_cursor
 from config.settings import UPLOAD_DIR
 from models.schemas import DocumentInfo
+from services.storage import BlobStore
 from services.vector_store import VectorStoreService
 
 class DocumentService:
@@ -105,10 +108,7 @@ class DocumentService:
             for script in soup(["script", "style"]):
                 script.decompose()
             
-            text = soup.get_text()
-            lines = (line.strip() for line in text.splitlines())
-            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-            text = ' '.join(chunk for chunk in chunks if chunk)
+            text = DocumentService._html_to_text(soup)
             
             # Use the provided metadata
             doc_metadata = {
@@ -124,6 +124,31 @@ class DocumentService:
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Error processing URL: {str(e)}")
 
+    @staticmethod
+    def _html_to_text(soup: BeautifulSoup) -> str:
+        """Extract readable text from HTML, keeping its structure for the chunker.
+        
+        Headings become Markdown-style "#" lines, so chunks follow the page's
+        sections; block elements become line and paragraph breaks.
+        
+        Args:
+            soup: Parsed page with scripts and styles removed
+            
+        Returns:
+            str: Text with one paragraph per block and headings on their own lines
+        """
+        for level in range(1, 7):
+            for heading in soup.find_all(f"h{level}"):
+                heading.replace_with(f"\n\n{'#' * level} {heading.get_text(' ', strip=True)}\n\n")
+        for block in soup.find_all(["p", "section", "article", "table", "pre", "blockquote"]):
+            block.insert_after("\n\n")
+        for block in soup.find_all(["div", "li", "tr", "br"]):
+            block.insert_after("\n")
+        
+        lines = (" ".join(line.split()) for line in soup.get_text().splitlines())
+        text = "\n".join(lines)
+        return re.sub(r"\n{3,}", "\n\n", text).strip()
+
     @staticmethod
     def get_url_title(url: str) -> str:
         """Extract title from URL for better document organization and user experience.
@@ -201,26 +226,54 @@ class DocumentService:
         return source_type_map.get(file_ext, 'text')
 
     @staticmethod
-    def store_document_metadata(metadata: DocumentInfo):
+    def store_document_metadata(metadata: DocumentInfo, storage_path: Optional[str] = None):
         """Store document metadata in database.
         
         Args:
             metadata: The DocumentInfo object to store
+            storage_path: Uploaded file's blob path relative to UPLOAD_DIR, for file uploads
         """
         with get_db() as conn:
             cursor = conn.cursor()
             cursor.execute(
-                "INSERT INTO documents (id, title, source_type, source_path, created_at) VALUES (?, ?, ?, ?, ?)",
+                "INSERT INTO documents (id, title, source_type, source_path, created_at, content_hash, storage_path) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
                 (
                     metadata.id,
                     metadata.title,
                     metadata.source_type,
                     metadata.source_path,
-                    metadata.created_at  # Already in string format
+                    metadata.created_at,  # Already in string format
+                    metadata.content_hash,
+                    storage_path
                 )
             )
+            bump_kb_version(cursor)
             conn.commit()
 
+    @staticmethod
+    def find_document_by_content(content_hash: str, source_type: str) -> Optional[DocumentInfo]:
+        """Find an existing document with identical file content.
+        
+        The source type is part of the match because the same bytes are
+        parsed differently depending on the file extension.
+        
+        Args:
+            content_hash: SHA-256 of the file content
+            source_type: Source type inferred from the file name
+            
+        Returns:
+            The oldest matching document, or None
+        """
+        with get_db() as conn:
+            cursor = get_dict_cursor(conn)
+            cursor.execute(
+                "SELECT * FROM documents WHERE content_hash = ? AND source_type = ? ORDER BY created_at LIMIT 1",
+                (content_hash, source_type)
+            )
+            result = cursor.fetchone()
+            return DocumentInfo(**result) if result else None
+
     @staticmethod
     def get_document_metadata(doc_id: Optional[str] = None) -> List[DocumentInfo]:
         """Retrieve document metadata from database.
@@ -279,7 +332,7 @@ class DocumentService:
     def _delete_document_from_database(doc_id: str) -> bool:
         """Delete document and its metadata from the database.
         
-        Also removes the physical file if it exists.
+        Also removes the uploaded file once no other document references it.
         
         Args:
             doc_id: The document ID to delete
@@ -291,20 +344,24 @@ class DocumentService:
         if not docs:
             return False
 
-        doc = docs[0]
-        if doc.source_type == "file":
-            try:
-                file_path = Path(doc.source_path)
-                if file_path.exists():
-                    file_path.unlink()
-                    if file_path.parent.exists() and not any(file_path.parent.iterdir()):
-                        file_path.parent.rmdir()
-            except Exception as e:
-                print(f"Error deleting file: {str(e)}")
-
         with get_db() as conn:
             cursor = conn.cursor()
+            cursor.execute("SELECT storage_path FROM documents WHERE id = ?", (doc_id,))
+            (storage_path,) = cursor.fetchone()
             cursor.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+            cursor.execute("SELECT COUNT(*) FROM documents WHERE storage_path = ?", (storage_path,))
+            still_referenced = cursor.fetchone()[0] > 0
+            bump_kb_version(cursor)
             conn.commit()
+
+        try:
+            if storage_path and not still_referenced:
+                BlobStore().delete(storage_path)
+            # Uploads stored before content addressing live in uploaded_files/<doc_id>/
+            legacy_dir = UPLOAD_DIR / doc_id
+            if legacy_dir.is_dir():
+                shutil.rmtree(legacy_dir)
+        except Exception as e:
+            print(f"Error deleting file: {str(e)}")
         
         return True 
\ No newline at end of file
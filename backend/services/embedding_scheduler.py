@@ -0,0 +1,257 @@
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from config.settings import (
+    EMBEDDING_MODEL_NAME,
+    EMBED_INGEST_BATCH_SIZE,
+    EMBED_INGEST_MIN_BATCH,
+    EMBED_INGEST_SLICE_MS,
+    EMBED_QUERY_MAX_BATCH,
+    EMBED_QUERY_MAX_WAIT_MS,
+    EMBED_THREADS
+)
+
+# Ingestion runs a slice anyway after yielding this long, so a steady query stream can't starve it
+INGEST_MAX_DEFER_SECONDS = 1.0
+
+
+class _IngestJob:
+    """One embed_documents call, embedded a slice at a time."""
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.position = 0
+        self.embeddings: List[List[float]] = []
+        self.future: Future = Future()
+
+
+class EmbeddingScheduler(Embeddings):
+    """Share one embedding model between interactive queries and bulk ingestion.
+
+    Model calls run on two dispatcher threads, one per lane:
+
+    - Query lane (embed_query): high priority. Concurrent queries arriving
+      within EMBED_QUERY_MAX_WAIT_MS are embedded together in one batch, and
+      batches start as soon as they are formed.
+    - Ingestion lane (embed_documents): low priority. Each call is embedded in
+      slices sized from the measured per-text cost to take about
+      EMBED_INGEST_SLICE_MS (between EMBED_INGEST_MIN_BATCH and
+      EMBED_INGEST_BATCH_SIZE texts, since tiny batches waste model
+      throughput). A new slice only starts while no query is queued or
+      running, so a query shares the CPU with at most one slice.
+
+    The lanes are isolated by priority only; there are no per-lane thread
+    budgets. torch's intra-op thread pool is process-wide, so every model
+    call, query or ingestion slice, uses the one budget set when the
+    dispatchers start. A query that arrives during a slice waits for it to
+    finish (about EMBED_INGEST_SLICE_MS) and then has all the threads.
+    Giving ingestion fewer threads would need it in a separate process.
+    """
+
+    def __init__(
+        self,
+        model: Embeddings,
+        query_max_batch: int = EMBED_QUERY_MAX_BATCH,
+        query_max_wait_ms: float = EMBED_QUERY_MAX_WAIT_MS,
+        ingest_batch_size: int = EMBED_INGEST_BATCH_SIZE,
+        ingest_min_batch: int = EMBED_INGEST_MIN_BATCH,
+        ingest_slice_ms: float = EMBED_INGEST_SLICE_MS,
+        threads: int = EMBED_THREADS
+    ):
+        """Create a scheduler around an embedding model.
+
+        Args:
+            model: The underlying LangChain embedding model
+            query_max_batch: Most queries embedded in one model call
+            query_max_wait_ms: How long the first query waits for others to batch with
+            ingest_batch_size: Most texts per ingestion model call
+            ingest_min_batch: Fewest texts per ingestion model call
+            ingest_slice_ms: Target duration of one ingestion model call
+            threads: Torch threads for model calls of both lanes (0 = torch's current setting)
+        """
+        self.model = model
+        self.query_max_batch = query_max_batch
+        self.query_max_wait = query_max_wait_ms / 1000
+        self.ingest_batch_size = ingest_batch_size
+        self.ingest_min_batch = min(ingest_min_batch, ingest_batch_size)
+        self.ingest_slice = ingest_slice_ms / 1000
+        self.threads = threads
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # Dispatcher threads do not survive fork; new ones start on first use
+        self._condition = threading.Condition()
+        self._queries: deque = deque()
+        self._queries_running = 0
+        self._ingest_jobs: deque = deque()
+        self._threads: List[threading.Thread] = []
+        self._seconds_per_text: Optional[float] = None  # Moving average over ingestion slices
+        self._stats = {"query_batches": 0, "queries": 0, "ingest_batches": 0, "ingest_texts": 0}
+
+    # ==========================================
+    # Embeddings interface
+    # ==========================================
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query on the high-priority lane."""
+        future = Future()
+        with self._condition:
+            self._ensure_started()
+            self._queries.append((text, future))
+            self._condition.notify_all()
+        return future.result()
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed several queries on the high-priority lane, batched together."""
+        futures = [Future() for _ in texts]
+        with self._condition:
+            self._ensure_started()
+            self._queries.extend(zip(texts, futures))
+            self._condition.notify_all()
+        return [future.result() for future in futures]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed documents on the low-priority ingestion lane."""
+        if not texts:
+            return []
+        job = _IngestJob(list(texts))
+        with self._condition:
+            self._ensure_started()
+            self._ingest_jobs.append(job)
+            self._condition.notify_all()
+        return job.future.result()
+
+    def stats(self) -> Dict[str, int]:
+        """Return batch counters and current queue depths."""
+        with self._condition:
+            return {
+                **self._stats,
+                "queued_queries": len(self._queries),
+                "queued_ingest_jobs": len(self._ingest_jobs)
+            }
+
+    # ==========================================
+    # Dispatchers
+    # ==========================================
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        torch = sys.modules.get("torch")
+        if torch is not None and self.threads:
+            torch.set_num_threads(self.threads)
+        self._threads = [
+            threading.Thread(target=self._query_loop, name="embed-query", daemon=True),
+            threading.Thread(target=self._ingest_loop, name="embed-ingest", daemon=True)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _query_loop(self):
+        while True:
+            with self._condition:
+                while not self._queries:
+                    self._condition.wait()
+
+                # Give concurrent queries a moment to join this batch
+                deadline = time.monotonic() + self.query_max_wait
+                while len(self._queries) < self.query_max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                batch = [self._queries.popleft() for _ in range(min(len(self._queries), self.query_max_batch))]
+                self._queries_running += 1
+
+            try:
+                self._run_query_batch(batch)
+            finally:
+                with self._condition:
+                    self._queries_running -= 1
+                    self._stats["query_batches"] += 1
+                    self._stats["queries"] += len(batch)
+                    self._condition.notify_all()
+
+    def _ingest_loop(self):
+        while True:
+            with self._condition:
+                while not self._ingest_jobs:
+                    self._condition.wait()
+
+                # Yield to queries that are queued or running
+                deadline = time.monotonic() + INGEST_MAX_DEFER_SECONDS
+                while self._queries or self._queries_running:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+
+                job = self._ingest_jobs[0]
+                texts = job.texts[job.position:job.position + self._ingest_slice_size()]
+
+            self._run_ingest_slice(job, texts)
+
+    def _ingest_slice_size(self) -> int:
+        if self._seconds_per_text is None:
+            return self.ingest_min_batch
+        size = int(self.ingest_slice / self._seconds_per_text)
+        return max(self.ingest_min_batch, min(self.ingest_batch_size, size))
+
+    def _run_query_batch(self, batch: list):
+        try:
+            # HuggingFaceEmbeddings embeds queries and documents the same way
+            embeddings = self.model.embed_documents([text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        for (_, future), embedding in zip(batch, embeddings):
+            future.set_result(embedding)
+
+    def _run_ingest_slice(self, job: _IngestJob, texts: List[str]):
+        started = time.perf_counter()
+        try:
+            job.embeddings.extend(self.model.embed_documents(texts))
+            job.position += len(texts)
+            failed = None
+        except Exception as e:
+            failed = e
+        per_text = (time.perf_counter() - started) / len(texts)
+
+        with self._condition:
+            if failed is None:
+                previous = self._seconds_per_text
+                self._seconds_per_text = per_text if previous is None else 0.8 * previous + 0.2 * per_text
+            self._stats["ingest_batches"] += 1
+            self._stats["ingest_texts"] += len(texts)
+            if failed is None and job.position < len(job.texts):
+                return
+            self._ingest_jobs.popleft()
+
+        if failed is not None:
+            job.future.set_exception(failed)
+        else:
+            job.future.set_result(job.embeddings)
+
+
+_SCHEDULER: Optional[EmbeddingScheduler] = None
+_SCHEDULER_LOCK = threading.Lock()
+
+
+def get_embedding_scheduler() -> EmbeddingScheduler:
+    """Return the process-wide scheduler, loading the embedding model on first use."""
+    global _SCHEDULER
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None:
+            from langchain_huggingface import HuggingFaceEmbeddings
+            _SCHEDULER = EmbeddingScheduler(HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME))
+        return _SCHEDULER
@@ -0,0 +1,475 @@
+import math
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from langchain_google_genai import GoogleGenerativeAI
+
+from config.settings import (
+    GOOGLE_API_KEY,
+    LLM_HEDGE_BUDGET,
+    LLM_HEDGE_ENABLED,
+    LLM_HEDGE_MIN_DELAY,
+    LLM_HEDGE_PERCENTILE,
+    LLM_MAX_CONCURRENCY,
+    LLM_MAX_OUTPUT_TOKENS,
+    LLM_MAX_QUEUE,
+    LLM_MAX_RETRIES,
+    LLM_PROVIDER,
+    LLM_QUEUE_TIMEOUT,
+    LLM_REQUESTS_PER_MINUTE,
+    LLM_STUB_URL,
+    LLM_TEMPERATURE,
+    LLM_TIMEOUT,
+    LLM_TOP_P
+)
+from services.deadline import Deadline
+from services.stub_llm import StubLLM
+
+# How often waits re-check their request's deadline for cancellation
+DEADLINE_POLL_SECONDS = 0.1
+
+
+class LLMOverloadedError(Exception):
+    """Raised when an LLM call cannot be admitted; maps to HTTP 429."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class SingleFlight:
+    """Coalesce identical in-flight calls so only one of them does the work.
+
+    Callers that arrive with the key of a call already running wait for it
+    and receive its result (or exception) instead of making their own call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self._stats = {"calls": 0, "coalesced": 0}
+
+    def do(self, key: Hashable, fn: Callable[[], Any], deadline: Optional[Deadline] = None) -> Any:
+        """Run fn, or wait for the in-flight call with the same key.
+
+        Args:
+            key: Identity of the call
+            fn: Function producing the result
+            deadline: The caller's deadline; a waiting caller stops waiting
+                when it is cancelled or out of time, even if the call it
+                waits for has no deadline of its own
+
+        Returns:
+            The result of fn from whichever caller ran it
+
+        Raises:
+            RequestCancelledError, DeadlineExceededError: From the caller's deadline while waiting
+        """
+        with self._lock:
+            self._stats["calls"] += 1
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+            else:
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            if deadline is None:
+                return future.result()
+            while True:
+                try:
+                    return future.result(timeout=DEADLINE_POLL_SECONDS)
+                except FutureTimeoutError:
+                    deadline.check()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "in_flight": len(self._calls)}
+
+
+class LLMLimiter:
+    """Cap concurrent LLM calls and their rate, with a bounded wait queue.
+
+    A call needs a concurrency slot and, when a rate is configured, a token
+    from a bucket refilled at requests_per_minute (bursting up to the
+    concurrency limit). Calls that can't start immediately wait in a queue of
+    at most max_queue callers for up to queue_timeout seconds; beyond that
+    they are rejected with LLMOverloadedError carrying a Retry-After estimate.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        requests_per_minute: float = LLM_REQUESTS_PER_MINUTE,
+        max_queue: int = LLM_MAX_QUEUE,
+        queue_timeout: float = LLM_QUEUE_TIMEOUT
+    ):
+        """Create a limiter.
+
+        Args:
+            max_concurrency: Most LLM calls running at once
+            requests_per_minute: Sustained call rate (0 = unlimited)
+            max_queue: Most callers waiting for a slot
+            queue_timeout: Longest a caller waits before being rejected
+        """
+        self.max_concurrency = max_concurrency
+        self.rate = requests_per_minute / 60
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self._condition = threading.Condition()
+        self._tokens = float(max_concurrency)
+        self._refilled_at = time.monotonic()
+        self._in_flight = 0
+        self._waiting = 0
+        self._call_seconds = 1.0  # Moving average of call duration, for Retry-After
+        self._stats = {"admitted": 0, "queued": 0, "rejected": 0, "peak_queue_depth": 0}
+
+    def acquire(self, request_deadline: Optional[Deadline] = None):
+        """Take an LLM call slot, waiting in the queue if none is free; give it back with release().
+
+        Args:
+            request_deadline: Stop waiting for a slot when this request is cancelled or out of time
+
+        Raises:
+            LLMOverloadedError: If the queue is full or the wait times out
+            RequestCancelledError, DeadlineExceededError: From the request deadline
+        """
+        with self._condition:
+            if self._can_start():
+                self._start()
+                return
+
+            if self._waiting >= self.max_queue:
+                self._stats["rejected"] += 1
+                raise LLMOverloadedError("LLM request queue is full", self._retry_after())
+
+            self._waiting += 1
+            self._stats["queued"] += 1
+            self._stats["peak_queue_depth"] = max(self._stats["peak_queue_depth"], self._waiting)
+            try:
+                deadline = time.monotonic() + self.queue_timeout
+                while not self._can_start():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["rejected"] += 1
+                        raise LLMOverloadedError("Timed out waiting for an LLM slot", self._retry_after())
+                    # Wake up when a slot frees up or the next token is due
+                    wait = remaining
+                    if self.rate and self._tokens < 1:
+                        wait = min(wait, (1 - self._tokens) / self.rate)
+                    if request_deadline is not None:
+                        request_deadline.check()
+                        wait = min(wait, DEADLINE_POLL_SECONDS)
+                    self._condition.wait(wait)
+                self._start()
+            finally:
+                self._waiting -= 1
+
+    def try_acquire(self) -> bool:
+        """Take a slot only if one is free now and nobody is queued; never waits.
+
+        Returns:
+            True if a slot was taken; give it back with release()
+        """
+        with self._condition:
+            if self._waiting or not self._can_start():
+                return False
+            self._start()
+            return True
+
+    def release(self, seconds: float):
+        """Give back a slot after a call of `seconds`."""
+        with self._condition:
+            self._in_flight -= 1
+            self._call_seconds = 0.9 * self._call_seconds + 0.1 * seconds
+            self._condition.notify()
+
+    def _can_start(self) -> bool:
+        if self._in_flight >= self.max_concurrency:
+            return False
+        if not self.rate:
+            return True
+        now = time.monotonic()
+        self._tokens = min(self.max_concurrency, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+        return self._tokens >= 1
+
+    def _start(self):
+        if self.rate:
+            self._tokens -= 1
+        self._in_flight += 1
+        self._stats["admitted"] += 1
+
+    def _retry_after(self) -> int:
+        """Estimate seconds until the queue ahead of a new caller drains."""
+        ahead = self._waiting + 1
+        drain_rate = self.max_concurrency / self._call_seconds
+        if self.rate:
+            drain_rate = min(drain_rate, self.rate)
+        return max(1, math.ceil(ahead / drain_rate))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                **self._stats,
+                "in_flight": self._in_flight,
+                "queue_depth": self._waiting,
+                "avg_call_seconds": round(self._call_seconds, 3)
+            }
+
+
+class LatencyTracker:
+    """Keep recent latency samples and report percentiles."""
+
+    def __init__(self, window: int = 200):
+        self._samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, percentile: float, min_samples: int = 20) -> Optional[float]:
+        """Return the percentile of recent samples, or None with too few samples."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * percentile / 100))]
+
+
+class _LostRace(Exception):
+    """Raised inside a hedged attempt that another attempt beat to the first token."""
+
+
+class LLMCaller:
+    """Stream LLM completions under a request deadline, optionally hedged.
+
+    Each call streams the completion on a worker thread and checks the
+    deadline between chunks, so a cancelled or timed-out request stops
+    paying for tokens; the model request's own timeout is capped at the
+    deadline too, so an attempt waiting for its first chunk does not outlive
+    the request by much. With hedging enabled, a second identical call is
+    started when the first has produced no token after the recent
+    LLM_HEDGE_PERCENTILE time-to-first-token; whichever streams a token first
+    wins and the other is abandoned. At most LLM_HEDGE_BUDGET of calls are
+    hedged, which caps the extra load. Time-to-first-token is tracked per
+    model, so a fast and a slow model don't distort each other's delay.
+
+    With a limiter, every attempt holds a slot from its start until its
+    thread finishes, not just until generate() returns, so abandoned
+    attempts still count against LLM_MAX_CONCURRENCY. The first attempt
+    waits for its slot; a hedge only takes a free one and is skipped
+    otherwise.
+    """
+
+    def __init__(
+        self,
+        hedge_enabled: bool = LLM_HEDGE_ENABLED,
+        hedge_percentile: float = LLM_HEDGE_PERCENTILE,
+        hedge_min_delay: float = LLM_HEDGE_MIN_DELAY,
+        hedge_budget: float = LLM_HEDGE_BUDGET,
+        limiter: Optional[LLMLimiter] = None
+    ):
+        """Create a caller.
+
+        Args:
+            hedge_enabled: Issue hedged second calls for slow first tokens
+            hedge_percentile: Time-to-first-token percentile used as the hedge delay
+            hedge_min_delay: Lower bound on the hedge delay, in seconds
+            hedge_budget: Largest fraction of calls that may be hedged
+            limiter: Limiter every attempt holds a slot of while it runs
+        """
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_budget = hedge_budget
+        self.limiter = limiter
+        self.first_token: Dict[str, LatencyTracker] = defaultdict(LatencyTracker)
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "hedged": 0, "hedge_wins": 0, "hedges_skipped": 0, "cancelled": 0, "timed_out": 0}
+
+    def generate(self, llm, prompt: str, deadline: Optional[Deadline] = None) -> str:
+        """Return the full completion for a prompt.
+
+        Args:
+            llm: LangChain LLM supporting stream()
+            prompt: The fully formatted prompt
+            deadline: The request's deadline
+
+        Raises:
+            LLMOverloadedError: If the limiter has no slot for the call
+            RequestCancelledError, DeadlineExceededError: From the request deadline
+        """
+        deadline = deadline or Deadline()
+        if self.limiter is not None:
+            self.limiter.acquire(deadline)
+        with self._lock:
+            self._stats["calls"] += 1
+
+        results: queue.Queue = queue.Queue()
+        race = {"winner": None, "lock": threading.Lock()}
+        abandon = threading.Event()
+        pending = {0}
+        tracker = self.first_token[model_name(llm)]
+        self._start_attempt(
+            0, llm, prompt, deadline, abandon, race, results, tracker, holds_slot=self.limiter is not None
+        )
+
+        hedge_delay = self._hedge_delay(tracker)
+        hedge_at = time.monotonic() + hedge_delay if hedge_delay is not None else None
+        errors = []
+        try:
+            while True:
+                try:
+                    number, text, error = results.get(timeout=DEADLINE_POLL_SECONDS)
+                except queue.Empty:
+                    deadline.check()
+                    if hedge_at is not None and time.monotonic() >= hedge_at:
+                        hedge_at = None
+                        if race["winner"] is None and self._take_hedge_budget():
+                            if self.limiter is None or self.limiter.try_acquire():
+                                pending.add(1)
+                                self._start_attempt(
+                                    1, llm, prompt, deadline, abandon, race, results, tracker,
+                                    holds_slot=self.limiter is not None
+                                )
+                            else:
+                                with self._lock:
+                                    self._stats["hedged"] -= 1
+                                    self._stats["hedges_skipped"] += 1
+                    continue
+
+                pending.discard(number)
+                if error is None:
+                    if number > 0:
+                        with self._lock:
+                            self._stats["hedge_wins"] += 1
+                    return text
+                if not isinstance(error, _LostRace):
+                    errors.append(error)
+                if not pending:
+                    raise errors[0]
+        except Exception:
+            with self._lock:
+                if deadline.cancelled:
+                    self._stats["cancelled"] += 1
+                elif deadline.expired:
+                    self._stats["timed_out"] += 1
+            raise
+        finally:
+            # Stop any attempt still streaming
+            abandon.set()
+
+    def _start_attempt(self, number: int, llm, prompt: str, deadline: Deadline,
+                       abandon: threading.Event, race: dict, results: queue.Queue, tracker: LatencyTracker,
+                       holds_slot: bool = False):
+        # holds_slot: the attempt took its own limiter slot and gives it back when it ends
+        def run():
+            started = time.monotonic()
+            chunks = []
+            try:
+                for chunk in bound_to_deadline(llm, deadline).stream(prompt):
+                    if abandon.is_set():
+                        return
+                    deadline.check()
+                    if not chunks:
+                        with race["lock"]:
+                            if race["winner"] is None:
+                                race["winner"] = number
+                        if race["winner"] != number:
+                            raise _LostRace()
+                        tracker.record(time.monotonic() - started)
+                    chunks.append(chunk)
+                results.put((number, "".join(chunks), None))
+            except Exception as e:
+                results.put((number, None, e))
+            finally:
+                if holds_slot:
+                    self.limiter.release(time.monotonic() - started)
+
+        threading.Thread(target=run, name=f"llm-attempt-{number}", daemon=True).start()
+
+    def _hedge_delay(self, tracker: LatencyTracker) -> Optional[float]:
+        if not self.hedge_enabled:
+            return None
+        delay = tracker.percentile(self.hedge_percentile)
+        if delay is None:
+            return None  # Not enough samples to know what "slow" is yet
+        return max(self.hedge_min_delay, delay)
+
+    def _take_hedge_budget(self) -> bool:
+        with self._lock:
+            if self._stats["hedged"] + 1 > self.hedge_budget * self._stats["calls"]:
+                return False
+            self._stats["hedged"] += 1
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["first_token_seconds"] = {
+            model: {
+                "p50": round(tracker.percentile(50, min_samples=1), 3),
+                "p95": round(tracker.percentile(95, min_samples=1), 3)
+            }
+            for model, tracker in list(self.first_token.items())
+            if tracker.percentile(50, min_samples=1) is not None
+        }
+        return stats
+
+
+def bound_to_deadline(llm, deadline: Deadline):
+    """Return the LLM client with its request timeout capped at the deadline's remaining time."""
+    remaining = deadline.remaining()
+    if remaining is None or not hasattr(llm, "timeout"):
+        return llm
+    timeout = max(remaining, DEADLINE_POLL_SECONDS)
+    if llm.timeout is not None and llm.timeout <= timeout:
+        return llm
+    # A shallow copy that shares the underlying API client
+    return type(llm).construct(_fields_set=llm.__fields_set__, **{**llm.__dict__, "timeout": timeout})
+
+
+def model_name(llm) -> str:
+    """Name of the model behind a LangChain LLM client."""
+    return getattr(llm, "model", None) or type(llm).__name__
+
+
+def create_llm_client(
+    model_name: str,
+    max_output_tokens: int = LLM_MAX_OUTPUT_TOKENS,
+    provider: str = LLM_PROVIDER
+):
+    """Create a LangChain client for one model of a provider ("google" or "stub")."""
+    if provider == "stub":
+        return StubLLM(model=model_name, base_url=LLM_STUB_URL, max_tokens=max_output_tokens, timeout=LLM_TIMEOUT)
+    return GoogleGenerativeAI(
+        model=model_name,
+        google_api_key=GOOGLE_API_KEY,
+        temperature=LLM_TEMPERATURE,
+        top_p=LLM_TOP_P,
+        max_output_tokens=max_output_tokens,
+        timeout=LLM_TIMEOUT,
+        max_retries=LLM_MAX_RETRIES,
+        convert_system_message_to_human=True
+    )
@@ -0,0 +1,122 @@
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Set
+
+from langchain.docstore.document import Document
+
+from config.database import get_db
+from config.settings import DB_PATH
+
+
+class ParentStore:
+    """Parent sections for small-to-big retrieval.
+
+    Each parent section is stored once, keyed by its id (also kept as the
+    parent_id of its child chunks in the vector index), in the SQLite
+    database next to the documents table. Only the children are embedded.
+    """
+
+    def __init__(self, db_path: Path = DB_PATH):
+        """Create a parent store.
+
+        Args:
+            db_path: SQLite database holding the parent_chunks table
+        """
+        self.db_path = db_path
+
+    def add(self, parents: List[Document]):
+        """Store (or replace) parent sections.
+
+        Args:
+            parents: Documents whose metadata has "split_id" (the parent id) and "doc_id"
+        """
+        with get_db(self.db_path) as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO parent_chunks (id, doc_id, text, metadata, token_count) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (
+                        parent.metadata["split_id"],
+                        parent.metadata["doc_id"],
+                        parent.page_content,
+                        json.dumps(parent.metadata),
+                        parent.metadata.get("token_count")
+                    )
+                    for parent in parents
+                ]
+            )
+            conn.commit()
+
+    def get(self, ids: List[str]) -> Dict[str, Document]:
+        """Fetch parent sections by id.
+
+        Returns:
+            Dict of parent id to Document; unknown ids are left out
+        """
+        ids = list(dict.fromkeys(ids))
+        parents = {}
+        with get_db(self.db_path) as conn:
+            for start in range(0, len(ids), 900):
+                batch = ids[start:start + 900]
+                rows = conn.execute(
+                    f"SELECT id, text, metadata FROM parent_chunks WHERE id IN ({','.join('?' * len(batch))})",
+                    batch
+                ).fetchall()
+                for parent_id, text, metadata in rows:
+                    parents[parent_id] = Document(page_content=text, metadata=json.loads(metadata))
+        return parents
+
+    def delete(self, doc_ids: List[str]) -> int:
+        """Delete the parent sections of documents.
+
+        Returns:
+            Number of parent sections deleted
+        """
+        deleted = 0
+        with get_db(self.db_path) as conn:
+            for start in range(0, len(doc_ids), 900):
+                batch = doc_ids[start:start + 900]
+                deleted += conn.execute(
+                    f"DELETE FROM parent_chunks WHERE doc_id IN ({','.join('?' * len(batch))})", batch
+                ).rowcount
+            conn.commit()
+        return deleted
+
+    def count(self, doc_ids: List[str]) -> int:
+        """Number of parent sections stored for the given documents."""
+        total = 0
+        with get_db(self.db_path) as conn:
+            for start in range(0, len(doc_ids), 900):
+                batch = doc_ids[start:start + 900]
+                total += conn.execute(
+                    f"SELECT COUNT(*) FROM parent_chunks WHERE doc_id IN ({','.join('?' * len(batch))})", batch
+                ).fetchone()[0]
+        return total
+
+    def doc_ids(self) -> Set[str]:
+        """Ids of all documents that have parent sections."""
+        with get_db(self.db_path) as conn:
+            return {doc_id for (doc_id,) in conn.execute("SELECT DISTINCT doc_id FROM parent_chunks")}
+
+    def iter_rows(self, doc_ids: Set[str]) -> Iterator[Dict[str, Any]]:
+        """Yield stored rows (id, doc_id, text, metadata, token_count) of the given documents."""
+        with get_db(self.db_path) as conn:
+            cursor = conn.execute("SELECT id, doc_id, text, metadata, token_count FROM parent_chunks")
+            for parent_id, doc_id, text, metadata, token_count in cursor:
+                if doc_id in doc_ids:
+                    yield {
+                        "id": parent_id,
+                        "doc_id": doc_id,
+                        "text": text,
+                        "metadata": metadata,
+                        "token_count": token_count
+                    }
+
+    def add_rows(self, rows: List[Dict[str, Any]]):
+        """Store rows as produced by iter_rows (used by snapshot import)."""
+        with get_db(self.db_path) as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO parent_chunks (id, doc_id, text, metadata, token_count) "
+                "VALUES (:id, :doc_id, :text, :metadata, :token_count)",
+                rows
+            )
+            conn.commit()
@@ -0,0 +1,146 @@
+"""Compact vector codes for first-pass search in the memory-mapped index.
+
+Each quantizer turns L2-normalized float vectors into smaller codes and
+scores query vectors against a block of codes. Scores approximate the cosine
+similarity (higher is closer) and are only used to build a shortlist that is
+then rescored against the full-precision vectors.
+"""
+
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+
+class Quantizer(ABC):
+    """Encodes vectors into compact codes and scores queries against them."""
+
+    name: str = ""
+    code_dtype = np.uint8
+    trainable = False
+
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    @property
+    @abstractmethod
+    def code_width(self) -> int:
+        """Number of ``code_dtype`` elements per encoded vector."""
+
+    def train(self, vectors: np.ndarray):
+        """Fit any data-dependent parameters on a sample of vectors."""
+
+    @abstractmethod
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """Encode normalized float32 vectors into codes."""
+
+    @abstractmethod
+    def score(self, codes: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        """Approximate similarity between each query and each code row.
+
+        Args:
+            codes: Block of codes, shape (rows, code_width)
+            queries: Normalized float32 queries, shape (queries, dim)
+
+        Returns:
+            Scores of shape (queries, rows)
+        """
+
+    def save(self, path: Path):
+        """Persist trained parameters, if any."""
+
+    def load(self, path: Path):
+        """Load trained parameters, if any."""
+
+
+class Float16Quantizer(Quantizer):
+    """Half-precision copy of each vector (2 bytes per dimension)."""
+
+    name = "float16"
+    code_dtype = np.float16
+
+    @property
+    def code_width(self):
+        return self.dim
+
+    def encode(self, vectors):
+        return vectors.astype(np.float16)
+
+    def score(self, codes, queries):
+        return queries @ np.asarray(codes, dtype=np.float32).T
+
+
+class Int8Quantizer(Quantizer):
+    """Symmetric per-dimension scalar quantization (1 byte per dimension)."""
+
+    name = "int8"
+    code_dtype = np.int8
+    trainable = True
+
+    def __init__(self, dim: int):
+        super().__init__(dim)
+        self.scale: Optional[np.ndarray] = None
+
+    @property
+    def code_width(self):
+        return self.dim
+
+    def train(self, vectors):
+        max_abs = np.abs(vectors).max(axis=0)
+        max_abs[max_abs == 0] = 1.0
+        self.scale = (max_abs / 127.0).astype(np.float32)
+
+    def encode(self, vectors):
+        return np.clip(np.rint(vectors / self.scale), -127, 127).astype(np.int8)
+
+    def score(self, codes, queries):
+        return (queries * self.scale) @ np.asarray(codes, dtype=np.float32).T
+
+    def save(self, path):
+        np.save(path / "int8_scale.npy", self.scale)
+
+    def load(self, path):
+        self.scale = np.load(path / "int8_scale.npy")
+
+
+class BinaryQuantizer(Quantizer):
+    """One sign bit per dimension, scored asymmetrically against float queries."""
+
+    name = "binary"
+    code_dtype = np.uint8
+
+    @property
+    def code_width(self):
+        return (self.dim + 7) // 8
+
+    def encode(self, vectors):
+        return np.packbits(vectors > 0, axis=1)
+
+    def score(self, codes, queries):
+        signs = np.unpackbits(np.asarray(codes), axis=1, count=self.dim).astype(np.float32)
+        # Map bits {0, 1} to {-1, +1} without materializing a second matrix
+        return 2.0 * (queries @ signs.T) - queries.sum(axis=1, keepdims=True)
+
+
+QUANTIZERS = {
+    quantizer.name: quantizer
+    for quantizer in (Float16Quantizer, Int8Quantizer, BinaryQuantizer)
+}
+
+
+def get_quantizer(name: str, dim: int) -> Optional[Quantizer]:
+    """Return the quantizer for a configuration name, or None for "none".
+
+    Args:
+        name: One of "none", "float16", "int8", "binary"
+        dim: Vector dimension
+
+    Returns:
+        A Quantizer instance, or None when codes are disabled
+    """
+    if name in ("none", "", None):
+        return None
+    if name not in QUANTIZERS:
+        raise ValueError(f"Unknown quantization: {name}")
+    return QUANTIZERS[name](dim)
@@ -0,0 +1,210 @@
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain.prompts import PromptTemplate
+from langchain.schema import Document
+
+from config.settings import (
+    QUERY_EXPANSION_BUDGET_MS,
+    QUERY_EXPANSION_COUNT,
+    QUERY_EXPANSION_MODE,
+    QUERY_EXPANSION_RRF_K
+)
+from services.deadline import Deadline
+from services.llm_control import LLMCaller
+
+EXPANSION_MODES = ("off", "multi_query", "hyde")
+
+# Leading list markers the model may put in front of rewrites ("1.", "-", "*", "2)")
+LIST_MARKER = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")
+
+MULTI_QUERY_PROMPT = PromptTemplate(
+    template="""
+    Rewrite the question below as {count} different search queries for a knowledge base.
+    If it asks several things, give each its own query. Use other words than the question
+    where you can. Return only the queries, one per line.
+
+    Question: {question}
+    """,
+    input_variables=["count", "question"]
+)
+
+HYDE_PROMPT = PromptTemplate(
+    template="""
+    Write a short passage, as it might appear in technical documentation, that answers
+    the question below. Guess specific details if you don't know them.
+
+    Question: {question}
+
+    Passage:
+    """,
+    input_variables=["question"]
+)
+
+
+def reciprocal_rank_fusion(
+    results: List[List[Tuple[Document, float]]],
+    k: int,
+    rrf_k: int = QUERY_EXPANSION_RRF_K
+) -> List[Tuple[Document, float]]:
+    """Fuse several ranked result lists into one.
+
+    A chunk scores sum(1 / (rrf_k + rank)) over the lists it appears in, so
+    chunks found by several queries rise to the top. Each fused chunk keeps
+    its closest cosine distance, from which the relevance threshold's
+    similarity (1 - distance) is computed.
+
+    Args:
+        results: (Document, cosine distance) lists, closest first, one per query
+        k: Number of results to return
+        rrf_k: Damping constant; larger values flatten the rank weights
+
+    Returns:
+        Up to k (Document, closest distance) pairs, best fused rank first
+    """
+    fused: Dict[str, float] = {}
+    best: Dict[str, Tuple[Document, float]] = {}
+    for docs_and_scores in results:
+        for rank, (doc, score) in enumerate(docs_and_scores):
+            key = doc.metadata.get("split_id") or doc.page_content
+            fused[key] = fused.get(key, 0.0) + 1.0 / (rrf_k + rank + 1)
+            if key not in best or score < best[key][1]:
+                best[key] = (doc, score)
+    ranked = sorted(fused, key=fused.get, reverse=True)
+    return [best[key] for key in ranked[:k]]
+
+
+class QueryExpander:
+    """Multi-query or HyDE retrieval under a latency budget.
+
+    The fast model writes rewrites of the question ("multi_query") or a
+    hypothetical answer ("hyde") while the original question is embedded
+    and searched. The rewrites are then embedded in one batch on the query
+    lane, searched in one index call and fused with the original results by
+    reciprocal rank. If the rewrites are not ready within the budget, or
+    generating them fails, the original question's results are returned
+    alone, so expansion never costs more than the budget.
+    """
+
+    def __init__(
+        self,
+        vector_store_service,
+        llm,
+        llm_caller: LLMCaller,
+        mode: str = QUERY_EXPANSION_MODE,
+        count: int = QUERY_EXPANSION_COUNT,
+        budget_ms: float = QUERY_EXPANSION_BUDGET_MS
+    ):
+        """Create a query expander.
+
+        Args:
+            vector_store_service: VectorStoreService to search
+            llm: LangChain LLM that writes the rewrites (the fast model)
+            llm_caller: Caller used for the rewrite calls; they count against its limiter
+            mode: "off", "multi_query" or "hyde"
+            count: Rewrites per question in "multi_query" mode
+            budget_ms: Longest the rewrites may take before falling back
+        """
+        if mode not in EXPANSION_MODES:
+            raise ValueError(f"Unknown query expansion mode: {mode} (expected one of {', '.join(EXPANSION_MODES)})")
+        self.vector_store_service = vector_store_service
+        self.llm = llm
+        self.llm_caller = llm_caller
+        self.mode = mode
+        self.count = count
+        self.budget = budget_ms / 1000
+        self._lock = threading.Lock()
+        self._stats = {"expanded": 0, "fallbacks": 0, "rewrites": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def search(
+        self,
+        question: str,
+        k: int,
+        deadline: Optional[Deadline] = None
+    ) -> List[Tuple[Document, float]]:
+        """Search for a question and its rewrites, fusing the results.
+
+        Args:
+            question: The user's question
+            k: Number of results to return
+            deadline: Optional request deadline; the budget never outlasts it
+
+        Returns:
+            Up to k (Document, score) pairs, best first
+        """
+        if not self.enabled:
+            return self.vector_store_service.similarity_search_with_score(question, k=k)
+        deadline = deadline or Deadline()
+        budget = deadline.sub(self.budget)
+
+        executor = ThreadPoolExecutor(max_workers=1)
+        future = executor.submit(self.generate_queries, question, budget)
+        # Don't wait for a generation that runs out of budget; it stops at its own deadline
+        executor.shutdown(wait=False)
+
+        original = self.vector_store_service.similarity_search_with_score(question, k=k)
+        try:
+            queries = future.result(timeout=budget.remaining())
+        except TimeoutError:
+            print(f"Query rewrites not ready within {self.budget * 1000:.0f} ms; searching the question alone")
+            self._count(fallbacks=1)
+            return original
+        except Exception as e:
+            # An LLM error, or the limiter's queue being full
+            print(f"Query expansion skipped ({type(e).__name__}: {e}); searching the question alone")
+            self._count(fallbacks=1)
+            return original
+        if not queries:
+            self._count(fallbacks=1)
+            return original
+
+        results = self.vector_store_service.similarity_search_with_score_queries(queries, k=k)
+        self._count(expanded=1, rewrites=len(queries))
+        return reciprocal_rank_fusion([original] + results, k)
+
+    def generate_queries(self, question: str, deadline: Deadline) -> List[str]:
+        """Ask the model for rewrites (or a hypothetical answer) of a question.
+
+        Args:
+            question: The user's question
+            deadline: Deadline for the model call
+
+        Returns:
+            Queries to search in addition to the question
+        """
+        if self.mode == "hyde":
+            prompt = HYDE_PROMPT.format(question=question)
+        else:
+            prompt = MULTI_QUERY_PROMPT.format(count=self.count, question=question)
+
+        text = self.llm_caller.generate(self.llm, prompt, deadline)
+
+        if self.mode == "hyde":
+            passage = " ".join(text.split())
+            return [passage] if passage else []
+
+        queries = []
+        seen = {" ".join(question.lower().split())}
+        for line in text.splitlines():
+            query = LIST_MARKER.sub("", line).strip().strip('"')
+            normalized = " ".join(query.lower().split())
+            if normalized and normalized not in seen:
+                seen.add(normalized)
+                queries.append(query)
+        return queries[:self.count]
+
+    def _count(self, **increments: int):
+        with self._lock:
+            for name, value in increments.items():
+                self._stats[name] += value
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the mode and how often expansion was used or fell back."""
+        with self._lock:
+            return {"mode": self.mode, "budget_ms": self.budget * 1000, **self._stats}
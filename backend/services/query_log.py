@@ -0,0 +1,262 @@
+import atexit
+import os
+import queue
+import threading
+import time
+import traceback
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+import orjson
+
+from config.settings import (
+    QUERY_CLUSTER_MAX_QUESTIONS,
+    QUERY_CLUSTER_SIMILARITY,
+    QUERY_LOG_DIR,
+    QUERY_LOG_MAX_QUEUE,
+    QUERY_LOG_RETENTION_DAYS,
+    QUERY_LOG_WRITE_BATCH
+)
+
+# Hourly files, named by UTC hour: queries-20240131-14.ndjson
+QUERY_LOG_PATTERN = "queries-*.ndjson"
+
+
+def normalize_question(question: str) -> str:
+    """Normalize a question for caching and counting: case- and whitespace-insensitive."""
+    return " ".join(question.lower().split())
+
+
+class QueryLog:
+    """Append-only log of chat questions.
+
+    Each entry is one NDJSON line:
+        {"ts": 1706709600.123, "q": "...", "retrieval_ms": 41.2, "llm_ms": 1830.5,
+         "docs": ["<doc_id>", ...], "cache": "miss", "status": "ok"}
+    where "cache" is "hit", "miss" or "off" (answer cache disabled) and
+    "status" is "ok" or the name of the exception the request ended with.
+
+    record() only puts the entry on a bounded queue; one background thread
+    writes batches of up to QUERY_LOG_WRITE_BATCH lines with a single
+    O_APPEND write, so processes sharing the directory (pre-forked workers,
+    query replicas) never interleave partial lines. Files rotate every UTC
+    hour, and files older than the retention are deleted when the hour
+    changes. Entries still queued when the process is killed are lost.
+    """
+
+    def __init__(
+        self,
+        log_dir: Path = QUERY_LOG_DIR,
+        retention_days: float = QUERY_LOG_RETENTION_DAYS,
+        max_queue: int = QUERY_LOG_MAX_QUEUE,
+        write_batch: int = QUERY_LOG_WRITE_BATCH
+    ):
+        """Create a query log.
+
+        Args:
+            log_dir: Directory of the hourly files
+            retention_days: Files older than this are deleted
+            max_queue: Entries waiting for the writer before new ones are dropped
+            write_batch: Most entries per write
+        """
+        self.log_dir = Path(log_dir)
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        self.retention_days = retention_days
+        self.max_queue = max_queue
+        self.write_batch = write_batch
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+        atexit.register(self.flush, 2.0)
+
+    def _reset(self):
+        # The writer thread does not survive fork; a new one starts on the next record
+        self._entries: queue.Queue = queue.Queue(self.max_queue)
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending = 0
+        self._hour: Optional[str] = None
+        self._stats = {"logged": 0, "dropped": 0, "write_errors": 0}
+
+    def record(
+        self,
+        question: str,
+        retrieval_seconds: float,
+        llm_seconds: float,
+        doc_ids: List[str],
+        cache: str,
+        status: str = "ok"
+    ):
+        """Queue one entry; drops it if the writer is QUERY_LOG_MAX_QUEUE entries behind."""
+        entry = {
+            "ts": round(time.time(), 3),
+            "q": question,
+            "retrieval_ms": round(retrieval_seconds * 1000, 1),
+            "llm_ms": round(llm_seconds * 1000, 1),
+            "docs": doc_ids,
+            "cache": cache,
+            "status": status
+        }
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="query-log", daemon=True)
+                self._worker.start()
+            try:
+                self._entries.put_nowait(entry)
+            except queue.Full:
+                self._stats["dropped"] += 1
+                return
+            self._pending += 1
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until queued entries are written; returns False on timeout."""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._entries.get()]
+            while len(batch) < self.write_batch:
+                try:
+                    batch.append(self._entries.get_nowait())
+                except queue.Empty:
+                    break
+            written = False
+            try:
+                self._write(batch)
+                written = True
+            except Exception as e:
+                print(f"Error writing query log: {str(e)}")
+                print(traceback.format_exc())
+            finally:
+                with self._idle:
+                    self._stats["logged" if written else "write_errors"] += len(batch)
+                    self._pending -= len(batch)
+                    self._idle.notify_all()
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        hour = time.strftime("%Y%m%d-%H", time.gmtime())
+        if hour != self._hour:
+            self._hour = hour
+            self._delete_expired()
+        data = b"".join(orjson.dumps(entry) + b"\n" for entry in batch)
+        fd = os.open(self.log_dir / f"queries-{hour}.ndjson", os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+    def _delete_expired(self):
+        cutoff = time.time() - self.retention_days * 86400
+        for path in self.log_dir.glob(QUERY_LOG_PATTERN):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except FileNotFoundError:
+                # Another process deleted it first
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        """Return write counters and the number of queued entries."""
+        with self._lock:
+            return {**self._stats, "pending": self._pending}
+
+
+def read_query_log(log_dir: Path = QUERY_LOG_DIR, since: float = 0) -> Iterator[Dict[str, Any]]:
+    """Yield logged entries newer than `since` (Unix time), oldest file first.
+
+    Lines that don't parse (a line still being written) are skipped.
+    """
+    for path in sorted(Path(log_dir).glob(QUERY_LOG_PATTERN)):
+        if path.stat().st_mtime < since:
+            continue
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    entry = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    continue
+                if entry.get("ts", 0) >= since:
+                    yield entry
+
+
+def cluster_questions(
+    entries: Iterator[Dict[str, Any]],
+    embedding_model,
+    similarity: float = QUERY_CLUSTER_SIMILARITY,
+    max_questions: int = QUERY_CLUSTER_MAX_QUESTIONS
+) -> List[Dict[str, Any]]:
+    """Group logged questions that ask the same thing.
+
+    Entries are counted per normalized question; the max_questions most
+    frequent are embedded and clustered greedily, most frequent first: a
+    question joins the first cluster whose leader (its most frequent
+    question) it matches at or above `similarity` (cosine), or leads a new
+    cluster.
+
+    Args:
+        entries: Query log entries
+        embedding_model: Embeddings for the questions (embed_documents is used,
+            which runs on the scheduler's low-priority lane)
+        similarity: Cosine similarity needed to join a cluster
+        max_questions: Most distinct questions clustered
+
+    Returns:
+        Clusters by descending count, each a dict with "question" (the
+        leader), "count", "phrasings" ([question, count] pairs by descending
+        count), "cache_hits", "p50_ms" and "p95_ms" (retrieval + LLM time of
+        requests answered without the cache) and "top_docs" ([doc_id, count]
+        pairs)
+    """
+    counts: Counter = Counter()
+    cache_hits: Counter = Counter()
+    latencies: Dict[str, List[float]] = {}
+    docs: Dict[str, Counter] = {}
+    for entry in entries:
+        question = normalize_question(entry.get("q", ""))
+        if not question:
+            continue
+        counts[question] += 1
+        if entry.get("cache") == "hit":
+            cache_hits[question] += 1
+        elif entry.get("status") == "ok":
+            latencies.setdefault(question, []).append(entry.get("retrieval_ms", 0) + entry.get("llm_ms", 0))
+        docs.setdefault(question, Counter()).update(entry.get("docs") or [])
+
+    questions = [question for question, _ in counts.most_common(max_questions)]
+    if not questions:
+        return []
+    vectors = np.asarray(embedding_model.embed_documents(questions), dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    leaders = np.empty_like(vectors)
+    members: List[List[str]] = []
+    for question, vector in zip(questions, vectors):
+        if members:
+            scores = leaders[:len(members)] @ vector
+            best = int(np.argmax(scores))
+            if scores[best] >= similarity:
+                members[best].append(question)
+                continue
+        leaders[len(members)] = vector
+        members.append([question])
+
+    clusters = []
+    for group in members:
+        group_latencies = [ms for question in group for ms in latencies.get(question, [])]
+        group_docs: Counter = Counter()
+        for question in group:
+            group_docs.update(docs.get(question, {}))
+        clusters.append({
+            "question": group[0],
+            "count": sum(counts[question] for question in group),
+            "phrasings": [[question, counts[question]] for question in group],
+            "cache_hits": sum(cache_hits[question] for question in group),
+            "p50_ms": float(np.percentile(group_latencies, 50)) if group_latencies else None,
+            "p95_ms": float(np.percentile(group_latencies, 95)) if group_latencies else None,
+            "top_docs": [list(pair) for pair in group_docs.most_common(3)]
+        })
+    clusters.sort(key=lambda cluster: cluster["count"], reverse=True)
+    return clusters
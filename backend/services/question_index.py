@@ -0,0 +1,224 @@
+import os
+import queue
+import re
+import threading
+import traceback
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain.docstore.document import Document
+from langchain.prompts import PromptTemplate
+
+from config.settings import (
+    QUESTION_GEN_BATCH_CHUNKS,
+    QUESTION_GEN_MAX_TOKENS,
+    QUESTION_GEN_MODEL_NAME,
+    QUESTION_GEN_PER_CHUNK,
+    QUESTION_GEN_PROVIDER
+)
+from services.llm_control import create_llm_client
+from services.vector_index import VectorIndex
+
+QUESTION_PROMPT = PromptTemplate(
+    template="""
+    For each numbered passage below, write {count} short questions that a user of a
+    network operations knowledge base might ask and that the passage answers.
+    Answer only with lines of the form "<passage number>: <question>".
+
+    {passages}
+    """,
+    input_variables=["count", "passages"]
+)
+
+# "3: How do I ...?", also tolerating "[3] ...", "3. ..." and "3) ..."
+QUESTION_LINE = re.compile(r"^\s*\[?(\d+)\]?\s*[:.)\-]\s*(.+?)\s*$")
+
+
+class QuestionGenerator:
+    """Generate likely questions for chunks and index them.
+
+    Each question is embedded into the "questions" collection with its
+    chunk's metadata, so a hit carries the chunk's split_id (and doc_id,
+    parent_id, ...) and can be mapped back to the chunk at query time.
+    Question ids are "<split_id>_q<n>".
+
+    Jobs submitted at ingestion run on one background thread: chunks are
+    sent to the LLM QUESTION_GEN_BATCH_CHUNKS at a time, and the questions
+    are embedded on the scheduler's low-priority ingestion lane. Questions
+    for chunks deleted in the meantime are dropped. Jobs still queued when
+    the process exits are lost; `python -m utils.generate_questions`
+    backfills chunks that have no questions.
+    """
+
+    def __init__(
+        self,
+        llm=None,
+        per_chunk: int = QUESTION_GEN_PER_CHUNK,
+        batch_chunks: int = QUESTION_GEN_BATCH_CHUNKS
+    ):
+        """Create a question generator.
+
+        Args:
+            llm: LangChain LLM writing the questions; defaults to
+                QUESTION_GEN_MODEL_NAME of QUESTION_GEN_PROVIDER
+            per_chunk: Questions per chunk
+            batch_chunks: Chunks per LLM call
+        """
+        self.llm = llm or create_llm_client(QUESTION_GEN_MODEL_NAME, QUESTION_GEN_MAX_TOKENS, QUESTION_GEN_PROVIDER)
+        self.per_chunk = per_chunk
+        self.batch_chunks = batch_chunks
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # The worker thread does not survive fork; a new one starts on the next submit
+        self._jobs: queue.Queue = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending = 0
+        self._stats = {"chunks": 0, "questions": 0, "llm_calls": 0, "failed_batches": 0, "dropped_chunks": 0}
+
+    # ==========================================
+    # Background jobs
+    # ==========================================
+
+    def submit(self, chunks: List[Document], chunk_index: VectorIndex, question_index: VectorIndex, embedding_model):
+        """Queue question generation for newly indexed chunks.
+
+        Args:
+            chunks: Chunk documents with split_id metadata
+            chunk_index: Index holding the chunks (to skip deleted ones)
+            question_index: Index the questions are added to
+            embedding_model: Embeddings used for the questions
+        """
+        if not chunks:
+            return
+        with self._lock:
+            self._pending += 1
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="question-generator", daemon=True)
+                self._worker.start()
+        self._jobs.put((chunks, chunk_index, question_index, embedding_model))
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """Wait until all submitted jobs are done; returns False on timeout."""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def _run(self):
+        while True:
+            chunks, chunk_index, question_index, embedding_model = self._jobs.get()
+            try:
+                self.index_questions(chunks, chunk_index, question_index, embedding_model)
+            except Exception as e:
+                print(f"Error generating questions: {str(e)}")
+                print(traceback.format_exc())
+            finally:
+                with self._idle:
+                    self._pending -= 1
+                    self._idle.notify_all()
+
+    # ==========================================
+    # Generation
+    # ==========================================
+
+    def index_questions(
+        self,
+        chunks: List[Document],
+        chunk_index: VectorIndex,
+        question_index: VectorIndex,
+        embedding_model
+    ) -> int:
+        """Generate, embed and index questions for chunks, one LLM batch at a time.
+
+        Returns:
+            Number of questions indexed
+        """
+        # Imported here: vector_store imports this module
+        from services.vector_store import INDEX_WRITE_LOCK
+
+        indexed = 0
+        for start in range(0, len(chunks), self.batch_chunks):
+            batch = chunks[start:start + self.batch_chunks]
+            questions = self.generate(batch)
+            with self._lock:
+                self._stats["chunks"] += len(batch)
+            if not questions:
+                continue
+            embeddings = embedding_model.embed_documents([question for question, _ in questions])
+            numbers: Dict[str, int] = {}
+            question_ids = []
+            for _, chunk in questions:
+                split_id = chunk.metadata["split_id"]
+                numbers[split_id] = numbers.get(split_id, -1) + 1
+                question_ids.append(f"{split_id}_q{numbers[split_id]}")
+
+            with INDEX_WRITE_LOCK:
+                # Skip chunks deleted while their questions were generated
+                split_ids = list(numbers)
+                live = set(chunk_index.get(ids=split_ids)["ids"])
+                rows = [
+                    (question_id, question, chunk, embedding)
+                    for question_id, (question, chunk), embedding in zip(question_ids, questions, embeddings)
+                    if chunk.metadata["split_id"] in live
+                ]
+                if rows:
+                    question_index.add(
+                        ids=[question_id for question_id, _, _, _ in rows],
+                        embeddings=[embedding for _, _, _, embedding in rows],
+                        texts=[question for _, question, _, _ in rows],
+                        metadatas=[
+                            {key: value for key, value in chunk.metadata.items() if key != "token_count"}
+                            for _, _, chunk, _ in rows
+                        ]
+                    )
+            with self._lock:
+                self._stats["questions"] += len(rows)
+                self._stats["dropped_chunks"] += len(set(split_ids) - live)
+            indexed += len(rows)
+        return indexed
+
+    def generate(self, chunks: List[Document]) -> List[Tuple[str, Document]]:
+        """Ask the LLM for questions about a batch of chunks.
+
+        Returns:
+            (question, chunk) pairs; at most per_chunk per chunk
+        """
+        passages = "\n\n".join(f"[{i + 1}] {chunk.page_content}" for i, chunk in enumerate(chunks))
+        try:
+            with self._lock:
+                self._stats["llm_calls"] += 1
+            text = self.llm.invoke(QUESTION_PROMPT.format(count=self.per_chunk, passages=passages))
+        except Exception as e:
+            print(f"Question generation failed for {len(chunks)} chunks: {str(e)}")
+            with self._lock:
+                self._stats["failed_batches"] += 1
+            return []
+
+        questions: Dict[int, List[str]] = {}
+        for line in text.splitlines():
+            match = QUESTION_LINE.match(line)
+            if not match:
+                continue
+            number, question = int(match.group(1)), match.group(2).strip('"')
+            if 1 <= number <= len(chunks) and len(questions.setdefault(number, [])) < self.per_chunk:
+                questions[number].append(question)
+        return [(question, chunks[number - 1]) for number, items in questions.items() for question in items]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return generation counters and the number of queued jobs."""
+        with self._lock:
+            return {**self._stats, "pending_jobs": self._pending}
+
+
+_generator: Optional[QuestionGenerator] = None
+_generator_lock = threading.Lock()
+
+
+def get_question_generator() -> QuestionGenerator:
+    """Return the process-wide question generator."""
+    global _generator
+    with _generator_lock:
+        if _generator is None:
+            _generator = QuestionGenerator()
+        return _generator
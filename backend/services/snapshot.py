@@ -0,0 +1,305 @@
+import base64
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from config.database import bump_kb_version, get_db, get_dict_cursor, init_db
+from config.settings import (
+    DB_PATH,
+    EMBEDDING_MODEL_NAME,
+    SNAPSHOT_BATCH_SIZE,
+    SNAPSHOT_COMPRESSION
+)
+from services.dedup import DuplicateStore
+from services.parent_store import ParentStore
+from services.vector_index import VectorIndex
+from services.vector_store import INDEX_WRITE_LOCK
+
+SNAPSHOT_FORMAT_VERSION = 1
+SNAPSHOT_METADATA_KEY = b"rag_snapshot"
+# Parent sections (small-to-big retrieval) are rows of this pseudo-collection,
+# with all-zero embeddings
+PARENTS_COLLECTION = "_parents"
+# Near-duplicate records (MinHash signatures and aliases, see services/dedup.py), likewise
+SIGNATURES_COLLECTION = "_signatures"
+# Generated questions (see services/question_index.py); skipped on import without the question index
+QUESTIONS_COLLECTION = "questions"
+
+
+class SnapshotService:
+    """Export and import complete knowledge-base snapshots.
+
+    A snapshot is a single Parquet file with one row per chunk (collection,
+    id, text, metadata JSON, embedding), written in compressed row groups of
+    SNAPSHOT_BATCH_SIZE chunks. The document table and the embedding model
+    name are stored in the file's key-value metadata, so a fresh node can be
+    bootstrapped without calling the embedding model. Parent sections are
+    stored as rows of the PARENTS_COLLECTION pseudo-collection, and
+    near-duplicate records as rows of SIGNATURES_COLLECTION.
+    """
+
+    def __init__(self, indexes: Dict[str, VectorIndex], db_path: Path = DB_PATH):
+        """Create a snapshot service.
+
+        Args:
+            indexes: Vector indexes to snapshot, keyed by collection name
+            db_path: SQLite database holding the documents table
+        """
+        self.indexes = indexes
+        self.db_path = db_path
+        self.parent_store = ParentStore(db_path)
+        self.duplicate_store = DuplicateStore(db_path)
+
+    # ==========================================
+    # Export
+    # ==========================================
+
+    def export_snapshot(self, path: Path, embedding_dtype: str = "float32") -> Dict[str, Any]:
+        """Write a consistent snapshot of all indexes and document rows.
+
+        Index writes in this process are blocked while the snapshot is taken.
+        Chunks whose document row is missing (an ingestion or deletion in
+        flight in another process) are left out.
+
+        Args:
+            path: Destination Parquet file
+            embedding_dtype: "float32", or "float16" for a smaller file
+
+        Returns:
+            Dict with chunk and document counts, file size and duration
+        """
+        started = time.perf_counter()
+        value_type = {"float32": pa.float32(), "float16": pa.float16()}[embedding_dtype]
+        path = Path(path)
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+
+        with INDEX_WRITE_LOCK:
+            documents = self._read_document_rows()
+            doc_ids = {row["id"] for row in documents}
+            dim = None
+            chunk_count = parent_count = signature_count = 0
+            writer = None
+
+            try:
+                for collection, batch in self._iter_chunks():
+                    keep = [i for i, metadata in enumerate(batch["metadatas"]) if metadata.get("doc_id") in doc_ids]
+                    if not keep:
+                        continue
+
+                    if collection in (PARENTS_COLLECTION, SIGNATURES_COLLECTION):
+                        if dim is None:
+                            continue
+                        embeddings = np.zeros((len(keep), dim), dtype=np.float32)
+                    else:
+                        embeddings = np.asarray([batch["embeddings"][i] for i in keep], dtype=np.float32)
+                    dim = dim or embeddings.shape[1]
+                    table = pa.table({
+                        "collection": pa.array([collection] * len(keep)).dictionary_encode(),
+                        "id": [batch["ids"][i] for i in keep],
+                        "document": [batch["documents"][i] for i in keep],
+                        "metadata": [json.dumps(batch["metadatas"][i]) for i in keep],
+                        "embedding": pa.FixedSizeListArray.from_arrays(
+                            pa.array(embeddings.astype(embedding_dtype).ravel(), type=value_type), dim
+                        ),
+                    })
+
+                    if writer is None:
+                        writer = pq.ParquetWriter(
+                            str(tmp_path),
+                            table.schema.with_metadata({SNAPSHOT_METADATA_KEY: json.dumps({
+                                "format_version": SNAPSHOT_FORMAT_VERSION,
+                                "embedding_model": EMBEDDING_MODEL_NAME,
+                                "embedding_dim": int(dim),
+                                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                                "documents": documents,
+                            })}),
+                            compression=SNAPSHOT_COMPRESSION
+                        )
+                    writer.write_table(table, row_group_size=SNAPSHOT_BATCH_SIZE)
+                    if collection == PARENTS_COLLECTION:
+                        parent_count += len(keep)
+                    elif collection == SIGNATURES_COLLECTION:
+                        signature_count += len(keep)
+                    else:
+                        chunk_count += len(keep)
+            except BaseException:
+                if writer is not None:
+                    writer.close()
+                tmp_path.unlink(missing_ok=True)
+                raise
+            if writer is not None:
+                writer.close()
+
+        if writer is None:
+            raise ValueError("Nothing to export: the knowledge base is empty")
+
+        tmp_path.replace(path)
+        return {
+            "path": str(path),
+            "chunks": chunk_count,
+            "parents": parent_count,
+            "signatures": signature_count,
+            "documents": len(documents),
+            "bytes": path.stat().st_size,
+            "seconds": time.perf_counter() - started
+        }
+
+    def _read_document_rows(self) -> List[Dict[str, Any]]:
+        with get_db(self.db_path) as conn:
+            cursor = get_dict_cursor(conn)
+            cursor.execute("SELECT * FROM documents")
+            return cursor.fetchall()
+
+    def _iter_chunks(self) -> Iterator[tuple]:
+        for collection, index in self.indexes.items():
+            total = index.count()
+            for offset in range(0, total, SNAPSHOT_BATCH_SIZE):
+                batch = index.get(limit=SNAPSHOT_BATCH_SIZE, offset=offset, include_embeddings=True)
+                if batch["ids"]:
+                    yield collection, batch
+
+        # Parent sections and near-duplicate records last: they are only written along with chunks
+        doc_ids = {row["id"] for row in self._read_document_rows()}
+        rows = list(self.parent_store.iter_rows(doc_ids))
+        for start in range(0, len(rows), SNAPSHOT_BATCH_SIZE):
+            batch = rows[start:start + SNAPSHOT_BATCH_SIZE]
+            yield PARENTS_COLLECTION, {
+                "ids": [row["id"] for row in batch],
+                "documents": [row["text"] for row in batch],
+                "metadatas": [json.loads(row["metadata"]) for row in batch]
+            }
+
+        rows = list(self.duplicate_store.iter_rows(doc_ids))
+        for start in range(0, len(rows), SNAPSHOT_BATCH_SIZE):
+            batch = rows[start:start + SNAPSHOT_BATCH_SIZE]
+            yield SIGNATURES_COLLECTION, {
+                "ids": [row["split_id"] for row in batch],
+                "documents": [row["text"] or "" for row in batch],
+                "metadatas": [
+                    {
+                        "doc_id": row["doc_id"],
+                        "signature": base64.b64encode(row["signature"]).decode(),
+                        "numbers_hash": row["numbers_hash"],
+                        "canonical_id": row["canonical_id"],
+                        "metadata": row["metadata"]
+                    }
+                    for row in batch
+                ]
+            }
+
+    # ==========================================
+    # Import
+    # ==========================================
+
+    def import_snapshot(self, path: Path, merge: bool = False) -> Dict[str, Any]:
+        """Bulk-load a snapshot into this instance without re-embedding.
+
+        Args:
+            path: Snapshot Parquet file
+            merge: Allow importing into a non-empty knowledge base
+                (existing chunks and documents with the same ids are replaced)
+
+        Returns:
+            Dict with chunk and document counts and duration
+
+        Raises:
+            ValueError: If the snapshot is incompatible or the target is not empty
+        """
+        started = time.perf_counter()
+        parquet_file = pq.ParquetFile(str(path))
+        info = json.loads(parquet_file.schema_arrow.metadata[SNAPSHOT_METADATA_KEY])
+
+        if info["format_version"] != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format version: {info['format_version']}")
+        if info["embedding_model"] != EMBEDDING_MODEL_NAME:
+            raise ValueError(
+                f"Snapshot was built with {info['embedding_model']}, "
+                f"but this instance uses {EMBEDDING_MODEL_NAME}"
+            )
+
+        init_db(self.db_path)
+        if not merge and (self._read_document_rows() or any(i.count() for i in self.indexes.values())):
+            raise ValueError("Target knowledge base is not empty; import with merge enabled to overwrite")
+
+        dim = info["embedding_dim"]
+        chunk_count = parent_count = signature_count = skipped_questions = 0
+        with INDEX_WRITE_LOCK:
+            for batch in parquet_file.iter_batches(batch_size=SNAPSHOT_BATCH_SIZE):
+                collections = batch.column("collection").to_pylist()
+                embeddings = batch.column("embedding").flatten().to_numpy(zero_copy_only=False)
+                embeddings = embeddings.astype(np.float32).reshape(-1, dim)
+                ids = batch.column("id").to_pylist()
+                texts = batch.column("document").to_pylist()
+                metadatas = [json.loads(m) for m in batch.column("metadata").to_pylist()]
+
+                for collection in dict.fromkeys(collections):
+                    rows = [i for i, c in enumerate(collections) if c == collection]
+                    if collection == PARENTS_COLLECTION:
+                        self.parent_store.add_rows([
+                            {
+                                "id": ids[i],
+                                "doc_id": metadatas[i]["doc_id"],
+                                "text": texts[i],
+                                "metadata": json.dumps(metadatas[i]),
+                                "token_count": metadatas[i].get("token_count")
+                            }
+                            for i in rows
+                        ])
+                        parent_count += len(rows)
+                        continue
+                    if collection == SIGNATURES_COLLECTION:
+                        self.duplicate_store.add_rows([
+                            {
+                                "split_id": ids[i],
+                                "doc_id": metadatas[i]["doc_id"],
+                                "signature": base64.b64decode(metadatas[i]["signature"]),
+                                "numbers_hash": metadatas[i]["numbers_hash"],
+                                "canonical_id": metadatas[i]["canonical_id"],
+                                "text": texts[i] if metadatas[i]["canonical_id"] else None,
+                                "metadata": metadatas[i]["metadata"]
+                            }
+                            for i in rows
+                        ])
+                        signature_count += len(rows)
+                        continue
+                    if collection == QUESTIONS_COLLECTION and collection not in self.indexes:
+                        # Generated questions are only kept with the question index enabled
+                        skipped_questions += len(rows)
+                        continue
+                    if collection not in self.indexes:
+                        raise ValueError(f"Snapshot contains unknown collection: {collection}")
+                    self.indexes[collection].add(
+                        ids=[ids[i] for i in rows],
+                        embeddings=embeddings[rows],
+                        texts=[texts[i] for i in rows],
+                        metadatas=[metadatas[i] for i in rows]
+                    )
+                    chunk_count += len(rows)
+
+            # Document rows go in last so readers never see a document without chunks
+            if info["documents"]:
+                columns = list(info["documents"][0])
+                with get_db(self.db_path) as conn:
+                    conn.executemany(
+                        f"INSERT OR REPLACE INTO documents ({', '.join(columns)}) "
+                        f"VALUES ({', '.join(':' + column for column in columns)})",
+                        info["documents"]
+                    )
+                    bump_kb_version(conn.cursor())
+                    conn.commit()
+
+        if skipped_questions:
+            print(f"Skipped {skipped_questions} generated questions: the question index is not enabled")
+        return {
+            "chunks": chunk_count,
+            "parents": parent_count,
+            "signatures": signature_count,
+            "documents": len(info["documents"]),
+            "seconds": time.perf_counter() - started
+        }
+
@@ -0,0 +1,300 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, Set, Tuple
+
+from config.database import bump_kb_version, get_db
+from config.settings import (
+    BLOB_DIR,
+    DB_PATH,
+    STORAGE_GC_GRACE_SECONDS,
+    STORAGE_GC_SCAN_BATCH_SIZE,
+    UPLOAD_DIR,
+    UPLOAD_READ_CHUNK_SIZE
+)
+from services.dedup import DuplicateStore
+from services.parent_store import ParentStore
+from services.vector_index import VectorIndex
+from services.vector_store import INDEX_WRITE_LOCK
+
+# Documents being ingested in this process; their chunks exist before their
+# database row, so garbage collection must not treat them as orphans
+_ingesting: Set[str] = set()
+_ingesting_lock = threading.Lock()
+
+
+@contextmanager
+def track_ingestion(doc_id: str):
+    """Mark a document as being ingested for the duration of the block."""
+    with _ingesting_lock:
+        _ingesting.add(doc_id)
+    try:
+        yield
+    finally:
+        with _ingesting_lock:
+            _ingesting.discard(doc_id)
+
+
+class BlobStore:
+    """Content-addressed storage for uploaded files.
+
+    Each distinct file is stored once, at <root>/<sha256[:2]>/<sha256><ext>,
+    however often it is uploaded. Uploads are hashed while they are streamed
+    to a temporary file, which is then renamed into place.
+    """
+
+    def __init__(self, root: Path = BLOB_DIR):
+        """Create a blob store.
+
+        Args:
+            root: Directory holding the blobs (created on first write)
+        """
+        self.root = Path(root)
+        self.tmp_dir = self.root / "tmp"
+
+    def path_for(self, content_hash: str, extension: str) -> Path:
+        return self.root / content_hash[:2] / f"{content_hash}{extension}"
+
+    def save(self, fileobj: BinaryIO, filename: str) -> Tuple[str, Path, bool]:
+        """Stream an upload into the store.
+
+        Args:
+            fileobj: Readable binary file object
+            filename: Original file name; its extension is kept so loaders
+                can still pick the right parser
+
+        Returns:
+            Tuple of (SHA-256 hex digest, blob path, whether the blob is new)
+        """
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while chunk := fileobj.read(UPLOAD_READ_CHUNK_SIZE):
+                    digest.update(chunk)
+                    f.write(chunk)
+
+            content_hash = digest.hexdigest()
+            path = self.path_for(content_hash, Path(filename).suffix.lower())
+            path.parent.mkdir(exist_ok=True)
+            if path.exists():
+                # Identical content is already stored; refresh its mtime so a
+                # concurrent garbage collection sees it as recently used
+                os.unlink(tmp_path)
+                os.utime(path)
+                return content_hash, path, False
+            os.replace(tmp_path, path)
+            return content_hash, path, True
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+    def relative_path(self, path: Path) -> str:
+        """Path of a blob relative to UPLOAD_DIR, as stored in the documents table."""
+        return str(Path(path).relative_to(UPLOAD_DIR))
+
+    def delete(self, storage_path: str) -> int:
+        """Remove a blob given its stored relative path.
+
+        Returns:
+            Bytes freed (0 if it did not exist)
+        """
+        path = UPLOAD_DIR / storage_path
+        try:
+            size = path.stat().st_size
+            path.unlink()
+        except FileNotFoundError:
+            return 0
+        _remove_if_empty(path.parent)
+        return size
+
+    def iter_blobs(self) -> Iterator[Path]:
+        """Yield every stored blob (temporary upload files excluded)."""
+        if not self.root.exists():
+            return
+        for prefix_dir in self.root.iterdir():
+            if prefix_dir.is_dir() and prefix_dir != self.tmp_dir:
+                yield from (p for p in prefix_dir.iterdir() if p.is_file())
+
+
+class StorageGarbageCollector:
+    """Reconcile uploaded files, the documents table and the vector indexes.
+
+    Removes:
+    - chunks, parent sections and near-duplicate records whose document row
+      no longer exists (aliases in live documents take the place of deleted
+      chunks they duplicate)
+    - blobs no document row references, and abandoned temporary uploads
+    - per-document upload directories from the old layout
+      (uploaded_files/<doc_id>/) whose document is gone
+
+    Files younger than STORAGE_GC_GRACE_SECONDS are left alone, as are
+    documents being ingested in this process. Run it in the process that
+    ingests (the /admin endpoint), or while ingestion is stopped.
+    """
+
+    def __init__(self, indexes: Dict[str, VectorIndex], blob_store: BlobStore, db_path: Path = DB_PATH):
+        """Create a garbage collector.
+
+        Args:
+            indexes: Vector indexes to reconcile, keyed by collection name
+            blob_store: Store holding uploaded files
+            db_path: SQLite database holding the documents table
+        """
+        self.indexes = indexes
+        self.blob_store = blob_store
+        self.db_path = db_path
+        self.parent_store = ParentStore(db_path)
+        self.duplicate_store = DuplicateStore(db_path)
+
+    def collect(self, dry_run: bool = False, grace_seconds: float = STORAGE_GC_GRACE_SECONDS) -> Dict[str, Any]:
+        """Find and (unless dry_run) remove orphaned chunks and files.
+
+        Args:
+            dry_run: Only report what would be removed
+            grace_seconds: Skip files modified more recently than this
+
+        Returns:
+            Dict with counts of removed chunks, parent sections, near-duplicate records and
+            files, reclaimed bytes, documents without chunks and duration
+        """
+        started = time.perf_counter()
+        cutoff = time.time() - grace_seconds
+        doc_ids, storage_paths = self._read_documents()
+
+        # Near-duplicate records of deleted documents, first: aliases in live documents
+        # are promoted before the chunks they duplicate are removed below
+        with _ingesting_lock:
+            protected = doc_ids | _ingesting
+        signature_doc_ids = self.duplicate_store.doc_ids()
+        orphans = [doc_id for doc_id in signature_doc_ids if doc_id not in protected]
+        if orphans:
+            current_doc_ids = self._read_documents()[0]
+            orphans = [doc_id for doc_id in orphans if doc_id not in current_doc_ids]
+        orphan_signatures = 0
+        if orphans:
+            print(f"signatures: {len(orphans)} deleted documents still have near-duplicate records")
+            orphan_signatures = self.duplicate_store.count(orphans)
+            if not dry_run and "documents" in self.indexes:
+                with INDEX_WRITE_LOCK:
+                    promoted, _ = self.duplicate_store.release(orphans, self.indexes["documents"])
+                if promoted:
+                    print(f"Promoted {len(promoted)} near-duplicate chunks of live documents into the index")
+
+        # Chunks of deleted documents (documents whose chunks are all aliases have chunks too)
+        chunk_doc_ids = signature_doc_ids - set(orphans)
+        orphan_chunks = 0
+        for name, index in self.indexes.items():
+            counts = self._count_chunks_by_document(index)
+            chunk_doc_ids.update(counts)
+            with _ingesting_lock:
+                protected = doc_ids | _ingesting
+            orphans = [doc_id for doc_id in counts if doc_id is not None and doc_id not in protected]
+            if not orphans:
+                continue
+            # Re-read the table so documents committed since the scan are kept
+            current_doc_ids = self._read_documents()[0]
+            orphans = [doc_id for doc_id in orphans if doc_id not in current_doc_ids]
+            orphan_chunks += sum(counts[doc_id] for doc_id in orphans)
+            print(f"{name}: {len(orphans)} deleted documents still have chunks")
+            if not dry_run:
+                with INDEX_WRITE_LOCK:
+                    for start in range(0, len(orphans), 500):
+                        index.delete({"doc_id": {"$in": orphans[start:start + 500]}})
+                with get_db(self.db_path) as conn:
+                    bump_kb_version(conn.cursor())
+                    conn.commit()
+
+        # Parent sections of deleted documents
+        with _ingesting_lock:
+            protected = doc_ids | _ingesting
+        orphans = [doc_id for doc_id in self.parent_store.doc_ids() if doc_id not in protected]
+        if orphans:
+            current_doc_ids = self._read_documents()[0]
+            orphans = [doc_id for doc_id in orphans if doc_id not in current_doc_ids]
+        orphan_parents = 0
+        if orphans:
+            print(f"parents: {len(orphans)} deleted documents still have parent sections")
+            orphan_parents = self.parent_store.count(orphans) if dry_run else self.parent_store.delete(orphans)
+
+        # Files nothing references
+        files_removed = 0
+        bytes_reclaimed = 0
+        for path in self._orphan_files(doc_ids, storage_paths, cutoff):
+            size = _tree_size(path)
+            print(f"Orphaned upload: {path.relative_to(UPLOAD_DIR)} ({size} bytes)")
+            if not dry_run:
+                if path.is_dir():
+                    shutil.rmtree(path)
+                else:
+                    path.unlink()
+                    _remove_if_empty(path.parent)
+            files_removed += 1
+            bytes_reclaimed += size
+
+        return {
+            "dry_run": dry_run,
+            "documents": len(doc_ids),
+            "orphan_chunks_removed": orphan_chunks,
+            "orphan_parents_removed": orphan_parents,
+            "orphan_signatures_removed": orphan_signatures,
+            "files_removed": files_removed,
+            "bytes_reclaimed": bytes_reclaimed,
+            "documents_without_chunks": sorted(doc_ids - chunk_doc_ids),
+            "seconds": time.perf_counter() - started
+        }
+
+    def _read_documents(self) -> Tuple[Set[str], Set[str]]:
+        with get_db(self.db_path) as conn:
+            rows = conn.execute("SELECT id, storage_path FROM documents").fetchall()
+        return {doc_id for doc_id, _ in rows}, {path for _, path in rows if path}
+
+    def _count_chunks_by_document(self, index: VectorIndex) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        offset = 0
+        while True:
+            batch = index.get(limit=STORAGE_GC_SCAN_BATCH_SIZE, offset=offset)
+            for metadata in batch["metadatas"]:
+                doc_id = metadata.get("doc_id")
+                counts[doc_id] = counts.get(doc_id, 0) + 1
+            if len(batch["ids"]) < STORAGE_GC_SCAN_BATCH_SIZE:
+                return counts
+            offset += STORAGE_GC_SCAN_BATCH_SIZE
+
+    def _orphan_files(self, doc_ids: Set[str], storage_paths: Set[str], cutoff: float) -> Iterator[Path]:
+        for blob in self.blob_store.iter_blobs():
+            if self.blob_store.relative_path(blob) not in storage_paths and blob.stat().st_mtime < cutoff:
+                yield blob
+
+        if self.blob_store.tmp_dir.exists():
+            for tmp_file in self.blob_store.tmp_dir.iterdir():
+                if tmp_file.stat().st_mtime < cutoff:
+                    yield tmp_file
+
+        for entry in UPLOAD_DIR.iterdir():
+            if (
+                entry.is_dir()
+                and entry != self.blob_store.root
+                and entry.name not in doc_ids
+                and entry.stat().st_mtime < cutoff
+            ):
+                yield entry
+
+
+def _tree_size(path: Path) -> int:
+    if path.is_file():
+        return path.stat().st_size
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+
+def _remove_if_empty(directory: Path):
+    try:
+        directory.rmdir()
+    except OSError:
+        pass
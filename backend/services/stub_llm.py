@@ -0,0 +1,54 @@
+from typing import Any, Iterator, List, Optional
+
+import requests
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+
+class StubLLM(LLM):
+    """LangChain client for the local stub LLM server (utils/stub_llm_server.py).
+
+    Used for load tests, benchmarks and model profiling without a provider
+    API key; select it with LLM_PROVIDER=stub.
+    """
+
+    model: str
+    base_url: str = "http://localhost:8090"
+    max_tokens: int = 200
+    timeout: Optional[float] = 30
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _request(self, prompt: str, stream: bool) -> requests.Response:
+        response = requests.post(
+            f"{self.base_url}/v1/generate",
+            json={"model": self.model, "prompt": prompt, "max_tokens": self.max_tokens, "stream": stream},
+            stream=stream,
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response
+
+    def _call(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> str:
+        return self._request(prompt, stream=False).json()["text"]
+
+    def _stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> Iterator[GenerationChunk]:
+        with self._request(prompt, stream=True) as response:
+            for text in response.iter_content(chunk_size=None, decode_unicode=True):
+                if text:
+                    yield GenerationChunk(text=text)
@@ -0,0 +1,1106 @@
+"""Vector index backends used by VectorStoreService.
+
+Two engines implement the same ``VectorIndex`` interface:
+
+- ``ChromaVectorIndex``: the ChromaDB collection we have always used.
+- ``MmapVectorIndex``: an in-process engine that keeps vectors in one
+  contiguous memory-mapped file, searches small corpora exactly with NumPy
+  and switches to an IVF (inverted file) partitioned search for large ones.
+  Chunk texts and metadata live in a SQLite sidecar used for ``doc_id``
+  filtering and deletes.
+
+Scores returned by ``search`` are cosine distances (lower is closer) for both
+engines, matching what Chroma reports for a ``cosine`` collection.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain.docstore.document import Document
+
+from config.settings import (
+    VECTORDB_DIR,
+    VECTOR_BACKEND,
+    SERVER_ROLE,
+    CHROMA_SERVER_HOST,
+    CHROMA_SERVER_PORT,
+    INDEX_REFRESH_INTERVAL,
+    CHROMA_HNSW_DEFAULTS,
+    CHROMA_HNSW_COLLECTION_OVERRIDES,
+    MMAP_INDEX_DIR,
+    MMAP_INDEX_DTYPE,
+    MMAP_IVF_MIN_VECTORS,
+    MMAP_IVF_NLIST,
+    MMAP_IVF_NPROBE,
+    MMAP_INDEX_QUANTIZATION,
+    MMAP_RESCORE_FACTOR,
+    QUESTION_INDEX_ENABLED
+)
+from services.quantization import Quantizer, get_quantizer
+
+# Rows scored per matrix multiplication during exact search
+SEARCH_BLOCK_ROWS = 16384
+# Vectors sampled to train data-dependent quantizers
+QUANTIZER_TRAIN_SAMPLE = 100000
+# Training sample size per IVF list and number of k-means iterations
+IVF_TRAIN_POINTS_PER_LIST = 64
+IVF_TRAIN_ITERATIONS = 10
+# Compact the vectors file once this fraction of rows has been deleted
+COMPACTION_DEAD_FRACTION = 0.3
+# Per-row files rewritten by compaction; generation N > 0 is stored as e.g. vectors.N.bin
+GENERATION_FILES = ("vectors.bin", "ivf_assign.bin", "codes.bin", "meta.sqlite")
+# Values Chroma uses for HNSW parameters missing from collection metadata
+CHROMA_BUILTIN_HNSW_DEFAULTS = {
+    "hnsw:M": 16,
+    "hnsw:construction_ef": 100,
+    "hnsw:search_ef": 10,
+    "hnsw:batch_size": 100,
+    "hnsw:sync_threshold": 1000,
+}
+
+
+class VectorIndex(ABC):
+    """Storage and nearest-neighbour search for chunk embeddings."""
+
+    @abstractmethod
+    def add(
+        self,
+        ids: List[str],
+        embeddings: Sequence[Sequence[float]],
+        texts: List[str],
+        metadatas: List[Dict[str, Any]]
+    ):
+        """Add (or replace) chunks with precomputed embeddings.
+
+        Args:
+            ids: Unique chunk identifiers
+            embeddings: One embedding per chunk
+            texts: Chunk texts
+            metadatas: Chunk metadata dictionaries
+        """
+
+    @abstractmethod
+    def search(
+        self,
+        embeddings: Sequence[Sequence[float]],
+        k: int,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        """Find the nearest chunks for each query embedding.
+
+        Args:
+            embeddings: One or more query embeddings
+            k: Number of results per query
+            where: Optional metadata filter, e.g. {"doc_id": "..."}
+
+        Returns:
+            For each query, a list of (Document, cosine distance) pairs
+        """
+
+    @abstractmethod
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        include_embeddings: bool = False
+    ) -> Dict[str, List[Any]]:
+        """Fetch stored chunks by id and/or metadata filter.
+
+        Returns:
+            Dict with "ids", "documents", "metadatas" and, if requested, "embeddings"
+        """
+
+    @abstractmethod
+    def delete(self, where: Dict[str, Any]) -> int:
+        """Delete all chunks matching the metadata filter.
+
+        Returns:
+            Number of chunks deleted
+        """
+
+    @abstractmethod
+    def count(self) -> int:
+        """Return the number of stored chunks."""
+
+    def reopen(self):
+        """Recreate process-local handles (connections, clients) after a fork.
+
+        Forked workers must not share SQLite connections or client threads
+        with their parent. Memory-mapped data stays shared copy-on-write.
+        """
+
+
+# ==========================================
+# Chroma Backend
+# ==========================================
+
+def get_hnsw_config(collection_name: str) -> Dict[str, Any]:
+    """Return the HNSW collection metadata configured for a collection.
+
+    Args:
+        collection_name: Chroma collection name
+
+    Returns:
+        CHROMA_HNSW_DEFAULTS merged with the collection's overrides
+    """
+    config = dict(CHROMA_HNSW_DEFAULTS)
+    config.update(CHROMA_HNSW_COLLECTION_OVERRIDES.get(collection_name, {}))
+    return config
+
+
+class ChromaVectorIndex(VectorIndex):
+    """VectorIndex backed by a ChromaDB collection."""
+
+    def __init__(
+        self,
+        client,
+        collection_name: str,
+        metadata: Optional[Dict[str, Any]] = None,
+        client_factory: Optional[Callable[[], Any]] = None
+    ):
+        self.client = client
+        self.client_factory = client_factory
+        self.collection_name = collection_name
+        metadata = metadata or get_hnsw_config(collection_name)
+        self.collection = client.get_or_create_collection(
+            name=collection_name,
+            metadata=metadata
+        )
+
+        # HNSW parameters are fixed at creation; flag drift from the configuration
+        current = self.collection.metadata or {}
+        stale = {
+            key: (current.get(key), value)
+            for key, value in metadata.items()
+            if key in CHROMA_BUILTIN_HNSW_DEFAULTS
+            and current.get(key, CHROMA_BUILTIN_HNSW_DEFAULTS[key]) != value
+        }
+        if stale:
+            print(
+                f"Collection '{collection_name}' HNSW parameters differ from configuration "
+                f"(current, configured): {stale}. Run `python -m utils.rebuild_index` to apply them."
+            )
+
+    def add(self, ids, embeddings, texts, metadatas):
+        batch_size = self.client.get_max_batch_size()
+        for start in range(0, len(ids), batch_size):
+            end = start + batch_size
+            self.collection.upsert(
+                ids=ids[start:end],
+                embeddings=[list(map(float, e)) for e in embeddings[start:end]],
+                documents=texts[start:end],
+                metadatas=metadatas[start:end]
+            )
+
+    def search(self, embeddings, k, where=None):
+        if not len(embeddings) or self.collection.count() == 0:
+            return [[] for _ in range(len(embeddings))]
+
+        results = self.collection.query(
+            query_embeddings=[list(map(float, e)) for e in embeddings],
+            n_results=k,
+            where=where,
+            include=["documents", "metadatas", "distances"]
+        )
+        return [
+            [
+                (Document(page_content=text or "", metadata=metadata or {}), distance)
+                for text, metadata, distance in zip(texts, metadatas, distances)
+            ]
+            for texts, metadatas, distances in zip(
+                results["documents"], results["metadatas"], results["distances"]
+            )
+        ]
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include_embeddings=False):
+        include = ["documents", "metadatas"]
+        if include_embeddings:
+            include.append("embeddings")
+        results = self.collection.get(
+            ids=ids,
+            where=where,
+            limit=limit,
+            offset=offset,
+            include=include
+        )
+        output = {
+            "ids": list(results["ids"]),
+            "documents": list(results["documents"]),
+            "metadatas": list(results["metadatas"])
+        }
+        if include_embeddings:
+            output["embeddings"] = [list(e) for e in results["embeddings"]]
+        return output
+
+    def delete(self, where):
+        results = self.collection.get(where=where, include=[])
+        chunk_ids = results["ids"]
+        if chunk_ids:
+            self.collection.delete(ids=chunk_ids)
+        return len(chunk_ids)
+
+    def count(self):
+        return self.collection.count()
+
+    def reopen(self):
+        if self.client_factory is None:
+            return
+        from chromadb.api.client import SharedSystemClient
+        # Drop the parent's cached system (SQLite handles, background threads)
+        SharedSystemClient.clear_system_cache()
+        self.client = self.client_factory()
+        self.collection = self.client.get_collection(self.collection_name)
+
+    def rebuild(
+        self,
+        metadata: Optional[Dict[str, Any]] = None,
+        batch_size: int = 1000,
+        keep_backup: bool = True
+    ) -> Optional[str]:
+        """Re-create the collection with new HNSW parameters without re-embedding.
+
+        Stored ids, embeddings, texts and metadata are copied into a new
+        collection, which is swapped in by renaming once the copy is verified.
+        The rebuild aborts, leaving the original untouched, if the source
+        collection changes while it is being copied.
+
+        Args:
+            metadata: Collection metadata for the new collection
+                (defaults to the configured HNSW parameters)
+            batch_size: Number of chunks copied per request
+            keep_backup: Keep the original collection under a backup name
+
+        Returns:
+            Name of the backup collection, or None if it was dropped
+        """
+        metadata = metadata or get_hnsw_config(self.collection_name)
+        suffix = time.strftime("%Y%m%d%H%M%S")
+        source = self.collection
+        source_count = source.count()
+        target = self.client.create_collection(
+            name=f"{self.collection_name}_rebuild_{suffix}",
+            metadata=metadata
+        )
+
+        try:
+            print(f"Copying {source_count} chunks into {target.name} with {metadata}")
+            for offset in range(0, source_count, batch_size):
+                batch = source.get(
+                    limit=batch_size,
+                    offset=offset,
+                    include=["embeddings", "documents", "metadatas"]
+                )
+                target.add(
+                    ids=batch["ids"],
+                    embeddings=batch["embeddings"],
+                    documents=batch["documents"],
+                    metadatas=batch["metadatas"]
+                )
+
+            if source.count() != source_count or target.count() != source_count:
+                raise RuntimeError(
+                    f"Collection changed during rebuild (source {source.count()}, "
+                    f"copied {target.count()}, expected {source_count})"
+                )
+        except Exception:
+            self.client.delete_collection(target.name)
+            raise
+
+        backup_name = f"{self.collection_name}_backup_{suffix}"
+        source.modify(name=backup_name)
+        target.modify(name=self.collection_name)
+        self.collection = self.client.get_collection(self.collection_name)
+
+        if not keep_backup:
+            self.client.delete_collection(backup_name)
+            return None
+        return backup_name
+
+
+# ==========================================
+# Memory-mapped Flat/IVF Backend
+# ==========================================
+
+class MmapVectorIndex(VectorIndex):
+    """In-process vector index over a memory-mapped file of normalized vectors.
+
+    Layout of the index directory:
+
+    - ``header.json``: dimension, dtype, row count, generation and IVF
+      state. It is replaced atomically after every write and is the source
+      of truth for which files are current and how many of their rows are
+      valid.
+    - ``vectors.bin``: row-major vectors, L2-normalized so that the dot
+      product is the cosine similarity.
+    - ``meta.sqlite``: one row per live chunk (row number, id, doc_id, text,
+      metadata). Deleted chunks are removed here and their vector rows are
+      skipped until the next compaction.
+    - ``ivf_centroids.npy`` / ``ivf_assign.bin``: IVF coarse centroids and
+      the list assignment of every row, present once the index has grown
+      past ``ivf_min_vectors``.
+    - ``codes.bin``: optional compact codes (float16, int8 or binary) used
+      for the first search pass when ``quantization`` is set. The shortlist
+      of ``k * rescore_factor`` rows is rescored against ``vectors.bin``,
+      whose pages are only read from disk for the shortlisted rows.
+
+    Compaction renumbers rows, so it writes ``vectors.bin``,
+    ``ivf_assign.bin``, ``codes.bin`` and ``meta.sqlite`` as a new
+    generation (``vectors.1.bin``, ``meta.1.sqlite``, ...) and publishes it
+    with the header.
+
+    One writer process may share the directory with any number of
+    ``read_only`` instances in other processes. Files that readers map are
+    only ever appended to or replaced atomically, and readers reload when
+    the header version changes (checked at most every ``refresh_interval``
+    seconds). Until then they keep searching their generation, whose files
+    stay on disk until the next compaction.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        dtype: str = MMAP_INDEX_DTYPE,
+        ivf_min_vectors: int = MMAP_IVF_MIN_VECTORS,
+        nlist: int = MMAP_IVF_NLIST,
+        nprobe: int = MMAP_IVF_NPROBE,
+        quantization: str = MMAP_INDEX_QUANTIZATION,
+        rescore_factor: int = MMAP_RESCORE_FACTOR,
+        read_only: bool = False,
+        refresh_interval: float = INDEX_REFRESH_INTERVAL
+    ):
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+        get_quantizer(quantization, 1)  # Validate the name early
+
+        self.path = Path(path)
+        self.read_only = read_only
+        self.refresh_interval = refresh_interval
+        self._last_refresh = time.monotonic()
+        if not read_only:
+            self.path.mkdir(parents=True, exist_ok=True)
+        self.ivf_min_vectors = ivf_min_vectors
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor
+        self._lock = threading.RLock()
+
+        self._header_path = self.path / "header.json"
+        self._centroids_path = self.path / "ivf_centroids.npy"
+        self._header = self._read_header() or {
+            "dim": None,
+            "dtype": dtype,
+            "count": 0,
+            "version": 0,
+            "generation": 0,
+            "ivf_trained_count": 0,
+            "quantization": "none",
+            "quantizer_trained_count": 0
+        }
+        _set_header_defaults(self._header)
+        self._set_generation_paths()
+
+        self._conn = None
+        if read_only:
+            if self._sidecar_path.exists():
+                self._conn = self._connect()
+        else:
+            self._conn = self._open_sidecar(self._sidecar_path)
+            self._remove_old_generations()
+
+        self.dtype = np.dtype(self._header["dtype"])
+        self._load()
+
+        # Re-encode existing vectors when the configured quantization changed
+        if not read_only and self._header["dim"] and self._header["quantization"] != self.quantization:
+            self.build_codes()
+
+    # ------------------------------------------
+    # Persistence helpers
+    # ------------------------------------------
+
+    def _generation_file(self, name: str, generation: int) -> Path:
+        """Path of one of GENERATION_FILES; generation 0 keeps the plain name."""
+        if not generation:
+            return self.path / name
+        stem, suffix = name.rsplit(".", 1)
+        return self.path / f"{stem}.{generation}.{suffix}"
+
+    def _set_generation_paths(self):
+        generation = self._header["generation"]
+        self._vectors_path = self._generation_file("vectors.bin", generation)
+        self._assign_path = self._generation_file("ivf_assign.bin", generation)
+        self._codes_path = self._generation_file("codes.bin", generation)
+        self._sidecar_path = self._generation_file("meta.sqlite", generation)
+
+    def _remove_old_generations(self):
+        """Delete files of generations other than the current and previous one.
+
+        The previous generation is kept for readers that have not refreshed
+        yet. Files of a later generation belong to a compaction that crashed
+        before publishing its header.
+        """
+        keep = {self._header["generation"], self._header["generation"] - 1}
+        for name in GENERATION_FILES:
+            stem, suffix = name.rsplit(".", 1)
+            pattern = re.compile(rf"{re.escape(stem)}(?:\.(\d+))?\.{suffix}(?:-wal|-shm|-journal)?")
+            for file_path in self.path.iterdir():
+                match = pattern.fullmatch(file_path.name)
+                if match and int(match.group(1) or 0) not in keep:
+                    file_path.unlink(missing_ok=True)
+
+    def _open_sidecar(self, sidecar_path: Path) -> sqlite3.Connection:
+        """Open a writable sidecar, creating its schema if needed."""
+        conn = sqlite3.connect(str(sidecar_path), check_same_thread=False)
+        # WAL lets read-only processes query the sidecar while we write
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS chunks (
+            row INTEGER PRIMARY KEY,
+            id TEXT UNIQUE NOT NULL,
+            doc_id TEXT,
+            document TEXT,
+            metadata TEXT
+        )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_doc_id ON chunks (doc_id)")
+        conn.commit()
+        return conn
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.read_only:
+            return sqlite3.connect(f"file:{self._sidecar_path}?mode=ro", uri=True, check_same_thread=False)
+        return sqlite3.connect(str(self._sidecar_path), check_same_thread=False)
+
+    def reopen(self):
+        self._lock = threading.RLock()
+        if self._conn is not None:
+            self._conn = self._connect()
+
+    def _check_writable(self):
+        if self.read_only:
+            raise PermissionError(f"Vector index at {self.path} is open read-only")
+
+    def refresh(self):
+        """Reload the header and memory maps if a writer published a new version."""
+        with self._lock:
+            header = self._read_header()
+            if header is None:
+                return
+            if header["version"] == self._header["version"] and self._conn is not None:
+                return
+            _set_header_defaults(header)
+            generation_changed = header["generation"] != self._header["generation"]
+            self._header = header
+            self._set_generation_paths()
+            # Row numbers only mean something in the sidecar of the same generation
+            if self._conn is None or generation_changed:
+                if self._conn is not None:
+                    self._conn.close()
+                self._conn = self._connect()
+            self.dtype = np.dtype(header["dtype"])
+            self._load()
+
+    def _maybe_refresh(self):
+        if self.read_only and time.monotonic() - self._last_refresh >= self.refresh_interval:
+            self._last_refresh = time.monotonic()
+            self.refresh()
+
+    def _read_header(self) -> Optional[Dict[str, Any]]:
+        if not self._header_path.exists():
+            return None
+        with open(self._header_path) as f:
+            return json.load(f)
+
+    def _write_header(self):
+        self._header["version"] += 1
+        tmp_path = self._header_path.with_suffix(".json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self._header, f)
+        os.replace(tmp_path, self._header_path)
+
+    def _map_rows(self, file_path: Path, dtype, count: int, width: Optional[int] = None):
+        """Memory-map the first ``count`` rows of a row-major file."""
+        shape = (count, width) if width else (count,)
+        if count == 0:
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(str(file_path), dtype=dtype, mode="r", shape=shape)
+
+    def _append_rows(self, file_path: Path, rows: np.ndarray, valid_bytes: int):
+        """Append rows after the last valid byte, dropping any torn tail."""
+        with open(file_path, "ab") as f:
+            f.truncate(valid_bytes)
+            f.write(np.ascontiguousarray(rows).tobytes())
+            f.flush()
+
+    def _load(self, live: Optional[np.ndarray] = None):
+        """(Re)open the memory maps and live-row mask from disk.
+
+        Args:
+            live: Already-known live-row mask, to skip rereading the sidecar
+        """
+        count = self._header["count"]
+        dim = self._header["dim"]
+        self._vectors = self._map_rows(self._vectors_path, self.dtype, count, dim) if dim else None
+
+        if live is None:
+            live = np.zeros(count, dtype=bool)
+            # Rows at or past ``count`` belong to a write whose header is not published yet
+            rows = [
+                row for (row,) in self._conn.execute("SELECT row FROM chunks WHERE row < ?", (count,))
+            ] if self._conn is not None else []
+            if rows:
+                live[np.asarray(rows, dtype=np.int64)] = True
+        self._live = live
+
+        self._centroids = None
+        self._assign = None
+        self._ivf_lists = None
+        if self._header["ivf_trained_count"] and self._centroids_path.exists():
+            self._centroids = np.load(self._centroids_path)
+            self._assign = self._map_rows(self._assign_path, np.int32, count)
+
+        self._quantizer = None
+        self._codes = None
+        if dim and self._header["quantization"] != "none":
+            self._quantizer = get_quantizer(self._header["quantization"], dim)
+            self._quantizer.load(self.path)
+            self._codes = self._map_rows(
+                self._codes_path, self._quantizer.code_dtype, count, self._quantizer.code_width
+            )
+
+    # ------------------------------------------
+    # Writes
+    # ------------------------------------------
+
+    def add(self, ids, embeddings, texts, metadatas):
+        self._check_writable()
+        if not ids:
+            return
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+
+        with self._lock:
+            if self._header["dim"] is None:
+                self._header["dim"] = int(vectors.shape[1])
+            elif vectors.shape[1] != self._header["dim"]:
+                raise ValueError(
+                    f"Embedding dimension {vectors.shape[1]} does not match index dimension {self._header['dim']}"
+                )
+
+            # Re-adding an existing id replaces it
+            replaced_rows = self._rows_for_ids(ids)
+            self._delete_rows(replaced_rows)
+
+            start = self._header["count"]
+            row_bytes = self._header["dim"] * self.dtype.itemsize
+            self._append_rows(self._vectors_path, vectors.astype(self.dtype), start * row_bytes)
+            if self._centroids is not None:
+                assignments = self._assign_to_lists(vectors)
+                self._append_rows(self._assign_path, assignments, start * 4)
+            if self.quantization != "none":
+                if self._quantizer is None:
+                    # First rows of a fresh index: train on this batch, retrain as it grows
+                    self._quantizer = self._train_quantizer(vectors)
+                    self._header["quantizer_trained_count"] = len(ids)
+                code_bytes = self._quantizer.code_width * np.dtype(self._quantizer.code_dtype).itemsize
+                self._append_rows(self._codes_path, self._quantizer.encode(vectors), start * code_bytes)
+
+            self._conn.executemany(
+                "INSERT INTO chunks (row, id, doc_id, document, metadata) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (start + i, chunk_id, metadata.get("doc_id"), text, json.dumps(metadata))
+                    for i, (chunk_id, text, metadata) in enumerate(zip(ids, texts, metadatas))
+                ]
+            )
+            self._conn.commit()
+
+            live = np.concatenate([self._live, np.ones(len(ids), dtype=bool)])
+            live[replaced_rows] = False
+            self._header["count"] = start + len(ids)
+            self._write_header()
+            self._load(live)
+            self._maybe_train_ivf()
+            self._maybe_retrain_quantizer()
+
+    def delete(self, where):
+        self._check_writable()
+        with self._lock:
+            rows = self._rows_for_filter(where)
+            self._delete_rows(rows)
+            if len(rows):
+                self._write_header()
+                self._load()
+                self._maybe_compact()
+            return len(rows)
+
+    def _delete_rows(self, rows: np.ndarray):
+        if not len(rows):
+            return
+        self._conn.executemany(
+            "DELETE FROM chunks WHERE row = ?",
+            [(int(row),) for row in rows]
+        )
+        self._conn.commit()
+
+    def compact(self):
+        """Rewrite the index without deleted rows as a new generation.
+
+        The live rows' vectors, IVF assignments and codes, and their sidecar
+        entries renumbered in order, go to new files that the header swap
+        publishes all at once. Readers keep using the previous generation
+        until they refresh, and a crash before the swap leaves the current
+        generation untouched (its leftovers are removed on the next start).
+        """
+        self._check_writable()
+        with self._lock:
+            live_rows = np.flatnonzero(self._live)
+            if len(live_rows) == self._header["count"]:
+                return
+
+            generation = self._header["generation"] + 1
+            sources = (("vectors.bin", self._vectors), ("ivf_assign.bin", self._assign), ("codes.bin", self._codes))
+            for name, source in sources:
+                if source is None:
+                    continue
+                with open(self._generation_file(name, generation), "wb") as f:
+                    for start in range(0, len(live_rows), SEARCH_BLOCK_ROWS):
+                        block = live_rows[start:start + SEARCH_BLOCK_ROWS]
+                        f.write(np.ascontiguousarray(source[block]).tobytes())
+
+            sidecar_path = self._generation_file("meta.sqlite", generation)
+            for stale_path in (sidecar_path, Path(f"{sidecar_path}-wal"), Path(f"{sidecar_path}-shm")):
+                stale_path.unlink(missing_ok=True)
+            conn = self._open_sidecar(sidecar_path)
+            # The live rows are exactly the sidecar's rows, so numbering them in order matches live_rows
+            conn.execute("ATTACH DATABASE ? AS previous", (str(self._sidecar_path),))
+            conn.execute(
+                "INSERT INTO chunks (row, id, doc_id, document, metadata) "
+                "SELECT ROW_NUMBER() OVER (ORDER BY row) - 1, id, doc_id, document, metadata "
+                "FROM previous.chunks WHERE row < ?",
+                (self._header["count"],)
+            )
+            conn.commit()
+            conn.execute("DETACH DATABASE previous")
+            copied = conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+            if copied != len(live_rows):
+                conn.close()
+                raise RuntimeError(f"Compaction copied {copied} chunks for {len(live_rows)} live rows")
+
+            self._header["generation"] = generation
+            self._header["count"] = len(live_rows)
+            self._write_header()
+
+            self._conn.close()
+            self._conn = conn
+            self._set_generation_paths()
+            self._load(np.ones(len(live_rows), dtype=bool))
+            self._remove_old_generations()
+
+    def _maybe_compact(self):
+        count = self._header["count"]
+        if count and 1 - self._live.sum() / count >= COMPACTION_DEAD_FRACTION:
+            print(f"Compacting vector index at {self.path}")
+            self.compact()
+
+    # ------------------------------------------
+    # IVF partitioning
+    # ------------------------------------------
+
+    def _maybe_train_ivf(self):
+        """Train IVF lists once the index is large enough, and retrain after it doubles."""
+        live_count = int(self._live.sum())
+        trained_count = self._header["ivf_trained_count"]
+        if live_count < self.ivf_min_vectors:
+            return
+        if trained_count and live_count < 2 * trained_count:
+            return
+        self.build_ivf()
+
+    def build_ivf(self):
+        """Cluster the stored vectors with spherical k-means and assign every row to a list."""
+        self._check_writable()
+        with self._lock:
+            count = self._header["count"]
+            live_rows = np.flatnonzero(self._live)
+            nlist = self.nlist or max(1, int(4 * np.sqrt(len(live_rows))))
+            nlist = min(nlist, len(live_rows))
+            print(f"Training IVF index with {nlist} lists over {len(live_rows)} vectors")
+
+            rng = np.random.default_rng(0)
+            sample_size = min(len(live_rows), nlist * IVF_TRAIN_POINTS_PER_LIST)
+            sample_rows = np.sort(rng.choice(live_rows, size=sample_size, replace=False))
+            sample = np.asarray(self._vectors[sample_rows], dtype=np.float32)
+
+            centroids = sample[rng.choice(sample_size, size=nlist, replace=False)]
+            for _ in range(IVF_TRAIN_ITERATIONS):
+                labels = np.argmax(sample @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, labels, sample)
+                empty = ~np.any(sums, axis=1)
+                sums[empty] = centroids[empty]
+                centroids = _normalize(sums)
+
+            self._centroids = centroids
+            assignments = np.empty(count, dtype=np.int32)
+            for start in range(0, count, SEARCH_BLOCK_ROWS):
+                block = np.asarray(self._vectors[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+                assignments[start:start + len(block)] = self._assign_to_lists(block)
+
+            # Replace rather than rewrite files that readers may have mapped
+            for target_path, data in ((self._centroids_path, None), (self._assign_path, assignments)):
+                tmp_path = target_path.with_suffix(target_path.suffix + ".tmp")
+                with open(tmp_path, "wb") as f:
+                    if data is None:
+                        np.save(f, centroids)
+                    else:
+                        f.write(data.tobytes())
+                os.replace(tmp_path, target_path)
+
+            self._header["ivf_trained_count"] = len(live_rows)
+            self._write_header()
+            self._load()
+
+    def _assign_to_lists(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ self._centroids.T, axis=1).astype(np.int32)
+
+    def _get_ivf_lists(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Return rows grouped by list and the start offset of each list."""
+        if self._ivf_lists is None:
+            order = np.argsort(self._assign, kind="stable")
+            offsets = np.searchsorted(self._assign[order], np.arange(len(self._centroids) + 1))
+            self._ivf_lists = (order, offsets)
+        return self._ivf_lists
+
+    # ------------------------------------------
+    # Quantized codes
+    # ------------------------------------------
+
+    def _train_quantizer(self, vectors: np.ndarray) -> Quantizer:
+        quantizer = get_quantizer(self.quantization, self._header["dim"])
+        quantizer.train(vectors)
+        quantizer.save(self.path)
+        self._header["quantization"] = self.quantization
+        return quantizer
+
+    def _maybe_retrain_quantizer(self):
+        """Refit data-dependent quantizers after the index doubles in size."""
+        if self._quantizer is None or not self._quantizer.trainable:
+            return
+        if self._live.sum() >= 2 * self._header["quantizer_trained_count"]:
+            self.build_codes()
+
+    def build_codes(self):
+        """(Re)train the configured quantizer and re-encode every stored vector."""
+        self._check_writable()
+        with self._lock:
+            count = self._header["count"]
+            if self.quantization == "none" or count == 0:
+                self._header["quantization"] = "none"
+                if self._codes_path.exists():
+                    self._codes = None
+                    self._codes_path.unlink()
+                self._write_header()
+                self._load()
+                return
+
+            live_rows = np.flatnonzero(self._live)
+            print(f"Encoding {count} vectors as {self.quantization} codes")
+            rng = np.random.default_rng(0)
+            sample_rows = live_rows
+            if len(live_rows) > QUANTIZER_TRAIN_SAMPLE:
+                sample_rows = np.sort(rng.choice(live_rows, size=QUANTIZER_TRAIN_SAMPLE, replace=False))
+            if not len(sample_rows):
+                sample_rows = np.arange(count)
+            quantizer = self._train_quantizer(np.asarray(self._vectors[sample_rows], dtype=np.float32))
+
+            tmp_path = self._codes_path.with_suffix(".bin.tmp")
+            with open(tmp_path, "wb") as f:
+                for start in range(0, count, SEARCH_BLOCK_ROWS):
+                    block = np.asarray(self._vectors[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+                    f.write(np.ascontiguousarray(quantizer.encode(block)).tobytes())
+            self._codes = None
+            os.replace(tmp_path, self._codes_path)
+
+            self._header["quantizer_trained_count"] = len(live_rows)
+            self._write_header()
+            self._load()
+
+    def _rescore(self, query: np.ndarray, hits: List[Tuple[int, float]], k: int) -> List[Tuple[int, float]]:
+        """Re-rank a shortlist by exact cosine similarity against the full vectors."""
+        rows = np.asarray(sorted(row for row, _ in hits), dtype=np.int64)
+        if not len(rows):
+            return []
+        scores = np.asarray(self._vectors[rows], dtype=np.float32) @ query
+        order = np.argsort(-scores)[:k]
+        return [(int(rows[i]), float(scores[i])) for i in order]
+
+    # ------------------------------------------
+    # Reads
+    # ------------------------------------------
+
+    def search(self, embeddings, k, where=None):
+        queries = _normalize(np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1))
+        self._maybe_refresh()
+
+        with self._lock:
+            if self._vectors is None or not self._live.any():
+                return [[] for _ in range(len(queries))]
+
+            if where:
+                candidates = self._rows_for_filter(where)
+                rows_per_query = [candidates] * len(queries)
+            elif self._centroids is not None:
+                order, offsets = self._get_ivf_lists()
+                probes = np.argsort(-(queries @ self._centroids.T), axis=1)[:, :self.nprobe]
+                rows_per_query = [
+                    np.concatenate([order[offsets[p]:offsets[p + 1]] for p in query_probes])
+                    for query_probes in probes
+                ]
+            else:
+                rows_per_query = None
+
+            # First pass over compact codes when quantized, then exact rescoring
+            if self._quantizer is not None:
+                source, score_fn, shortlist = self._codes, self._quantizer.score, k * self.rescore_factor
+            else:
+                source, score_fn, shortlist = self._vectors, _dot_scores, k
+
+            if rows_per_query is None:
+                hits = _top_k(source, self._live, queries, shortlist, score_fn=score_fn)
+            else:
+                hits = [
+                    _top_k(source, self._live, query[None, :], shortlist, rows, score_fn)[0]
+                    for query, rows in zip(queries, rows_per_query)
+                ]
+            if self._quantizer is not None:
+                hits = [self._rescore(query, query_hits, k) for query, query_hits in zip(queries, hits)]
+            return self._to_documents(hits)
+
+    def _to_documents(self, hits: List[List[Tuple[int, float]]]) -> List[List[Tuple[Document, float]]]:
+        rows = sorted({row for query_hits in hits for row, _ in query_hits})
+        chunks = {}
+        for batch in _batched(rows, 900):
+            placeholders = ",".join("?" * len(batch))
+            for row, text, metadata in self._conn.execute(
+                f"SELECT row, document, metadata FROM chunks WHERE row IN ({placeholders})",
+                batch
+            ):
+                chunks[row] = (text, json.loads(metadata))
+
+        return [
+            [
+                (Document(page_content=chunks[row][0], metadata=chunks[row][1]), 1.0 - score)
+                for row, score in query_hits
+                if row in chunks
+            ]
+            for query_hits in hits
+        ]
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include_embeddings=False):
+        self._maybe_refresh()
+        clauses, params = [], []
+        if ids is not None:
+            clauses.append(f"id IN ({','.join('?' * len(ids))})")
+            params.extend(ids)
+        if where:
+            doc_clause, doc_params = _doc_id_clause(where)
+            clauses.append(doc_clause)
+            params.extend(doc_params)
+
+        clauses.append("row < ?")
+        params.append(self._header["count"])
+        query = "SELECT row, id, document, metadata FROM chunks WHERE " + " AND ".join(clauses)
+        query += " ORDER BY row"
+        if limit is not None or offset:
+            query += " LIMIT ? OFFSET ?"
+            params.extend([-1 if limit is None else limit, offset or 0])
+
+        with self._lock:
+            records = self._conn.execute(query, params).fetchall() if self._conn is not None else []
+            vectors = self._vectors
+
+        output = {
+            "ids": [chunk_id for _, chunk_id, _, _ in records],
+            "documents": [text for _, _, text, _ in records],
+            "metadatas": [json.loads(metadata) for _, _, _, metadata in records]
+        }
+        if include_embeddings:
+            rows = np.asarray([row for row, _, _, _ in records], dtype=np.int64)
+            output["embeddings"] = np.asarray(vectors[rows], dtype=np.float32).tolist() if len(rows) else []
+        return output
+
+    def count(self):
+        self._maybe_refresh()
+        with self._lock:
+            return int(self._live.sum())
+
+    def _rows_for_ids(self, ids: List[str]) -> np.ndarray:
+        rows = []
+        for batch in _batched(ids, 900):
+            rows.extend(
+                row for (row,) in self._conn.execute(
+                    f"SELECT row FROM chunks WHERE id IN ({','.join('?' * len(batch))})",
+                    batch
+                )
+            )
+        return np.asarray(rows, dtype=np.int64)
+
+    def _rows_for_filter(self, where: Dict[str, Any]) -> np.ndarray:
+        clause, params = _doc_id_clause(where)
+        rows = [
+            row for (row,) in self._conn.execute(
+                f"SELECT row FROM chunks WHERE {clause} AND row < ?", params + [self._header["count"]]
+            )
+        ]
+        return np.asarray(sorted(rows), dtype=np.int64)
+
+
+def _set_header_defaults(header: Dict[str, Any]):
+    """Fill in header fields added after the index format was first written."""
+    header.setdefault("generation", 0)
+    header.setdefault("quantization", "none")
+    header.setdefault("quantizer_trained_count", 0)
+
+
+def _doc_id_clause(where: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    """Translate a Chroma-style ``doc_id`` filter into SQL.
+
+    Supports {"doc_id": value} and {"doc_id": {"$in": [values]}}.
+    """
+    if set(where) != {"doc_id"}:
+        raise ValueError(f"Unsupported filter for mmap index: {where}")
+    value = where["doc_id"]
+    if isinstance(value, dict):
+        if set(value) == {"$eq"}:
+            value = value["$eq"]
+        elif set(value) == {"$in"}:
+            values = list(value["$in"])
+            return f"doc_id IN ({','.join('?' * len(values))})", values
+        else:
+            raise ValueError(f"Unsupported filter for mmap index: {where}")
+    return "doc_id = ?", [value]
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _batched(items: Sequence[Any], size: int):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _dot_scores(block: np.ndarray, queries: np.ndarray) -> np.ndarray:
+    return queries @ np.asarray(block, dtype=np.float32).T
+
+
+def _top_k(
+    vectors: np.ndarray,
+    live: np.ndarray,
+    queries: np.ndarray,
+    k: int,
+    rows: Optional[np.ndarray] = None,
+    score_fn=_dot_scores
+) -> List[List[Tuple[int, float]]]:
+    """Top-k rows by ``score_fn`` over all rows or the given candidate rows.
+
+    ``vectors`` may hold full vectors or quantized codes, as long as
+    ``score_fn(block, queries)`` understands them. Scores are computed block
+    by block so memory stays bounded on large corpora.
+    """
+    total = len(vectors) if rows is None else len(rows)
+    best_rows = np.empty((len(queries), 0), dtype=np.int64)
+    best_scores = np.empty((len(queries), 0), dtype=np.float32)
+
+    for start in range(0, total, SEARCH_BLOCK_ROWS):
+        if rows is None:
+            block_rows = np.arange(start, min(start + SEARCH_BLOCK_ROWS, total))
+            block = vectors[start:start + SEARCH_BLOCK_ROWS]
+        else:
+            block_rows = rows[start:start + SEARCH_BLOCK_ROWS]
+            block = vectors[block_rows]
+
+        scores = score_fn(block, queries)
+        scores[:, ~live[block_rows]] = -np.inf
+
+        all_scores = np.concatenate([best_scores, scores], axis=1)
+        all_rows = np.concatenate([best_rows, np.broadcast_to(block_rows, scores.shape)], axis=1)
+        if all_scores.shape[1] > k:
+            keep = np.argpartition(-all_scores, k - 1, axis=1)[:, :k]
+            all_scores = np.take_along_axis(all_scores, keep, axis=1)
+            all_rows = np.take_along_axis(all_rows, keep, axis=1)
+        best_scores, best_rows = all_scores, all_rows
+
+    results = []
+    for query_rows, query_scores in zip(best_rows, best_scores):
+        order = np.argsort(-query_scores)
+        results.append([
+            (int(query_rows[i]), float(query_scores[i]))
+            for i in order
+            if np.isfinite(query_scores[i])
+        ])
+    return results
+
+
+# Indexes are shared per process so every service instance sees the same state
+_INDEXES: Dict[str, VectorIndex] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def create_vector_index(collection_name: str = "documents") -> VectorIndex:
+    """Get the process-wide vector index for a collection using the configured backend.
+
+    Args:
+        collection_name: Logical collection name
+
+    Returns:
+        A VectorIndex for VECTOR_BACKEND
+    """
+    with _INDEXES_LOCK:
+        if collection_name not in _INDEXES:
+            if VECTOR_BACKEND == "mmap":
+                index = MmapVectorIndex(MMAP_INDEX_DIR / collection_name, read_only=SERVER_ROLE == "query")
+            elif VECTOR_BACKEND == "chroma":
+                import chromadb
+                if CHROMA_SERVER_HOST:
+                    client_factory = lambda: chromadb.HttpClient(host=CHROMA_SERVER_HOST, port=CHROMA_SERVER_PORT)
+                elif SERVER_ROLE == "query":
+                    raise ValueError(
+                        "SERVER_ROLE=query with the chroma backend needs CHROMA_SERVER_HOST; "
+                        "the embedded client cannot be shared between processes"
+                    )
+                else:
+                    client_factory = lambda: chromadb.PersistentClient(path=str(VECTORDB_DIR))
+                index = ChromaVectorIndex(client_factory(), collection_name, client_factory=client_factory)
+            else:
+                raise ValueError(f"Unknown VECTOR_BACKEND: {VECTOR_BACKEND}")
+            _INDEXES[collection_name] = index
+        return _INDEXES[collection_name]
+
+
+def collection_names() -> List[str]:
+    """Collections in use: "documents", and "questions" with the question index enabled."""
+    return ["documents", "questions"] if QUESTION_INDEX_ENABLED else ["documents"]
+
+
+def _reopen_indexes_after_fork():
+    global _INDEXES_LOCK
+    _INDEXES_LOCK = threading.Lock()
+    for index in _INDEXES.values():
+        index.reopen()
+
+
+os.register_at_fork(after_in_child=_reopen_indexes_after_fork)
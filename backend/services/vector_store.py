@@ -1,45 +1,77 @@
-from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.docstore.document import Document
-from typing import List
-import chromadb
-from pathlib import Path
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+from typing import Any, Dict, List, Optional, Tuple
+import threading
 import traceback
 
+import numpy as np
+
 from config.settings import (
-    VECTORDB_DIR,
-    EMBEDDING_MODEL_NAME,
-    CHUNK_SIZE,
-    CHUNK_OVERLAP,
+    CHILD_CHUNK_OVERLAP_TOKENS,
+    CHILD_CHUNK_TOKENS,
+    CHILD_SEARCH_TOP_K,
+    NEAR_DUPLICATE_ENABLED,
+    PARENT_CHUNK_TOKENS,
+    PARENT_CONTEXT_MAX_TOKENS,
+    PARENT_RETRIEVAL_ENABLED,
+    QUESTION_INDEX_ENABLED,
+    RETRIEVAL_MMR_ENABLED,
+    RETRIEVAL_MMR_FETCH_FACTOR,
+    RETRIEVAL_MMR_LAMBDA,
     VECTOR_SEARCH_TOP_K
 )
+from services.chunking import TokenChunker
+from services.dedup import DuplicateStore, maximal_marginal_relevance
+from services.parent_store import ParentStore
+from services.embedding_scheduler import get_embedding_scheduler
+from services.question_index import get_question_generator
+from services.vector_index import VectorIndex, create_vector_index
+
+# Serializes index writes in this process; snapshot export holds it for a consistent view
+INDEX_WRITE_LOCK = threading.RLock()
+
+class VectorIndexRetriever(BaseRetriever):
+    """LangChain retriever over VectorStoreService, independent of the index backend."""
+
+    vector_store_service: Any
+    k: int = VECTOR_SEARCH_TOP_K
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return [doc for doc, _ in self.vector_store_service.similarity_search_with_score(query, k=self.k)]
+
 
 class VectorStoreService:
     def __init__(self):
-        self.embedding_model = HuggingFaceEmbeddings(
-            model_name=EMBEDDING_MODEL_NAME
-        )
-        
-        # Initialize ChromaDB client with persistence
-        self.client = chromadb.PersistentClient(path=str(VECTORDB_DIR))
-        
-        # Create or get the collection
-        self.collection = self.client.get_or_create_collection(
-            name="documents",
-            metadata={"hnsw:space": "cosine"}
-        )
-        
-        self.vector_store = Chroma(
-            client=self.client,
-            collection_name="documents",
-            embedding_function=self.embedding_model
-        )
-        
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=CHUNK_SIZE,
-            chunk_overlap=CHUNK_OVERLAP
-        )
+        # One model per process, shared by every service instance; queries take
+        # priority over ingestion batches (see services/embedding_scheduler.py)
+        self.embedding_model = get_embedding_scheduler()
+        
+        # Create or open the "documents" index using the configured backend
+        self.index = create_vector_index("documents")
+        
+        # Generated questions, each pointing to a chunk's split_id (see services/question_index.py);
+        # the collection only exists with the question index enabled
+        self.question_index = create_vector_index("questions") if QUESTION_INDEX_ENABLED else None
+        
+        # Token-sized, structure-aware chunks (see services/chunking.py). With
+        # small-to-big retrieval, small child chunks are indexed and their parent
+        # sections are kept once in the parent store
+        self.parent_store = ParentStore()
+        if PARENT_RETRIEVAL_ENABLED:
+            self.parent_chunker = TokenChunker(chunk_tokens=PARENT_CHUNK_TOKENS, overlap_tokens=0)
+            self.chunker = TokenChunker(chunk_tokens=CHILD_CHUNK_TOKENS, overlap_tokens=CHILD_CHUNK_OVERLAP_TOKENS)
+            # Children searched per question; they map to fewer, larger parents
+            self.retrieval_k = CHILD_SEARCH_TOP_K
+        else:
+            self.parent_chunker = None
+            self.chunker = TokenChunker()
+            self.retrieval_k = VECTOR_SEARCH_TOP_K
+        
+        # MinHash records of indexed chunks; near-duplicates are kept as aliases (see services/dedup.py)
+        self.duplicate_store = DuplicateStore()
 
     def add_documents(self, documents: List[Document]):
         """Add documents to vector store with metadata.
@@ -47,32 +79,351 @@ class VectorStoreService:
         Args:
             documents: List of documents to add (with metadata already attached)
         """
+        if self.parent_chunker is not None:
+            # Store parent sections first, then index their children with a parent_id
+            parents = self.parent_chunker.split_documents(documents)
+            for i, parent in enumerate(parents):
+                parent.metadata["split_id"] = f"{parent.metadata['doc_id']}_p{i}"
+            self.parent_store.add(parents)
+            documents = [
+                Document(page_content=parent.page_content, metadata={
+                    **{key: value for key, value in parent.metadata.items() if key not in ("split_id", "token_count")},
+                    "parent_id": parent.metadata["split_id"]
+                })
+                for parent in parents
+            ]
+        
         # Split documents while preserving metadata
-        splits = self.text_splitter.split_documents(documents)
+        splits = self.chunker.split_documents(documents)
         
         # Update split_id for each chunk
         for i, split in enumerate(splits):
             doc_id = split.metadata["doc_id"]
             split.metadata["split_id"] = f"{doc_id}_{i}"
         
-        # Add to vector store
-        self.vector_store.add_documents(splits)
+        if not splits:
+            return
+
+        # Near-duplicates of indexed chunks (or of earlier chunks in this batch)
+        # become aliases of them and are not embedded
+        canonical_ids = [None] * len(splits)
+        if NEAR_DUPLICATE_ENABLED:
+            signatures = self.duplicate_store.hasher.signatures([split.page_content for split in splits])
+            canonical_ids = self.duplicate_store.find_canonicals(splits, signatures)
+        unique = [split for split, canonical_id in zip(splits, canonical_ids) if canonical_id is None]
+
+        # Embed and add to the vector index, keyed by split_id
+        texts = [split.page_content for split in unique]
+        embeddings = self.embedding_model.embed_documents(texts)
+        with INDEX_WRITE_LOCK:
+            if NEAR_DUPLICATE_ENABLED:
+                # Index duplicates whose canonical chunk was deleted since the lookup (rare)
+                batch_ids = {split.metadata["split_id"] for split in unique}
+                stored = list({c for c in canonical_ids if c is not None and c not in batch_ids})
+                live = set()
+                for start in range(0, len(stored), 900):
+                    live.update(self.index.get(ids=stored[start:start + 900])["ids"])
+                stale = [i for i, c in enumerate(canonical_ids) if c is not None and c not in batch_ids and c not in live]
+                if stale:
+                    unique += [splits[i] for i in stale]
+                    texts += [splits[i].page_content for i in stale]
+                    embeddings = list(embeddings) + list(self.embedding_model.embed_documents(texts[-len(stale):]))
+                    for i in stale:
+                        canonical_ids[i] = None
+
+            if unique:
+                self.index.add(
+                    ids=[split.metadata["split_id"] for split in unique],
+                    embeddings=embeddings,
+                    texts=texts,
+                    metadatas=[split.metadata for split in unique]
+                )
+            if NEAR_DUPLICATE_ENABLED:
+                self.duplicate_store.add(splits, signatures, canonical_ids)
+        
+        if len(unique) < len(splits):
+            print(f"Stored {len(splits) - len(unique)} of {len(splits)} chunks as near-duplicates of indexed chunks")
+        
+        if QUESTION_INDEX_ENABLED and unique:
+            # Offline stage: questions are generated and indexed in the background
+            get_question_generator().submit(unique, self.index, self.question_index, self.embedding_model)
 
     def get_retriever(self):
         """Get retriever for similarity search."""
-        return self.vector_store.as_retriever(
-            search_type="similarity",
-            search_kwargs={
-                "k": VECTOR_SEARCH_TOP_K
-            }
-        )
+        return VectorIndexRetriever(vector_store_service=self, k=VECTOR_SEARCH_TOP_K)
 
     def similarity_search(self, query: str):
         """Perform similarity search."""
-        return self.vector_store.similarity_search(
-            query,
-            k=VECTOR_SEARCH_TOP_K
-        )
+        return [doc for doc, _ in self.similarity_search_with_score(query)]
+
+    def similarity_search_with_score(
+        self,
+        query: str,
+        k: int = VECTOR_SEARCH_TOP_K,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[Document, float]]:
+        """Perform similarity search and return (document, cosine distance) pairs.
+        
+        Args:
+            query: The query text
+            k: Number of results to return
+            where: Optional metadata filter, e.g. {"doc_id": "..."}
+            
+        Returns:
+            List of (Document, score) tuples, closest first
+        """
+        embedding = self.embedding_model.embed_query(query)
+        return self._search([embedding], k, where)[0]
+
+    def similarity_search_with_score_queries(
+        self,
+        queries: List[str],
+        k: int = VECTOR_SEARCH_TOP_K,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        """Search for a few interactive queries, e.g. rewrites of one question.
+        
+        Unlike similarity_search_with_score_batch, the queries are embedded
+        on the scheduler's high-priority query lane.
+        
+        Args:
+            queries: The query texts
+            k: Number of results per query
+            where: Optional metadata filter applied to every query
+            
+        Returns:
+            One list of (Document, score) tuples per query, closest first
+        """
+        if not queries:
+            return []
+        embeddings = self.embedding_model.embed_queries(queries)
+        return self._search(embeddings, k, where)
+
+    def similarity_search_with_score_batch(
+        self,
+        queries: List[str],
+        k: int = VECTOR_SEARCH_TOP_K,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        """Search for many queries with one embedding call and one index call.
+        
+        Args:
+            queries: The query texts
+            k: Number of results per query
+            where: Optional metadata filter applied to every query
+            
+        Returns:
+            One list of (Document, score) tuples per query, closest first
+        """
+        if not queries:
+            return []
+        # Bulk work goes on the scheduler's batched low-priority lane so it
+        # doesn't delay interactive chat queries
+        embeddings = self.embedding_model.embed_documents(queries)
+        return self._search(embeddings, k, where)
+
+    def _search(
+        self,
+        embeddings: List[List[float]],
+        k: int,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        """Search the chunks and, when enabled, the generated questions with the same embeddings.
+        
+        A doc_id filter also finds the near-duplicate aliases stored for
+        those documents, scored with their canonical chunk's embedding. With
+        MMR enabled, RETRIEVAL_MMR_FETCH_FACTOR * k candidates are fetched
+        and k of them picked by maximal marginal relevance.
+        """
+        fetch_k = k * RETRIEVAL_MMR_FETCH_FACTOR if RETRIEVAL_MMR_ENABLED else k
+        results = self.index.search(embeddings, fetch_k, where)
+        if QUESTION_INDEX_ENABLED:
+            results = self._merge_question_hits(results, self.question_index.search(embeddings, fetch_k, where), fetch_k)
+        alias_vectors = {}
+        doc_ids = _filtered_doc_ids(where)
+        if doc_ids:
+            results, alias_vectors = self._merge_alias_hits(results, embeddings, doc_ids, fetch_k)
+        if RETRIEVAL_MMR_ENABLED:
+            results = self._diversify(results, k, alias_vectors)
+        return results
+
+    def _merge_alias_hits(
+        self,
+        results: List[List[Tuple[Document, float]]],
+        embeddings: List[List[float]],
+        doc_ids: List[str],
+        k: int
+    ) -> Tuple[List[List[Tuple[Document, float]]], Dict[str, List[float]]]:
+        """Add the aliases stored for the filtered documents to doc_id-filtered hits.
+        
+        Aliases are not in the index, so a filter on their document would
+        never find them; they are scored against their canonical chunk's
+        embedding instead. Aliases whose canonical chunk was deleted since
+        are skipped.
+        
+        Returns:
+            The merged hits and the alias embeddings by split_id (for MMR)
+        """
+        aliases = self.duplicate_store.aliases(doc_ids)
+        canonical_ids = list({canonical_id for canonical_id, _ in aliases})
+        vectors = {}
+        for start in range(0, len(canonical_ids), 900):
+            fetched = self.index.get(ids=canonical_ids[start:start + 900], include_embeddings=True)
+            vectors.update(zip(fetched["ids"], fetched["embeddings"]))
+        aliases = [(canonical_id, alias) for canonical_id, alias in aliases if canonical_id in vectors]
+        if not aliases:
+            return results, {}
+        
+        alias_embeddings = np.asarray([vectors[canonical_id] for canonical_id, _ in aliases], dtype=np.float32)
+        alias_norms = np.linalg.norm(alias_embeddings, axis=1, keepdims=True)
+        alias_norms[alias_norms == 0] = 1.0
+        queries = np.asarray(embeddings, dtype=np.float32)
+        query_norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        query_norms[query_norms == 0] = 1.0
+        distances = 1.0 - (queries / query_norms) @ (alias_embeddings / alias_norms).T
+        
+        merged = []
+        for hits, row in zip(results, distances):
+            hits = hits + [(alias, float(distance)) for (_, alias), distance in zip(aliases, row)]
+            merged.append(sorted(hits, key=lambda hit: hit[1])[:k])
+        return merged, {alias.metadata["split_id"]: vectors[canonical_id] for canonical_id, alias in aliases}
+
+    def _diversify(
+        self,
+        results: List[List[Tuple[Document, float]]],
+        k: int,
+        known_vectors: Optional[Dict[str, List[float]]] = None,
+        lambda_mult: float = RETRIEVAL_MMR_LAMBDA
+    ) -> List[List[Tuple[Document, float]]]:
+        """Pick k of each query's candidates by maximal marginal relevance.
+        
+        Candidates keep their cosine distance to the query; only the order
+        and the selection change. known_vectors holds embeddings of
+        candidates that are not in the index (aliases).
+        """
+        vectors = dict(known_vectors or {})
+        split_ids = list({
+            doc.metadata["split_id"] for hits in results if len(hits) > 1 for doc, _ in hits
+        } - set(vectors))
+        for start in range(0, len(split_ids), 900):
+            fetched = self.index.get(ids=split_ids[start:start + 900], include_embeddings=True)
+            vectors.update(zip(fetched["ids"], fetched["embeddings"]))
+        
+        diversified = []
+        for hits in results:
+            # Candidates deleted since the search are dropped
+            hits = [hit for hit in hits if hit[0].metadata["split_id"] in vectors] if len(hits) > 1 else hits
+            if len(hits) <= 1:
+                diversified.append(hits)
+                continue
+            embeddings = np.asarray([vectors[doc.metadata["split_id"]] for doc, _ in hits], dtype=np.float32)
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            similarities = 1.0 - np.asarray([distance for _, distance in hits], dtype=np.float32)
+            picked = maximal_marginal_relevance(similarities, embeddings / norms, k, lambda_mult)
+            diversified.append([hits[i] for i in picked])
+        return diversified
+
+    def _merge_question_hits(
+        self,
+        results: List[List[Tuple[Document, float]]],
+        question_results: List[List[Tuple[Document, float]]],
+        k: int
+    ) -> List[List[Tuple[Document, float]]]:
+        """Replace question hits by their chunks and merge them into the chunk hits.
+        
+        A chunk found directly and through its questions is listed once, with
+        the closest distance; chunks deleted since are skipped.
+        """
+        chunks = {doc.metadata["split_id"]: doc for hits in results for doc, _ in hits}
+        missing = list({doc.metadata["split_id"] for hits in question_results for doc, _ in hits} - set(chunks))
+        if missing:
+            fetched = self.index.get(ids=missing)
+            for split_id, text, metadata in zip(fetched["ids"], fetched["documents"], fetched["metadatas"]):
+                chunks[split_id] = Document(page_content=text, metadata=metadata)
+        
+        merged = []
+        for hits, question_hits in zip(results, question_results):
+            best = {doc.metadata["split_id"]: (doc, distance) for doc, distance in hits}
+            for question, distance in question_hits:
+                split_id = question.metadata["split_id"]
+                if split_id in chunks and (split_id not in best or distance < best[split_id][1]):
+                    best[split_id] = (chunks[split_id], distance)
+            merged.append(sorted(best.values(), key=lambda hit: hit[1])[:k])
+        return merged
+
+    def expand_to_parents(
+        self,
+        docs: List[Document],
+        max_parents: int = VECTOR_SEARCH_TOP_K,
+        max_tokens: int = PARENT_CONTEXT_MAX_TOKENS
+    ) -> List[Document]:
+        """Replace retrieved child chunks by their parent sections for the prompt.
+        
+        Parents are returned once each, in the order of their best-matching
+        child, up to max_parents and within max_tokens (the first is always
+        kept). Chunks without a parent (indexed before small-to-big retrieval)
+        are kept as they are.
+        
+        Args:
+            docs: Retrieved chunks, best match first
+            max_parents: Largest number of sections returned
+            max_tokens: Token budget for the returned sections
+            
+        Returns:
+            Parent sections (or legacy chunks), best match first
+        """
+        parent_ids = [doc.metadata.get("parent_id") for doc in docs]
+        parents = self.parent_store.get([parent_id for parent_id in parent_ids if parent_id])
+        
+        expanded, seen, total_tokens = [], set(), 0
+        for doc, parent_id in zip(docs, parent_ids):
+            key = parent_id or doc.metadata.get("split_id") or doc.page_content
+            if key in seen:
+                continue
+            seen.add(key)
+            # A parent deleted since the search falls back to the child itself
+            section = parents.get(parent_id, doc)
+            tokens = section.metadata.get("token_count") or 0
+            if expanded and total_tokens + tokens > max_tokens:
+                continue
+            expanded.append(section)
+            total_tokens += tokens
+            if len(expanded) >= max_parents:
+                break
+        return expanded
+
+    def has_document(self, document_id: str) -> bool:
+        """Return whether any chunks (or near-duplicate aliases) are stored for a document."""
+        if self.index.get(where={"doc_id": document_id}, limit=1)["ids"]:
+            return True
+        return self.duplicate_store.has_document(document_id)
+
+    def count(self) -> int:
+        """Return the number of chunks stored in the vector index."""
+        return self.index.count()
+
+    @property
+    def indexes(self) -> Dict[str, VectorIndex]:
+        """All vector indexes owned by this service, keyed by collection name."""
+        indexes = {"documents": self.index}
+        if self.question_index is not None:
+            indexes["questions"] = self.question_index
+        return indexes
+
+    def question_index_stats(self) -> Dict[str, Any]:
+        """Return the question index size and, when enabled, generation counters."""
+        if self.question_index is None:
+            return {"enabled": False}
+        return {"enabled": True, "questions": self.question_index.count(), **get_question_generator().stats()}
+
+    def duplicate_stats(self) -> Dict[str, Any]:
+        """Return near-duplicate alias counts and the MMR settings."""
+        return {
+            "enabled": NEAR_DUPLICATE_ENABLED,
+            **self.duplicate_store.stats(),
+            "mmr": {"enabled": RETRIEVAL_MMR_ENABLED, "lambda": RETRIEVAL_MMR_LAMBDA}
+        }
 
     def delete_document(self, document_id: str) -> bool:
         """Delete a document and its embeddings from the vector store.
@@ -85,29 +436,44 @@ class VectorStoreService:
         """
         try:
             print(f"Deleting document with ID: {document_id} from vector store")
-            collection = self.client.get_collection("documents")
             
-            # Query to find all chunks from this document
-            results = collection.get(
-                where={"doc_id": document_id}
-            )
+            # Delete all chunks associated with this document; aliases in other
+            # documents take the place of its chunks they duplicate
+            with INDEX_WRITE_LOCK:
+                promoted, alias_count = self.duplicate_store.release([document_id], self.index)
+                deleted_count = self.index.delete({"doc_id": document_id})
+                if self.question_index is not None:
+                    self.question_index.delete({"doc_id": document_id})
+                self.parent_store.delete([document_id])
             
-            if not results or len(results["ids"]) == 0:
+            if promoted:
+                print(f"Promoted {len(promoted)} near-duplicate chunks of other documents into the index")
+                if QUESTION_INDEX_ENABLED:
+                    get_question_generator().submit(promoted, self.index, self.question_index, self.embedding_model)
+            
+            deleted_count += alias_count
+            if deleted_count == 0:
                 print(f"No embeddings found for document ID: {document_id}")
                 return False
-                
-            # Delete all chunks associated with this document
-            chunk_ids = results["ids"]
-            print(f"Found {len(chunk_ids)} chunks to delete for document ID: {document_id}")
-            
-            collection.delete(
-                ids=chunk_ids
-            )
             
-            print(f"Successfully deleted embeddings for document ID: {document_id}")
+            print(f"Deleted {deleted_count} chunks for document ID: {document_id}")
             return True
             
         except Exception as e:
             print(f"Error deleting document from vector store: {str(e)}")
             print(traceback.format_exc())
-            return False 
\ No newline at end of file
+            return False
+
+
+def _filtered_doc_ids(where: Optional[Dict[str, Any]]) -> Optional[List[str]]:
+    """Document ids selected by a {"doc_id": ...} filter, or None for no or other filters."""
+    if not where or set(where) != {"doc_id"}:
+        return None
+    value = where["doc_id"]
+    if isinstance(value, dict):
+        if set(value) == {"$eq"}:
+            return [value["$eq"]]
+        if set(value) == {"$in"}:
+            return list(value["$in"])
+        return None
+    return [value]
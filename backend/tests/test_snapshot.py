@@ -0,0 +1,118 @@
+"""Snapshot export/import round trip over a temporary database and mmap index."""
+
+import numpy as np
+import pytest
+from langchain.docstore.document import Document
+
+from config.database import get_db, init_db
+from services.dedup import DuplicateStore
+from services.parent_store import ParentStore
+from services.snapshot import SnapshotService
+from services.vector_index import MmapVectorIndex
+
+DIM = 32
+DOCUMENTS = ["doc0", "doc1", "doc2"]
+CHUNKS_PER_DOCUMENT = 20
+
+
+def build_knowledge_base(path):
+    """A knowledge base with chunks, parent sections, signatures and one alias."""
+    db_path = path / "kb.db"
+    init_db(db_path)
+    with get_db(db_path) as conn:
+        conn.executemany(
+            "INSERT INTO documents (id, title, source_type, source_path, created_at) VALUES (?, ?, ?, ?, ?)",
+            [(doc_id, f"Title {doc_id}", "text", f"{doc_id}.txt", "2024-01-01T00:00:00") for doc_id in DOCUMENTS]
+        )
+        conn.commit()
+
+    rng = np.random.default_rng(0)
+    chunks = [
+        Document(
+            page_content=f"chunk {i} of {doc_id}: " + "lorem ipsum dolor sit amet " * (i + 1),
+            metadata={"doc_id": doc_id, "split_id": f"{doc_id}_{i}", "parent_id": f"{doc_id}_p{i // 5}", "title": doc_id}
+        )
+        for doc_id in DOCUMENTS
+        for i in range(CHUNKS_PER_DOCUMENT)
+    ]
+    index = MmapVectorIndex(path / "index")
+    index.add(
+        ids=[chunk.metadata["split_id"] for chunk in chunks],
+        embeddings=rng.normal(size=(len(chunks), DIM)).astype(np.float32),
+        texts=[chunk.page_content for chunk in chunks],
+        metadatas=[chunk.metadata for chunk in chunks]
+    )
+
+    ParentStore(db_path).add([
+        Document(
+            page_content=f"section {i} of {doc_id}",
+            metadata={"doc_id": doc_id, "split_id": f"{doc_id}_p{i}", "token_count": 40 + i}
+        )
+        for doc_id in DOCUMENTS
+        for i in range(CHUNKS_PER_DOCUMENT // 5)
+    ])
+
+    duplicate_store = DuplicateStore(db_path)
+    alias = Document(page_content=chunks[0].page_content, metadata={"doc_id": "doc1", "split_id": "doc1_alias"})
+    signatures = duplicate_store.hasher.signatures([chunk.page_content for chunk in chunks + [alias]])
+    duplicate_store.add(chunks + [alias], signatures, [None] * len(chunks) + [chunks[0].metadata["split_id"]])
+    return index, db_path
+
+
+def table_rows(db_path, query):
+    with get_db(db_path) as conn:
+        return conn.execute(query).fetchall()
+
+
+@pytest.mark.parametrize("embedding_dtype, tolerance", [("float32", 1e-6), ("float16", 1e-3)])
+def test_export_import_round_trip(tmp_path, embedding_dtype, tolerance):
+    (tmp_path / "source").mkdir()
+    (tmp_path / "target").mkdir()
+    source, source_db = build_knowledge_base(tmp_path / "source")
+    target = MmapVectorIndex(tmp_path / "target" / "index")
+    target_db = tmp_path / "target" / "kb.db"
+
+    snapshot_path = tmp_path / "snapshot.parquet"
+    exported = SnapshotService({"documents": source}, source_db).export_snapshot(snapshot_path, embedding_dtype)
+    imported = SnapshotService({"documents": target}, target_db).import_snapshot(snapshot_path)
+
+    chunk_count = len(DOCUMENTS) * CHUNKS_PER_DOCUMENT
+    assert exported["chunks"] == imported["chunks"] == chunk_count
+    assert exported["documents"] == imported["documents"] == len(DOCUMENTS)
+    assert not (tmp_path / "snapshot.parquet.tmp").exists()
+
+    expected = source.get(include_embeddings=True)
+    actual = target.get(include_embeddings=True)
+    assert sorted(actual["ids"]) == sorted(expected["ids"])
+    actual_by_id = {
+        chunk_id: (text, metadata, embedding)
+        for chunk_id, text, metadata, embedding in zip(
+            actual["ids"], actual["documents"], actual["metadatas"], actual["embeddings"]
+        )
+    }
+    for chunk_id, text, metadata, embedding in zip(
+        expected["ids"], expected["documents"], expected["metadatas"], expected["embeddings"]
+    ):
+        actual_text, actual_metadata, actual_embedding = actual_by_id[chunk_id]
+        assert actual_text == text
+        assert actual_metadata == metadata
+        np.testing.assert_allclose(actual_embedding, embedding, atol=tolerance)
+
+    for query in (
+        "SELECT * FROM documents ORDER BY id",
+        "SELECT * FROM parent_chunks ORDER BY id",
+        "SELECT * FROM chunk_signatures ORDER BY split_id",
+        "SELECT * FROM chunk_signature_bands ORDER BY bucket, split_id"
+    ):
+        assert table_rows(target_db, query) == table_rows(source_db, query)
+    assert table_rows(target_db, "SELECT COUNT(*) FROM chunk_signatures WHERE canonical_id IS NOT NULL") == [(1,)]
+
+
+def test_import_refuses_non_empty_target(tmp_path):
+    (tmp_path / "source").mkdir()
+    source, source_db = build_knowledge_base(tmp_path / "source")
+    snapshot_path = tmp_path / "snapshot.parquet"
+    SnapshotService({"documents": source}, source_db).export_snapshot(snapshot_path)
+
+    with pytest.raises(ValueError):
+        SnapshotService({"documents": source}, source_db).import_snapshot(snapshot_path)
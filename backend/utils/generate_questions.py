@@ -0,0 +1,61 @@
+"""
+Generate questions for chunks that have none in the question index.
+
+Ingestion queues question generation as a background job when
+QUESTION_INDEX_ENABLED is set; jobs still queued when the server stops are
+lost, and documents ingested before the feature was enabled have no
+questions. This backfills them with the same generator, in batches of
+QUESTION_GEN_BATCH_CHUNKS chunks per LLM call. Run it on the writer while
+ingestion is stopped. Set QUESTION_GEN_PROVIDER=stub to try it without an
+API key.
+
+Run from the backend directory:
+    python -m utils.generate_questions --limit 1000
+"""
+
+import argparse
+import time
+
+from langchain.docstore.document import Document
+
+from config.settings import QUESTION_INDEX_ENABLED, STORAGE_GC_SCAN_BATCH_SIZE
+from services.embedding_scheduler import get_embedding_scheduler
+from services.question_index import get_question_generator
+from services.vector_index import create_vector_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--limit", type=int, default=0, help="Most chunks to process (0 = all)")
+    args = parser.parse_args()
+    if not QUESTION_INDEX_ENABLED:
+        parser.error("QUESTION_INDEX_ENABLED is off; searches would not use the questions")
+
+    chunk_index = create_vector_index("documents")
+    question_index = create_vector_index("questions")
+    answered = set()
+    for offset in range(0, question_index.count(), STORAGE_GC_SCAN_BATCH_SIZE):
+        batch = question_index.get(limit=STORAGE_GC_SCAN_BATCH_SIZE, offset=offset)
+        answered.update(metadata["split_id"] for metadata in batch["metadatas"])
+
+    chunks = []
+    for offset in range(0, chunk_index.count(), STORAGE_GC_SCAN_BATCH_SIZE):
+        batch = chunk_index.get(limit=STORAGE_GC_SCAN_BATCH_SIZE, offset=offset)
+        chunks.extend(
+            Document(page_content=text, metadata=metadata)
+            for split_id, text, metadata in zip(batch["ids"], batch["documents"], batch["metadatas"])
+            if split_id not in answered
+        )
+    if args.limit:
+        chunks = chunks[:args.limit]
+    print(f"{len(chunks)} chunks without questions ({len(answered)} chunks already have questions)")
+
+    started = time.perf_counter()
+    generator = get_question_generator()
+    indexed = generator.index_questions(chunks, chunk_index, question_index, get_embedding_scheduler())
+    print(f"✓ Indexed {indexed} questions for {len(chunks)} chunks in {time.perf_counter() - started:.1f}s")
+    print(generator.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Sweep HNSW parameters on the real document embeddings.
+
+Loads the stored chunk embeddings from the Chroma collection, holds out a
+sample as queries (or embeds questions from --queries-file), and for each
+combination of M, construction_ef and search_ef builds a throwaway in-memory
+collection and measures recall@k against exact brute-force search, build
+time and query latency.
+
+Run from the backend directory:
+    python -m utils.hnsw_sweep --m 8 16 32 --construction-ef 100 200 --search-ef 10 32 64 128
+"""
+
+import argparse
+import itertools
+import time
+
+import chromadb
+import numpy as np
+
+from config.settings import VECTORDB_DIR, EMBEDDING_MODEL_NAME
+
+
+def load_embeddings(collection_name: str, limit: int = None) -> np.ndarray:
+    client = chromadb.PersistentClient(path=str(VECTORDB_DIR))
+    collection = client.get_collection(collection_name)
+    results = collection.get(limit=limit, include=["embeddings"])
+    return np.asarray(results["embeddings"], dtype=np.float32)
+
+
+def embed_questions(path: str) -> np.ndarray:
+    from langchain_huggingface import HuggingFaceEmbeddings
+    with open(path) as f:
+        questions = [line.strip() for line in f if line.strip()]
+    model = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+    return np.asarray(model.embed_documents(questions), dtype=np.float32)
+
+
+def exact_neighbours(corpus: np.ndarray, queries: np.ndarray, k: int):
+    normalized = corpus / np.linalg.norm(corpus, axis=1, keepdims=True)
+    scores = (queries / np.linalg.norm(queries, axis=1, keepdims=True)) @ normalized.T
+    return [set(np.argsort(-row)[:k].tolist()) for row in scores]
+
+
+def run_setting(corpus, queries, truth, k, m, construction_ef, search_ef):
+    client = chromadb.EphemeralClient()
+    name = f"sweep_{m}_{construction_ef}_{search_ef}"
+    collection = client.create_collection(name=name, metadata={
+        "hnsw:space": "cosine",
+        "hnsw:M": m,
+        "hnsw:construction_ef": construction_ef,
+        "hnsw:search_ef": search_ef,
+    })
+
+    started = time.perf_counter()
+    batch_size = client.get_max_batch_size()
+    for start in range(0, len(corpus), batch_size):
+        end = min(start + batch_size, len(corpus))
+        collection.add(ids=[str(i) for i in range(start, end)], embeddings=corpus[start:end].tolist())
+    build_seconds = time.perf_counter() - started
+
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        result = collection.query(query_embeddings=[query.tolist()], n_results=k, include=[])
+        latencies.append((time.perf_counter() - started) * 1000)
+        hits += len({int(i) for i in result["ids"][0]} & expected)
+
+    client.delete_collection(name)
+    return {
+        "build_s": build_seconds,
+        "recall": hits / (k * len(queries)),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collection", default="documents")
+    parser.add_argument("--limit", type=int, help="Only use the first N stored chunks")
+    parser.add_argument("--queries", type=int, default=100, help="Held-out chunks used as queries")
+    parser.add_argument("--queries-file", help="Text file with one question per line to embed as queries")
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument("--m", type=int, nargs="+", default=[16])
+    parser.add_argument("--construction-ef", type=int, nargs="+", default=[100])
+    parser.add_argument("--search-ef", type=int, nargs="+", default=[10, 32, 64, 128])
+    args = parser.parse_args()
+
+    corpus = load_embeddings(args.collection, args.limit)
+    if len(corpus) == 0:
+        print(f"Collection '{args.collection}' has no embeddings")
+        return
+
+    if args.queries_file:
+        queries = embed_questions(args.queries_file)
+    else:
+        rng = np.random.default_rng(0)
+        held_out = rng.choice(len(corpus), size=min(args.queries, len(corpus) // 2), replace=False)
+        queries = corpus[held_out]
+        corpus = np.delete(corpus, held_out, axis=0)
+
+    truth = exact_neighbours(corpus, queries, args.k)
+    print(f"{len(corpus)} chunks, {len(queries)} queries, k={args.k}\n")
+    print(f"{'M':>4} {'constr_ef':>9} {'search_ef':>9} {'build_s':>8} {'recall':>7} {'p50_ms':>7} {'p99_ms':>7}")
+    for m, construction_ef, search_ef in itertools.product(args.m, args.construction_ef, args.search_ef):
+        stats = run_setting(corpus, queries, truth, args.k, m, construction_ef, search_ef)
+        print(
+            f"{m:>4} {construction_ef:>9} {search_ef:>9} {stats['build_s']:>8.1f} "
+            f"{stats['recall']:>7.3f} {stats['p50_ms']:>7.2f} {stats['p99_ms']:>7.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
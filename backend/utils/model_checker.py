@@ -1,21 +1,57 @@
 """
 Utility script to check model availability and test basic functionality.
 This script helps verify API keys and model access before running the main application.
+
+It can also profile models: time-to-first-token, generation speed and error
+rate over a prompt set, against Gemini or the local stub server
+(utils/stub_llm_server.py).
+
+Run from the backend directory:
+    python -m utils.model_checker
+    python -m utils.model_checker --profile gemini-1.5-flash gemini-1.5-pro --runs 5
+    python -m utils.model_checker --stub-url http://localhost:8090 --profile stub-fast stub-strong
 """
 
+import argparse
 import os
-from typing import List, Dict, Any
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
 import google.generativeai as genai
+import numpy as np
 from langchain_google_genai import GoogleGenerativeAI
 
+from services.stub_llm import StubLLM
+
 # Load environment variables
 load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
+# Rough output token estimate; the same for every model so rates are comparable
+CHARS_PER_TOKEN = 4
+
+DEFAULT_PROMPTS = [
+    "Say hello and introduce yourself briefly.",
+    "Explain what BGP route flapping is and how to detect it.",
+    "Summarize the difference between OSPF areas and BGP autonomous systems in three sentences.",
+    "List five common causes of packet loss on a WAN link.",
+    "Write a short runbook entry for restarting a stuck DNS resolver.",
+]
+
 class ModelChecker:
-    def __init__(self, api_key: str = None):
-        """Initialize the model checker with optional API key."""
+    def __init__(self, api_key: str = None, stub_url: Optional[str] = None):
+        """Initialize the model checker with optional API key.
+        
+        Args:
+            api_key: Google API key (defaults to GOOGLE_API_KEY)
+            stub_url: Base URL of a stub LLM server; when set, models are
+                served by the stub and no API key is needed
+        """
+        self.stub_url = stub_url
+        if stub_url:
+            return
+        
         self.api_key = api_key or GOOGLE_API_KEY
         if not self.api_key:
             raise ValueError("No API key provided. Set GOOGLE_API_KEY in .env file or pass it directly.")
@@ -40,14 +76,20 @@ class ModelChecker:
             print(f"Error listing models: {str(e)}")
             return []
 
+    def _client(self, model_name: str):
+        """Create a LangChain client for a model."""
+        if self.stub_url:
+            return StubLLM(model=model_name, base_url=self.stub_url)
+        return GoogleGenerativeAI(
+            model=model_name,
+            google_api_key=self.api_key,
+            temperature=0.7
+        )
+
     def test_model(self, model_name: str = "gemini-1.5-pro") -> Dict[str, Any]:
         """Test a specific model with a simple prompt."""
         try:
-            model = GoogleGenerativeAI(
-                model=model_name,
-                google_api_key=self.api_key,
-                temperature=0.7
-            )
+            model = self._client(model_name)
             
             response = model.invoke("Say hello and introduce yourself briefly.")
             
@@ -63,8 +105,111 @@ class ModelChecker:
                 "error": str(e)
             }
 
+    def profile_model(
+        self,
+        model_name: str,
+        prompts: List[str] = DEFAULT_PROMPTS,
+        runs: int = 3,
+        concurrency: int = 1
+    ) -> Dict[str, Any]:
+        """Measure latency, generation speed and error rate of a model.
+        
+        Every prompt is streamed `runs` times. Time-to-first-token is the
+        delay until the first streamed chunk; tokens/sec is the estimated
+        output tokens over the time after the first chunk.
+        
+        Args:
+            model_name: Model to profile
+            prompts: Prompts to send
+            runs: Times each prompt is sent
+            concurrency: Requests in flight at once
+            
+        Returns:
+            Dict with request and error counts, error rate and latency percentiles
+        """
+        model = self._client(model_name)
+        
+        def measure(prompt: str) -> Optional[Dict[str, float]]:
+            started = time.perf_counter()
+            first_token_at = None
+            chars = 0
+            try:
+                for chunk in model.stream(prompt):
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    chars += len(chunk)
+            except Exception as e:
+                print(f"  {model_name} error: {str(e)[:120]}")
+                return None
+            finished = time.perf_counter()
+            first_token_at = first_token_at or finished
+            generation_seconds = finished - first_token_at
+            tokens = chars / CHARS_PER_TOKEN
+            return {
+                "ttft": first_token_at - started,
+                "total": finished - started,
+                "tokens_per_second": tokens / generation_seconds if generation_seconds > 0 else float("nan")
+            }
+        
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(measure, [prompt for _ in range(runs) for prompt in prompts]))
+        
+        succeeded = [r for r in results if r is not None]
+        profile = {
+            "model": model_name,
+            "requests": len(results),
+            "errors": len(results) - len(succeeded),
+            "error_rate": (len(results) - len(succeeded)) / len(results) if results else 0.0
+        }
+        if succeeded:
+            ttft = np.array([r["ttft"] for r in succeeded])
+            total = np.array([r["total"] for r in succeeded])
+            rates = np.array([r["tokens_per_second"] for r in succeeded])
+            profile.update({
+                "ttft_p50": float(np.percentile(ttft, 50)),
+                "ttft_p95": float(np.percentile(ttft, 95)),
+                "total_p50": float(np.percentile(total, 50)),
+                "total_p95": float(np.percentile(total, 95)),
+                "tokens_per_second_p50": float(np.nanpercentile(rates, 50)) if not np.isnan(rates).all() else float("nan")
+            })
+        return profile
+
+def print_profiles(profiles: List[Dict[str, Any]]):
+    """Print model profiles as a table."""
+    print(f"\n{'model':<28} {'reqs':>5} {'err%':>6} {'ttft_p50':>9} {'ttft_p95':>9} "
+          f"{'total_p50':>10} {'total_p95':>10} {'tok/s':>7}")
+    for p in profiles:
+        if "ttft_p50" not in p:
+            print(f"{p['model']:<28} {p['requests']:>5} {p['error_rate']:>6.1%}  (all requests failed)")
+            continue
+        print(
+            f"{p['model']:<28} {p['requests']:>5} {p['error_rate']:>6.1%} {p['ttft_p50']:>9.2f} {p['ttft_p95']:>9.2f} "
+            f"{p['total_p50']:>10.2f} {p['total_p95']:>10.2f} {p['tokens_per_second_p50']:>7.0f}"
+        )
+
 def main():
-    """Main function to run model availability checks."""
+    """Main function to run model availability checks, or profile models."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", nargs="+", metavar="MODEL", help="Profile these models instead of checking availability")
+    parser.add_argument("--prompts", help="File with one prompt per line (default: built-in set)")
+    parser.add_argument("--runs", type=int, default=3, help="Times each prompt is sent per model")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--stub-url", help="Use the stub LLM server at this URL instead of Gemini")
+    args = parser.parse_args()
+
+    if args.profile:
+        checker = ModelChecker(stub_url=args.stub_url)
+        prompts = DEFAULT_PROMPTS
+        if args.prompts:
+            with open(args.prompts) as f:
+                prompts = [line.strip() for line in f if line.strip()]
+        profiles = []
+        for model_name in args.profile:
+            print(f"Profiling {model_name} ({len(prompts)} prompts x {args.runs} runs)...")
+            profiles.append(checker.profile_model(model_name, prompts, args.runs, args.concurrency))
+        print_profiles(profiles)
+        return
+
     try:
         checker = ModelChecker()
         
@@ -0,0 +1,91 @@
+"""
+Summarize the query log and cluster frequent questions.
+
+Reads the query log (see services/query_log.py; chat servers write it with
+QUERY_LOG_ENABLED=true) and prints request counts,
+the answer-cache hit rate, retrieval and LLM latency percentiles, and the
+most frequent questions grouped by embedding similarity, with their
+latency and the documents they hit. Questions are embedded with the
+embedding model, so this takes a few seconds per thousand distinct
+questions.
+
+With --prewarm, it then answers the top clusters into the answer cache for
+the current knowledge-base version, as chat servers do after each change.
+That calls the LLM; set LLM_PROVIDER=stub to try it without an API key.
+
+Run from the backend directory:
+    python -m utils.query_analytics --days 7 --top 20
+    python -m utils.query_analytics --prewarm
+"""
+
+import argparse
+import time
+from collections import Counter
+
+import numpy as np
+import orjson
+
+from config.database import init_db
+from config.settings import ANSWER_PREWARM_WINDOW_DAYS, QUERY_CLUSTER_SIMILARITY, QUERY_LOG_DIR
+from services.embedding_scheduler import get_embedding_scheduler
+from services.query_log import cluster_questions, read_query_log
+
+
+def percentiles(values):
+    if not values:
+        return "-"
+    p50, p95 = np.percentile(values, [50, 95])
+    return f"p50 {p50:.0f} ms, p95 {p95:.0f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=float, default=ANSWER_PREWARM_WINDOW_DAYS, help="Only read the last N days")
+    parser.add_argument("--top", type=int, default=20, help="Clusters to print")
+    parser.add_argument("--similarity", type=float, default=QUERY_CLUSTER_SIMILARITY, help="Cosine similarity to join a cluster")
+    parser.add_argument("--json", action="store_true", help="Print the clusters as JSON")
+    parser.add_argument("--prewarm", action="store_true", help="Answer the top clusters into the answer cache")
+    args = parser.parse_args()
+
+    entries = list(read_query_log(QUERY_LOG_DIR, since=time.time() - args.days * 86400))
+    answered = [entry for entry in entries if entry.get("cache") != "hit" and entry.get("status") == "ok"]
+    statuses = Counter(entry.get("status") for entry in entries)
+    caches = Counter(entry.get("cache") for entry in entries)
+    print(f"{len(entries)} questions in the last {args.days:g} days from {QUERY_LOG_DIR}")
+    if not entries:
+        return
+    print(f"  status: {dict(statuses)}")
+    print(f"  answer cache: {dict(caches)} ({caches['hit'] / len(entries):.1%} hits)")
+    print(f"  retrieval: {percentiles([entry['retrieval_ms'] for entry in answered])}")
+    print(f"  LLM: {percentiles([entry['llm_ms'] for entry in answered])}")
+
+    started = time.perf_counter()
+    clusters = cluster_questions(entries, get_embedding_scheduler(), similarity=args.similarity)
+    print(f"  {len(clusters)} question clusters (clustered in {time.perf_counter() - started:.1f}s)\n")
+
+    if args.json:
+        print(orjson.dumps(clusters[:args.top], option=orjson.OPT_INDENT_2).decode())
+    else:
+        print(f"{'count':>6} {'phrasings':>9} {'hits':>6} {'p95 ms':>8}  question")
+        for cluster in clusters[:args.top]:
+            p95 = f"{cluster['p95_ms']:.0f}" if cluster["p95_ms"] is not None else "-"
+            print(
+                f"{cluster['count']:>6} {len(cluster['phrasings']):>9} {cluster['cache_hits']:>6} {p95:>8}  "
+                f"{cluster['question'][:100]}"
+            )
+
+    if args.prewarm:
+        # Imported here: the chat service connects to the LLM on creation
+        from services.answer_cache import AnswerPrewarmer
+        from services.chat import ChatService
+
+        init_db()
+        chat_service = ChatService()
+        if chat_service.answer_cache is None:
+            parser.error("ANSWER_CACHE_ENABLED is off; there is nothing to pre-warm")
+        print()
+        AnswerPrewarmer(chat_service).prewarm()
+
+
+if __name__ == "__main__":
+    main()
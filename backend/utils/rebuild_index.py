@@ -0,0 +1,64 @@
+"""
+Rebuild a Chroma collection with new HNSW parameters.
+
+Copies the stored embeddings into a freshly created collection (no
+re-embedding), verifies the copy and swaps it in by renaming. The original is
+kept as `<name>_backup_<timestamp>` unless --drop-backup is given. Stop
+ingestion while this runs and restart the API afterwards so it reopens the
+new collection.
+
+Run from the backend directory:
+    python -m utils.rebuild_index --m 32 --construction-ef 200 --search-ef 64
+"""
+
+import argparse
+
+import chromadb
+
+from config.settings import VECTORDB_DIR
+from services.vector_index import ChromaVectorIndex, get_hnsw_config
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collection", default="documents")
+    parser.add_argument("--m", type=int, help="hnsw:M (graph degree)")
+    parser.add_argument("--construction-ef", type=int, help="hnsw:construction_ef")
+    parser.add_argument("--search-ef", type=int, help="hnsw:search_ef")
+    parser.add_argument("--batch-size", type=int, help="hnsw:batch_size")
+    parser.add_argument("--sync-threshold", type=int, help="hnsw:sync_threshold")
+    parser.add_argument("--drop-backup", action="store_true", help="Delete the original collection after the swap")
+    parser.add_argument("--dry-run", action="store_true", help="Only show current and target parameters")
+    args = parser.parse_args()
+
+    metadata = get_hnsw_config(args.collection)
+    overrides = {
+        "hnsw:M": args.m,
+        "hnsw:construction_ef": args.construction_ef,
+        "hnsw:search_ef": args.search_ef,
+        "hnsw:batch_size": args.batch_size,
+        "hnsw:sync_threshold": args.sync_threshold,
+    }
+    metadata.update({key: value for key, value in overrides.items() if value is not None})
+
+    client = chromadb.PersistentClient(path=str(VECTORDB_DIR))
+    if args.collection not in [c.name if hasattr(c, "name") else c for c in client.list_collections()]:
+        print(f"Collection '{args.collection}' does not exist")
+        return
+
+    index = ChromaVectorIndex(client, args.collection)
+    print(f"Current parameters: {index.collection.metadata}")
+    print(f"Target parameters:  {metadata}")
+    print(f"Chunks: {index.count()}")
+    if args.dry_run:
+        return
+
+    backup_name = index.rebuild(metadata, keep_backup=not args.drop_backup)
+    print(f"✓ Rebuilt '{args.collection}' with {index.collection.metadata}")
+    if backup_name:
+        print(f"Original kept as '{backup_name}'. Delete it with client.delete_collection once verified.")
+    print("Restart the API processes so they reopen the rebuilt collection.")
+
+
+if __name__ == "__main__":
+    main()
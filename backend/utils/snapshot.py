@@ -0,0 +1,50 @@
+"""
+Export or import a knowledge-base snapshot.
+
+A snapshot holds chunk texts, metadata, embeddings and document rows in one
+compressed Parquet file, so a new node can be bootstrapped without
+re-ingesting sources or calling the embedding model.
+
+Run from the backend directory:
+    python -m utils.snapshot export snapshots/kb.parquet
+    python -m utils.snapshot import snapshots/kb.parquet
+"""
+
+import argparse
+
+from services.snapshot import SnapshotService
+from services.vector_index import collection_names, create_vector_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Write a snapshot of this instance")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--float16", action="store_true", help="Store embeddings as float16")
+
+    import_parser = subparsers.add_parser("import", help="Load a snapshot into this instance")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--merge", action="store_true", help="Allow importing into a non-empty instance")
+    args = parser.parse_args()
+
+    service = SnapshotService({name: create_vector_index(name) for name in collection_names()})
+    if args.command == "export":
+        stats = service.export_snapshot(args.path, "float16" if args.float16 else "float32")
+        print(
+            f"✓ Exported {stats['chunks']} chunks, {stats['parents']} parent sections, {stats['signatures']} near-duplicate "
+            f"records and {stats['documents']} documents "
+            f"to {stats['path']} ({stats['bytes'] / 2**20:.1f} MB) in {stats['seconds']:.1f}s"
+        )
+    else:
+        stats = service.import_snapshot(args.path, merge=args.merge)
+        print(
+            f"✓ Imported {stats['chunks']} chunks, {stats['parents']} parent sections, {stats['signatures']} near-duplicate "
+            f"records and {stats['documents']} documents "
+            f"in {stats['seconds']:.1f}s ({stats['chunks'] / max(stats['seconds'], 1e-9):.0f} chunks/s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Reconcile uploaded files, the documents table and the vector index.
+
+Removes chunks of deleted documents, uploaded files no document references
+(including per-document directories from the old upload layout) and
+abandoned temporary uploads, then reports the space reclaimed. Files newer
+than STORAGE_GC_GRACE_SECONDS are skipped. Ingestion in another process is
+not visible here, so run this while ingestion is stopped, or call
+POST /admin/storage/gc on the writer instead.
+
+Run from the backend directory:
+    python -m utils.storage_gc --dry-run
+    python -m utils.storage_gc
+"""
+
+import argparse
+
+from config.database import init_db
+from config.settings import STORAGE_GC_GRACE_SECONDS
+from services.storage import BlobStore, StorageGarbageCollector
+from services.vector_index import collection_names, create_vector_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be removed")
+    parser.add_argument(
+        "--grace-seconds", type=float, default=STORAGE_GC_GRACE_SECONDS,
+        help="Skip files modified more recently than this"
+    )
+    args = parser.parse_args()
+
+    init_db()
+    indexes = {name: create_vector_index(name) for name in collection_names()}
+    collector = StorageGarbageCollector(indexes, BlobStore())
+    stats = collector.collect(dry_run=args.dry_run, grace_seconds=args.grace_seconds)
+    verb = "Would remove" if args.dry_run else "Removed"
+    print(
+        f"✓ {verb} {stats['orphan_chunks_removed']} orphaned chunks, {stats['orphan_parents_removed']} parent sections, "
+        f"{stats['orphan_signatures_removed']} near-duplicate records and {stats['files_removed']} files, "
+        f"reclaiming {stats['bytes_reclaimed'] / 2**20:.2f} MB in {stats['seconds']:.1f}s"
+    )
+    if stats["documents_without_chunks"]:
+        print(f"⚠ {len(stats['documents_without_chunks'])} documents have no chunks: {stats['documents_without_chunks']}")
+
+
+if __name__ == "__main__":
+    main()
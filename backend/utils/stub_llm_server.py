@@ -0,0 +1,116 @@
+"""
+Local stub LLM server for load tests, benchmarks and model profiling.
+
+Streams canned text with a configurable time-to-first-token, token rate and
+error rate per model name, so latency behaviour (routing, hedging,
+timeouts) can be exercised without a provider API key. Prompts listing
+numbered passages ("[1] ...") get "<n>: <question>?" lines back, so
+question generation (services/question_index.py) can be exercised too. Point the app at it
+with LLM_PROVIDER=stub and LLM_STUB_URL, or profile it with
+`python -m utils.model_checker --stub-url ...`.
+
+Run from the backend directory:
+    python -m utils.stub_llm_server --port 8090 \\
+        --model stub-fast=150,200,0.01 --model stub-strong=600,60,0.02
+"""
+
+import argparse
+import asyncio
+import random
+import re
+from typing import Dict
+
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+WORDS = (
+    "the network path between the routers is configured with redundant links and "
+    "traffic fails over when the primary interface goes down so check the logs"
+).split()
+
+PASSAGE_NUMBER = re.compile(r"^\s*\[(\d+)\]", re.MULTILINE)
+
+# model name -> (time to first token in ms, tokens per second, error rate)
+DEFAULT_PROFILES = {
+    "stub-fast": (150, 200, 0.01),
+    "stub-strong": (600, 60, 0.02),
+}
+
+
+class GenerateRequest(BaseModel):
+    model: str
+    prompt: str
+    max_tokens: int = 200
+    stream: bool = False
+
+
+def create_app(profiles: Dict[str, tuple]) -> FastAPI:
+    app = FastAPI(title="Stub LLM")
+
+    @app.post("/v1/generate")
+    async def generate(request: GenerateRequest):
+        ttft_ms, tokens_per_second, error_rate = profiles.get(request.model, DEFAULT_PROFILES["stub-fast"])
+        if random.random() < error_rate:
+            raise HTTPException(status_code=503, detail="Stub model overloaded")
+
+        # Log-normal jitter gives the latency a realistic tail
+        first_token_delay = ttft_ms / 1000 * random.lognormvariate(0, 0.35)
+        tokens = completion_tokens(request.prompt, request.max_tokens)
+
+        if not request.stream:
+            await asyncio.sleep(first_token_delay + len(tokens) / tokens_per_second)
+            return {"model": request.model, "text": "".join(tokens)}
+
+        async def stream():
+            await asyncio.sleep(first_token_delay)
+            for token in tokens:
+                yield token
+                await asyncio.sleep(1 / tokens_per_second)
+
+        return StreamingResponse(stream(), media_type="text/plain")
+
+    return app
+
+
+def completion_tokens(prompt: str, max_tokens: int):
+    """Canned completion as a list of tokens (words with their trailing space or newline)."""
+    passages = PASSAGE_NUMBER.findall(prompt)
+    if not passages:
+        return [WORDS[i % len(WORDS)] + " " for i in range(max_tokens)]
+
+    # Question generation: two questions per numbered passage
+    tokens = []
+    for number in passages:
+        for question in range(2):
+            words = [f"{number}:", "what", "about"] + [WORDS[(int(number) + question + i) % len(WORDS)] for i in range(5)]
+            tokens.extend(word + " " for word in words[:-1])
+            tokens.append(words[-1] + "?\n")
+    return tokens[:max_tokens]
+
+
+def parse_profile(value: str):
+    name, numbers = value.split("=", 1)
+    ttft_ms, tokens_per_second, error_rate = (float(n) for n in numbers.split(","))
+    return name, (ttft_ms, tokens_per_second, error_rate)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument(
+        "--model", action="append", type=parse_profile, default=[],
+        help="NAME=TTFT_MS,TOKENS_PER_S,ERROR_RATE (repeatable)"
+    )
+    args = parser.parse_args()
+
+    profiles = {**DEFAULT_PROFILES, **dict(args.model)}
+    for name, (ttft_ms, tokens_per_second, error_rate) in profiles.items():
+        print(f"{name}: ttft {ttft_ms:.0f}ms, {tokens_per_second:.0f} tokens/s, {error_rate:.1%} errors")
+    uvicorn.run(create_app(profiles), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()